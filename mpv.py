@@ -29,10 +29,21 @@ import sys
 from warnings import warn
 from functools import partial, wraps
 from contextlib import contextmanager
-from concurrent.futures import Future, InvalidStateError
+from concurrent.futures import Future, InvalidStateError, CancelledError
+import concurrent.futures
+import asyncio
+import inspect
+import itertools
+import math
 import collections
 import re
 import traceback
+import time
+import tempfile
+import pickle
+import mmap
+
+from mpv_ipc import ShutdownError, PropertyUnavailableError, RemoteMPVBase, IPCMPV
 
 if os.name == 'nt':
     # Note: mpv-2.dll with API version 2 corresponds to mpv v0.35.0. Most things should work with the fallback, too.
@@ -74,9 +85,6 @@ else:
     fs_enc = sys.getfilesystemencoding()
 
 
-class ShutdownError(SystemError):
-    pass
-
 class EventOverflowError(SystemError):
     pass
 
@@ -86,9 +94,6 @@ class MpvHandle(c_void_p):
 class MpvRenderCtxHandle(c_void_p):
     pass
 
-class PropertyUnavailableError(AttributeError):
-    pass
-
 class ErrorCode(object):
     """For documentation on these, see mpv's libmpv/client.h."""
     SUCCESS                 = 0
@@ -187,6 +192,12 @@ class MpvRenderFrameInfo(Structure):
     _fields_ = [('flags', c_int64),
             ('target_time', c_int64)]
 
+    # flags, see libmpv/render.h
+    PRESENT     = 1<<0
+    REDRAW      = 1<<1
+    REPEAT      = 1<<2
+    BLOCK_VSYNC = 1<<3
+
     def as_dict(self):
         return {'flags': self.flags,
                 'target_time': self.target_time}
@@ -214,6 +225,9 @@ class MpvOpenGLDRMParamsV2(Structure):
         self.fd, self.render_fd = fd, render_fd
 
 
+class MpvSWSize(Structure):
+    _fields_ = [('w', c_int), ('h', c_int)]
+
 class MpvRenderParam(Structure):
     _fields_ = [('type_id', c_int),
                 ('data', c_void_p)]
@@ -236,7 +250,11 @@ class MpvRenderParam(Structure):
             "skip_rendering"           :(13, bool),
             "drm_display"              :(14, MpvOpenGLDRMParams),
             "drm_draw_surface_size"    :(15, MpvOpenGLDRMDrawSurfaceSize),
-            "drm_display_v2"           :(16, MpvOpenGLDRMParamsV2)}
+            "drm_display_v2"           :(16, MpvOpenGLDRMParamsV2),
+            "sw_size"                  :(17, MpvSWSize),
+            "sw_format"                :(18, str),
+            "sw_stride"                :(19, c_size_t),
+            "sw_pointer"               :(20, c_void_p)}
 
     def __init__(self, name, value=None):
         if name not in self.TYPES:
@@ -257,6 +275,19 @@ class MpvRenderParam(Structure):
         elif cons is c_void_p:
             self.value = value
             self.data = cast(self.value, c_void_p)
+        elif cons is int:
+            self.value = c_int(value)
+            self.data = cast(pointer(self.value), c_void_p)
+        elif cons is c_size_t:
+            self.value = c_size_t(value)
+            self.data = cast(pointer(self.value), c_void_p)
+        elif value is None:
+            # Empty struct, e.g. for mpv_render_context_get_info
+            self.value = cons()
+            self.data = cast(pointer(self.value), c_void_p)
+        elif isinstance(value, (tuple, list)):
+            self.value = cons(*value)
+            self.data = cast(pointer(self.value), c_void_p)
         else:
             self.value = cons(**value)
             self.data = cast(pointer(self.value), c_void_p)
@@ -265,6 +296,47 @@ def kwargs_to_render_param_array(kwargs):
     t = MpvRenderParam * (len(kwargs)+1)
     return t(*kwargs.items(), ('invalid', None))
 
+class MpvRenderParamArray:
+    """Render parameter array that is built once and then re-used for any number of ``MpvRenderContext.render`` calls,
+    avoiding the construction of a new parameter array on every frame. Parameter values can be changed in place:
+
+    params = ctx.prepare_render(opengl_fbo={'w': 1280, 'h': 720, 'fbo': 0}, flip_y=True)
+    while running:
+        params['opengl_fbo'].w, params['opengl_fbo'].h = window_size # change struct fields directly
+        params['flip_y'] = False # or assign new values
+        ctx.render(params)
+
+    Assigning struct- and integer-valued parameters updates the existing ctypes objects without allocating anything.
+    Assigning any other parameter re-builds just that parameter.
+    """
+
+    def __init__(self, **kwargs):
+        self._index = {name: i for i, name in enumerate(kwargs)}
+        self._params = [MpvRenderParam(name, value) for name, value in kwargs.items()]
+        self._array = (MpvRenderParam * (len(kwargs)+1))(*self._params, MpvRenderParam('invalid'))
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        """Return the ctypes object holding the parameter's value, e.g. an MpvOpenGLFBO struct or a c_int."""
+        return self._params[self._index[name]].value
+
+    def __setitem__(self, name, value):
+        i = self._index[name]
+        obj = self._params[i].value
+        if isinstance(obj, (c_int, c_size_t)):
+            obj.value = int(value)
+        elif isinstance(obj, Structure) and isinstance(value, dict):
+            for key, val in value.items():
+                setattr(obj, key, val)
+        elif isinstance(obj, Structure) and isinstance(value, (tuple, list)):
+            for (key, *_), val in zip(obj._fields_, value):
+                setattr(obj, key, val)
+        else:
+            self._params[i] = param = MpvRenderParam(name, value)
+            self._array[i] = param
+
 class MpvFormat(c_int):
     NONE        = 0
     STRING      = 1
@@ -344,7 +416,7 @@ class MpvByteArray(Structure):
         self.size = len(value)
 
     def bytes_value(self):
-        return cast(self.data, POINTER(c_char))[:self.size]
+        return string_at(self.data, self.size)
 
 class MpvNode(Structure):
     def node_value(self, decoder=identity_decoder):
@@ -437,7 +509,13 @@ class MpvEventProperty(Structure):
 
     @property
     def value(self):
-        return MpvNode.node_cast_value(self.data, self.format.value, decoder=lazy_decoder)
+        fmt = self.format.value
+        if fmt in (MpvFormat.NONE, MpvFormat.NODE):
+            return MpvNode.node_cast_value(self.data, fmt, decoder=lazy_decoder)
+        # For all other formats, data points to the value instead of containing it.
+        if not self.data.node:
+            return None
+        return MpvNode.node_cast_value(cast(self.data.node, POINTER(MpvNodeUnion)).contents, fmt, decoder=lazy_decoder)
 
 class MpvEventLogMessage(Structure):
     _fields_ = [('_prefix', c_char_p),
@@ -773,46 +851,682 @@ class GeneratorStream:
         self._read_iter = iter([]) # make next read() call return EOF
 
 
+async def _await(awaitable):
+    return await awaitable
+
+async def _anext_or_eof(async_iter):
+    try:
+        return await async_iter.__anext__()
+    except StopAsyncIteration:
+        return b''
+
+class _AsyncStreamBase:
+    """Run coroutines of an async stream source on a user-provided asyncio event loop from libmpv's stream callback
+    thread. A read that takes longer than timeout seconds is cancelled and surfaces as a read error to libmpv. cancel()
+    cancels the coroutine that is currently running.
+    """
+
+    def __init__(self, loop, timeout=None):
+        self._loop = loop
+        self._timeout = timeout
+        self._pending = None
+
+    def _run(self, awaitable):
+        """Run awaitable on the event loop and return its result, or None if it was cancelled."""
+        fut = self._pending = asyncio.run_coroutine_threadsafe(_await(awaitable), self._loop)
+        try:
+            return fut.result(self._timeout)
+        except concurrent.futures.TimeoutError:
+            # On python 3.11+, this is the builtin TimeoutError, which the coroutine itself may have raised.
+            if fut.done():
+                raise
+            fut.cancel()
+            raise TimeoutError(f'Async stream operation timed out after {self._timeout}s')
+        except CancelledError:
+            return None
+        finally:
+            self._pending = None
+
+    def cancel(self):
+        fut = self._pending
+        if fut is not None:
+            fut.cancel()
+
+
+class AsyncGeneratorStream(_AsyncStreamBase):
+    """Async equivalent of GeneratorStream. The async generator returned by generator_fun runs on the given asyncio
+    event loop. Seeking is not supported.
+    """
+
+    def __init__(self, generator_fun, loop, size=None, timeout=None):
+        super().__init__(loop, timeout)
+        self._generator_fun = generator_fun
+        self._read_iter = None
+        self._read_chunk = b''
+        self._eof = False
+        self.size = size
+
+    def _close_iter(self):
+        if self._read_iter is not None:
+            self._read_iter, read_iter = None, self._read_iter
+            asyncio.run_coroutine_threadsafe(read_iter.aclose(), self._loop)
+
+    def seek(self, offset):
+        self._close_iter()
+        self._read_iter = self._generator_fun()
+        self._read_chunk = b''
+        self._eof = False
+        return 0 # We only support seeking to the first byte, like GeneratorStream
+
+    def read(self, size):
+        if not self._read_chunk:
+            if self._eof:
+                return b''
+            if self._read_iter is None:
+                self.seek(0)
+            self._read_chunk = self._run(_anext_or_eof(self._read_iter)) or b''
+        rv, self._read_chunk = self._read_chunk[:size], self._read_chunk[size:]
+        return rv
+
+    def close(self):
+        self._eof = True
+        self._close_iter()
+
+    def cancel(self):
+        self._eof = True # make next read() call return EOF
+        super().cancel()
+        self._close_iter()
+
+
+class AsyncStream(_AsyncStreamBase):
+    """Adapt a stream object whose read, seek and close methods are coroutine functions (see
+    ``MPV.register_stream_protocol`` for the stream protocol) to libmpv's synchronous stream callbacks. Plain methods
+    are called directly.
+    """
+
+    def __init__(self, stream, loop, timeout=None):
+        super().__init__(loop, timeout)
+        self._stream = stream
+        # register_stream_protocol checks for optional methods using hasattr
+        if hasattr(stream, 'seek'):
+            self.seek = self._seek
+        if hasattr(stream, 'close'):
+            self.close = partial(self._call, 'close')
+
+    def _call(self, name, *args):
+        rv = getattr(self._stream, name)(*args)
+        if inspect.isawaitable(rv):
+            rv = self._run(rv)
+        return rv
+
+    @property
+    def size(self):
+        return getattr(self._stream, 'size', None)
+
+    def read(self, size):
+        return self._call('read', size) or b''
+
+    def _seek(self, offset):
+        rv = self._call('seek', offset)
+        return ErrorCode.GENERIC if rv is None else rv
+
+    def cancel(self):
+        super().cancel()
+        if hasattr(self._stream, 'cancel'):
+            self._call('cancel')
+
+    @staticmethod
+    def is_async(stream):
+        return any(inspect.iscoroutinefunction(getattr(stream, name, None)) for name in ('read', 'seek', 'close'))
+
+
+class MmapStream:
+    """Stream a file, or a byte range within a file, to mpv straight from a read-only memory mapping. Reads are served
+    through ``readinto`` as a single copy from the mapping into libmpv's buffer, and seeks are O(1).
+
+    path_or_fd is either a path or an open file descriptor. The file descriptor is not closed by this object. offset
+    and length select a sub-range of the file, e.g. to play an asset embedded in a larger container file. length
+    defaults to the rest of the file after offset.
+    """
+
+    def __init__(self, path_or_fd, offset=0, length=None):
+        if isinstance(path_or_fd, int):
+            fd, own_fd = path_or_fd, False
+        else:
+            fd, own_fd = os.open(path_or_fd, os.O_RDONLY | getattr(os, 'O_BINARY', 0)), True
+
+        try:
+            file_size = os.fstat(fd).st_size
+            if length is None:
+                length = file_size - offset
+            if offset < 0 or length < 0 or offset + length > file_size:
+                raise ValueError(f'Byte range {offset}+{length} is outside of file of size {file_size}')
+
+            self._map = None
+            if length > 0:
+                # mmap offsets must be a multiple of the allocation granularity
+                map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+                self._map = mmap.mmap(fd, offset + length - map_offset, access=mmap.ACCESS_READ, offset=map_offset)
+                self._view = memoryview(self._map)[offset - map_offset:]
+            else:
+                self._view = memoryview(b'')
+        finally:
+            if own_fd:
+                os.close(fd)
+
+        self.size = length
+        self._pos = 0
+
+    def readinto(self, buf):
+        n = max(0, min(len(buf), self.size - self._pos))
+        buf[:n] = self._view[self._pos:self._pos+n]
+        self._pos += n
+        return n
+
+    def read(self, size):
+        rv = bytes(self._view[self._pos:self._pos+size])
+        self._pos += len(rv)
+        return rv
+
+    def seek(self, offset):
+        self._pos = max(0, min(offset, self.size))
+        return self._pos
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+
+
+class StreamOpenStats:
+    """Open latency and failure counters of a custom stream protocol. See ``MPV.stream_open_stats``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opens = self.failures = self.timeouts = self.prefetch_hits = 0
+        self.total_latency = self.max_latency = 0.0
+
+    def record(self, start, prefetched=False, failed=False, timeout=False):
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.opens += 1
+            self.prefetch_hits += prefetched
+            self.failures += failed or timeout
+            self.timeouts += timeout
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        with self._lock:
+            return {'opens': self.opens,
+                    'failures': self.failures,
+                    'timeouts': self.timeouts,
+                    'prefetch_hits': self.prefetch_hits,
+                    'mean_latency': self.total_latency / self.opens if self.opens else None,
+                    'max_latency': self.max_latency}
+
+class StreamIOStats:
+    """Per-URI counters and latency histograms of the calls libmpv makes into a custom protocol stream object. See
+    ``MPV.register_stream_protocol``'s collect_stats argument.
+    """
+
+    KINDS = ('open', 'read', 'seek', 'size', 'cancel', 'close')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = dict.fromkeys(self.KINDS, 0)
+        self.time = dict.fromkeys(self.KINDS, 0.0)
+        self.latency_histogram = {kind: collections.Counter() for kind in self.KINDS}
+        self.read_size_histogram = collections.Counter()
+        self.bytes_read = self.eof_reads = self.read_errors = 0
+
+    @staticmethod
+    def _bucket(value):
+        """Round up to the next power of two for a log2 histogram"""
+        return 1 << max(0, int(value)-1).bit_length() if value > 0 else 0
+
+    def record(self, kind, latency, bufsize=None, result=None):
+        with self._lock:
+            self.calls[kind] += 1
+            self.time[kind] += latency
+            self.latency_histogram[kind][self._bucket(latency * 1e6)] += 1
+            if kind == 'read':
+                self.read_size_histogram[self._bucket(bufsize)] += 1
+                if result > 0:
+                    self.bytes_read += result
+                elif result == 0:
+                    self.eof_reads += 1
+                else:
+                    self.read_errors += 1
+
+    def instrument(self, kind, fn):
+        """Wrap a libmpv stream callback function, recording call count and latency."""
+        def wrapper(*args):
+            start = time.perf_counter()
+            rv = fn(*args)
+            if kind == 'read':
+                self.record(kind, time.perf_counter() - start, args[2], rv)
+            else:
+                self.record(kind, time.perf_counter() - start)
+            return rv
+        return wrapper
+
+    def as_dict(self):
+        """Return a snapshot of all counters. Times are in seconds. Latency histograms map the upper bound of each
+        bucket in microseconds, and the read size histogram maps the upper bound of each bucket in bytes, to the number
+        of calls in that bucket. Buckets are powers of two."""
+        with self._lock:
+            return {'calls': dict(self.calls),
+                    'time': dict(self.time),
+                    'bytes_read': self.bytes_read,
+                    'eof_reads': self.eof_reads,
+                    'read_errors': self.read_errors,
+                    'read_size_histogram': dict(sorted(self.read_size_histogram.items())),
+                    'latency_histogram': {kind: dict(sorted(hist.items()))
+                        for kind, hist in self.latency_histogram.items()}}
+
+def _close_abandoned_stream(fut):
+    if not fut.cancelled() and fut.exception() is None and hasattr(fut.result(), 'close'):
+        fut.result().close()
+
+
+class StreamBlockCache:
+    """LRU cache of fixed-size stream blocks keyed by (URI, block index). A single instance can be shared between any
+    number of stream protocols and MPV instances, in which case ``max_bytes`` is a global budget across all of them.
+
+    Pass an instance as the ``cache`` argument of ``MPV.register_stream_protocol`` to enable caching for a protocol.
+    Hit, miss and eviction counters are available through ``stats()``. Hits and misses are counted per block a stream
+    looks up, not per read, so the many small reads mpv makes from a block count once.
+    """
+
+    def __init__(self, block_size=256*1024, max_bytes=64*1024*1024):
+        if block_size <= 0 or max_bytes < block_size:
+            raise ValueError('block_size must be positive and max_bytes must hold at least one block')
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self._blocks = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, uri, index, count=True):
+        with self._lock:
+            block = self._blocks.get((uri, index))
+            if block is None:
+                self.misses += count
+                return None
+            self._blocks.move_to_end((uri, index))
+            self.hits += count
+            return block
+
+    def put(self, uri, index, block):
+        with self._lock:
+            old = self._blocks.pop((uri, index), None)
+            if old is not None:
+                self._size -= len(old)
+            self._blocks[(uri, index)] = block
+            self._size += len(block)
+            while self._size > self.max_bytes:
+                _key, evicted = self._blocks.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, uri=None):
+        """Drop all cached blocks of the given URI, or the whole cache if no URI is given."""
+        with self._lock:
+            if uri is None:
+                self._blocks.clear()
+                self._size = 0
+                return
+            for key in [key for key in self._blocks if key[0] == uri]:
+                self._size -= len(self._blocks.pop(key))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'blocks': len(self._blocks),
+                    'bytes': self._size,
+                    'max_bytes': self.max_bytes}
+
+
+class CachedStream:
+    """Wrap a seekable mpv stream object, serving reads from a shared StreamBlockCache. Blocks missing from the cache
+    are fetched from the wrapped stream in full and inserted. See ``MPV.register_stream_protocol``.
+    """
+
+    def __init__(self, stream, uri, cache):
+        self._stream = stream
+        self._uri = uri
+        self._cache = cache
+        self._pos = 0
+        self._stream_pos = None # current offset of the wrapped stream, None if unknown
+        self._index = None # index of the block last looked up
+
+    @property
+    def size(self):
+        return getattr(self._stream, 'size', None)
+
+    def _fetch(self, index):
+        # Further reads from the block read last are not counted as another hit in the cache statistics.
+        block = self._cache.get(self._uri, index, count=index != self._index)
+        self._index = index
+        if block is not None:
+            return block
+
+        bs = self._cache.block_size
+        start = index * bs
+        if self._stream_pos != start:
+            pos = self._stream.seek(start)
+            if pos < 0:
+                self._stream_pos = None
+                raise ValueError(f'Stream seek to {start} failed with error {pos}')
+            self._stream_pos = pos
+            if self._stream_pos > start:
+                raise ValueError(f'Stream seek to {start} went past the requested offset to {self._stream_pos}')
+
+        # The wrapped stream may have seeked to somewhere before the block start, so skip any leading bytes.
+        lead = start - self._stream_pos
+        chunks, remaining = [], lead + bs
+        while remaining > 0:
+            chunk = self._stream.read(remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            self._stream_pos += len(chunk)
+
+        block = b''.join(chunks)[lead:]
+        if block: # Do not cache the empty "block" past the end of the stream
+            self._cache.put(self._uri, index, block)
+        return block
+
+    def read(self, size):
+        bs = self._cache.block_size
+        index, offx = divmod(self._pos, bs)
+        block = self._fetch(index)
+        rv = block[offx:offx+size]
+        self._pos += len(rv)
+        return rv
+
+    def seek(self, offset):
+        self._pos = offset
+        return offset
+
+    def close(self):
+        if hasattr(self._stream, 'close'):
+            self._stream.close()
+
+    def cancel(self):
+        if hasattr(self._stream, 'cancel'):
+            self._stream.cancel()
+
+
+def _premultiply_to_bgra(src, dst, premultiplied=False, scratch=None):
+    """Convert a numpy uint8 RGBA array of shape (h, w, 4) or RGB array of shape (h, w, 3) into premultiplied BGRA
+    inside the numpy array dst of shape (h, w, 4). scratch is an optional uint16 array of shape (h, w, 3) used for
+    intermediate results."""
+    import numpy as np
+    bgr = src[..., 2::-1]
+    if src.shape[2] == 3:
+        dst[..., :3] = bgr
+        dst[..., 3] = 255
+        return
+    if premultiplied:
+        dst[..., :3] = bgr
+    else:
+        if scratch is None:
+            scratch = np.empty(src.shape[:2] + (3,), dtype=np.uint16)
+        # dst = round(c * a / 255) using (t + (t >> 8)) >> 8 with t = c*a + 128, which is exact for 8-bit values.
+        np.multiply(bgr, src[..., 3:4], out=scratch, dtype=np.uint16)
+        scratch += 128
+        scratch += scratch >> 8
+        np.right_shift(scratch, 8, out=dst[..., :3], casting='unsafe')
+    dst[..., 3] = src[..., 3]
+
+
 class ImageOverlay:
+    """Overlay displaying an image that is passed to mpv through memory (``overlay-add`` with an ``&address`` source).
+    Use ``MPV.create_image_overlay`` to create one.
+
+    The image is double-buffered: each update is written into the buffer mpv is not currently displaying, which is
+    then handed to mpv. For animated overlays, pass numpy arrays instead of PIL images. These are converted into mpv's
+    premultiplied BGRA format with vectorized numpy operations, which is much faster than the PIL path.
+    """
+
     def __init__(self, m, overlay_id, img=None, pos=(0, 0)):
         self.m = m
         self.overlay_id = overlay_id
         self.pos = pos
         self._size = None
+        self._bufs = None
+        self._back = 0
+        self._scratch = None
         if img is not None:
             self.update(img)
 
-    def update(self, img=None, pos=None):
-        from PIL import Image
+    def _back_buffer(self, w, h):
+        if (w, h) != self._size:
+            self._bufs = [create_string_buffer(w*h*4), create_string_buffer(w*h*4)]
+            self._size = (w, h)
+            self._scratch = None
+        return self._bufs[self._back]
+
+    def update(self, img=None, pos=None, premultiplied=False):
+        """Update the overlay's image and/or position. img is either a PIL RGBA image, or a numpy uint8 array of shape
+        (h, w, 4) (RGBA) or (h, w, 3) (RGB). Set premultiplied if the alpha of an RGBA array is already premultiplied
+        to skip the multiplication."""
         if img is not None:
             self.img = img
         img = self.img
 
-        w, h = img.size
-        stride = w*4
-
         if pos is not None:
             self.pos = pos
         x, y = self.pos
 
-        # Pre-multiply alpha channel
-        bg = Image.new('RGBA', (w, h),  (0, 0, 0, 0))
-        out = Image.alpha_composite(bg, img)
+        if hasattr(img, 'shape'): # numpy array
+            import numpy as np
+            h, w, _ = img.shape
+            buf = self._back_buffer(w, h)
+            dst = np.ndarray((h, w, 4), dtype=np.uint8, buffer=buf, strides=(w*4, 4, 1))
+            if self._scratch is None and not premultiplied:
+                self._scratch = np.empty((h, w, 3), dtype=np.uint16)
+            _premultiply_to_bgra(img, dst, premultiplied, self._scratch)
+
+        else:
+            from PIL import Image
+            w, h = img.size
 
-        # Copy image to ctypes buffer
-        if img.size != self._size:
-            self._buf = create_string_buffer(w*h*4)
-            self._size = img.size
+            # Pre-multiply alpha channel
+            bg = Image.new('RGBA', (w, h),  (0, 0, 0, 0))
+            out = Image.alpha_composite(bg, img)
 
-        ctypes.memmove(self._buf, out.tobytes('raw', 'BGRA'), w*h*4)
-        source = '&' + str(addressof(self._buf))
+            # Copy image to ctypes buffer
+            buf = self._back_buffer(w, h)
+            ctypes.memmove(buf, out.tobytes('raw', 'BGRA'), w*h*4)
 
-        self.m.overlay_add(self.overlay_id, x, y, source, 0, 'bgra', w, h, stride)
+        source = '&' + str(addressof(buf))
+        self.m.overlay_add(self.overlay_id, x, y, source, 0, 'bgra', w, h, w*4)
+        self._back ^= 1
 
     def remove(self):
         self.m.remove_overlay(self.overlay_id)
 
 
+def _blend_over(src, dst):
+    """Alpha-blend the premultiplied BGRA numpy array src over the premultiplied BGRA numpy array dst in place."""
+    import numpy as np
+    t = dst * (255 - src[..., 3:4]).astype(np.uint16)
+    t += 128
+    t += t >> 8
+    t >>= 8
+    np.add(src, t, out=dst, casting='unsafe')
+
+
+class OverlayLayer:
+    """Single layer of an OverlayCompositor, created using ``OverlayCompositor.add_layer``. Changing a layer only marks
+    the parts of the compositor it covers as dirty. Changes are displayed on the next ``OverlayCompositor.flush``."""
+
+    def __init__(self, compositor, img, pos, z, visible, premultiplied):
+        self._compositor = compositor
+        self.image, self.pos, self.z, self.visible = None, pos, z, visible
+        self._set_image(img, premultiplied)
+
+    def _set_image(self, img, premultiplied):
+        import numpy as np
+        h, w, _ = img.shape
+        if self.image is None or self.image.shape[:2] != (h, w):
+            self.image = np.empty((h, w, 4), dtype=np.uint8)
+        _premultiply_to_bgra(img, self.image, premultiplied)
+
+    @property
+    def rect(self):
+        """(x0, y0, x1, y1) of the area covered by this layer on the compositor's canvas."""
+        x, y = self.pos
+        h, w, _ = self.image.shape
+        return x, y, x+w, y+h
+
+    def update(self, img=None, pos=None, z=None, visible=None, premultiplied=False):
+        """Change any of the layer's image (a numpy RGBA or RGB uint8 array), position, z order or visibility."""
+        comp = self._compositor
+        if self.visible:
+            comp._invalidate(self.rect)
+        if img is not None:
+            self._set_image(img, premultiplied)
+        if pos is not None:
+            self.pos = pos
+        if visible is not None:
+            self.visible = visible
+        if z is not None and z != self.z:
+            self.z = z
+            comp._sort_layers()
+        if self.visible:
+            comp._invalidate(self.rect)
+
+    def remove(self):
+        self._compositor.remove_layer(self)
+
+
+class OverlayCompositor:
+    """Compose any number of image layers into a canvas that is displayed using a small, fixed number of overlay
+    slots, working around mpv's limit of 64 overlays. Use ``MPV.create_overlay_compositor`` to create one. Requires
+    numpy.
+
+    The canvas of the given (w, h) size is displayed at pos and split into a grid of tiles, which is given as
+    (columns, rows). Each tile uses one overlay ID. Layers are numpy RGBA or RGB uint8 arrays with a position relative to
+    the canvas, a z order and a visibility flag. Layers with higher z are drawn on top. On ``flush``, only tiles touched
+    by a change since the last flush are composited and re-uploaded to mpv.
+
+    comp = player.create_overlay_compositor((1280, 720))
+    labels = [comp.add_layer(render_label(i), pos=(20, 20 + 30*i)) for i in range(100)]
+    labels[3].update(img=render_label(3, highlight=True))
+    comp.flush()
+    """
+
+    def __init__(self, m, size, pos=(0, 0), tiles=(4, 2)):
+        import numpy as np
+        self.m = m
+        self.size, self.pos = size, pos
+        w, h = size
+        cols, rows = tiles
+        if not (0 < cols <= w and 0 < rows <= h):
+            raise ValueError(f'Invalid tile grid {tiles} for size {size}')
+
+        self._canvas = np.zeros((h, w, 4), dtype=np.uint8)
+        self._source = '&' + str(self._canvas.ctypes.data)
+        xs, ys = [w*i//cols for i in range(cols+1)], [h*i//rows for i in range(rows+1)]
+        self._tiles = [(x0, y0, x1, y1) for y0, y1 in zip(ys, ys[1:]) for x0, x1 in zip(xs, xs[1:])]
+
+        self.overlay_ids = []
+        try:
+            for _ in self._tiles:
+                self.overlay_ids.append(m.allocate_overlay_id())
+        except IndexError:
+            for overlay_id in self.overlay_ids:
+                m.free_overlay_id(overlay_id)
+            raise
+        for overlay_id in self.overlay_ids:
+            m.overlays[overlay_id] = self
+
+        self._shown = [False] * len(self._tiles)
+        self._dirty = set()
+        self._counter = 0
+        self.layers = []
+        self.uploads = 0
+
+    def _invalidate(self, rect):
+        x0, y0, x1, y1 = rect
+        for i, (tx0, ty0, tx1, ty1) in enumerate(self._tiles):
+            if x0 < tx1 and tx0 < x1 and y0 < ty1 and ty0 < y1:
+                self._dirty.add(i)
+
+    def _sort_layers(self):
+        self.layers.sort(key=lambda layer: (layer.z, layer._order))
+
+    def add_layer(self, img, pos=(0, 0), z=0, visible=True, premultiplied=False):
+        """Add a layer showing the numpy RGBA or RGB uint8 array img at pos. Returns an OverlayLayer."""
+        layer = OverlayLayer(self, img, pos, z, visible, premultiplied)
+        layer._order, self._counter = self._counter, self._counter+1
+        self.layers.append(layer)
+        self._sort_layers()
+        if visible:
+            self._invalidate(layer.rect)
+        return layer
+
+    def remove_layer(self, layer):
+        self.layers.remove(layer)
+        if layer.visible:
+            self._invalidate(layer.rect)
+
+    def flush(self):
+        """Composite all dirty tiles and upload them to mpv. Returns the number of tiles uploaded."""
+        canvas, stride = self._canvas, self.size[0]*4
+        px, py = self.pos
+        uploaded = 0
+        for i in sorted(self._dirty):
+            tx0, ty0, tx1, ty1 = self._tiles[i]
+            canvas[ty0:ty1, tx0:tx1] = 0
+            empty = True
+            for layer in self.layers:
+                if not layer.visible:
+                    continue
+                lx0, ly0, lx1, ly1 = layer.rect
+                x0, y0, x1, y1 = max(tx0, lx0), max(ty0, ly0), min(tx1, lx1), min(ty1, ly1)
+                if x0 >= x1 or y0 >= y1:
+                    continue
+                src = layer.image[y0-ly0:y1-ly0, x0-lx0:x1-lx0]
+                if empty: # Nothing to blend with on a cleared tile
+                    canvas[y0:y1, x0:x1] = src
+                else:
+                    _blend_over(src, canvas[y0:y1, x0:x1])
+                empty = False
+
+            overlay_id = self.overlay_ids[i]
+            if empty:
+                if self._shown[i]:
+                    self.m.overlay_remove(overlay_id)
+                    self._shown[i] = False
+            else:
+                offset = ty0*stride + tx0*4
+                self.m.overlay_add(overlay_id, px+tx0, py+ty0, self._source, offset, 'bgra', tx1-tx0, ty1-ty0, stride)
+                self._shown[i] = True
+                uploaded += 1
+
+        self._dirty.clear()
+        self.uploads += uploaded
+        return uploaded
+
+    def remove(self):
+        """Remove all of this compositor's overlays and free their IDs."""
+        for overlay_id, shown in zip(self.overlay_ids, self._shown):
+            if shown:
+                self.m.overlay_remove(overlay_id)
+            self.m.free_overlay_id(overlay_id)
+            del self.m.overlays[overlay_id]
+        self.overlay_ids = []
+
+
 class FileOverlay:
     def __init__(self, m, overlay_id, filename=None, size=None, stride=None, pos=(0,0)):
         self.m = m
@@ -840,12 +1554,397 @@ class FileOverlay:
         w, h = self.size
         stride = self.stride or 4*w
 
-        self.m.overlay_add(self, self.overlay_id, x, y, self.filename, 0, 'bgra', w, h, stride)
+        self.m.overlay_add(self.overlay_id, x, y, self.filename, 0, 'bgra', w, h, stride)
 
     def remove(self):
         self.m.remove_overlay(self.overlay_id)
 
 
+class FdOverlay:
+    """Overlay backed by an anonymous shared memory file that mpv maps through its file descriptor (``overlay-add``
+    with an ``@fd`` source). Use ``MPV.create_fd_overlay`` to create one.
+
+    The pixels are premultiplied BGRA and can be written directly through ``memoryview()`` or ``as_array()``, or
+    converted from a numpy RGBA array using ``write``. Call ``update`` to make mpv pick up changes. No file is ever
+    written or re-read. Since the memory is shared through a file descriptor, another process that has been passed
+    ``fd`` (e.g. using subprocess' pass_fds, or on Linux through /proc/<pid>/fd/<fd>) can mmap it and produce the
+    pixels itself.
+
+    On Linux, the memory is allocated using memfd_create. Elsewhere, an unlinked temporary file is used.
+    """
+
+    def __init__(self, m, overlay_id, size, pos=(0, 0), stride=None):
+        self.m = m
+        self.overlay_id = overlay_id
+        self.pos = pos
+        self.size = w, h = size
+        self.stride = stride or 4*w
+        self.nbytes = self.stride * h
+
+        if hasattr(os, 'memfd_create'):
+            self._file = None
+            self.fd = os.memfd_create(f'python-mpv-overlay-{overlay_id}', os.MFD_CLOEXEC)
+        else:
+            self._file = tempfile.TemporaryFile()
+            self.fd = self._file.fileno()
+        os.ftruncate(self.fd, self.nbytes)
+        self._map = mmap.mmap(self.fd, self.nbytes)
+        self._scratch = None
+
+    def memoryview(self):
+        """Return a writable memoryview of shape (h, stride) on the overlay's pixels."""
+        return memoryview(self._map).cast('B', (self.size[1], self.stride))
+
+    def as_array(self):
+        """Return a writable numpy array view of shape (h, w, 4) on the overlay's BGRA pixels. Requires numpy."""
+        import numpy as np
+        w, h = self.size
+        return np.ndarray((h, w, 4), dtype=np.uint8, buffer=self._map, strides=(self.stride, 4, 1))
+
+    def write(self, img, premultiplied=False):
+        """Convert the numpy RGBA or RGB uint8 array img of the overlay's size into the overlay's premultiplied BGRA
+        pixels, and update the overlay."""
+        import numpy as np
+        if self._scratch is None and not premultiplied:
+            self._scratch = np.empty(img.shape[:2] + (3,), dtype=np.uint16)
+        _premultiply_to_bgra(img, self.as_array(), premultiplied, self._scratch)
+        self.update()
+
+    def update(self, pos=None):
+        """Make mpv re-read the overlay's pixels, optionally moving it to a new position."""
+        if pos is not None:
+            self.pos = pos
+        x, y = self.pos
+        w, h = self.size
+        self.m.overlay_add(self.overlay_id, x, y, f'@{self.fd}', 0, 'bgra', w, h, self.stride)
+
+    def remove(self):
+        self.m.remove_overlay(self.overlay_id)
+        self._map.close()
+        if self._file is not None:
+            self._file.close()
+        else:
+            os.close(self.fd)
+
+
+def _ass_color(color):
+    """Convert an (r, g, b) tuple or an "rrggbb" hex string into an ASS color tag value."""
+    if isinstance(color, str):
+        color = bytes.fromhex(color.lstrip('#'))
+    r, g, b = color
+    return f'&H{b:02X}{g:02X}{r:02X}&'
+
+def _ass_alpha(opacity):
+    """Convert an opacity between 0.0 and 1.0 into an ASS alpha tag value."""
+    return f'&H{255 - round(255 * max(0.0, min(1.0, opacity))):02X}&'
+
+def _ass_escape(text):
+    # U+2060 WORD JOINER prevents libass from interpreting backslashes in the text as escapes.
+    return text.replace('\\', '\\\u2060').replace('{', '\\{').replace('}', '\\}').replace('\n', '\\N')
+
+def _ass_rect(x, y, w, h, color, opacity):
+    return (f'{{\\an7\\pos({x},{y})\\bord0\\shad0\\1c{_ass_color(color)}\\1a{_ass_alpha(opacity)}\\p1}}'
+            f'm 0 0 l {w} 0 {w} {h} 0 {h}{{\\p0}}')
+
+
+class OsdElement:
+    """Base class of OsdScene elements. Elements are configured through their attributes. Assigning a new value to an
+    attribute invalidates the element's cached ASS and schedules an update of its scene. Subclasses define their
+    attributes and defaults in DEFAULTS and generate their ASS in _render."""
+
+    DEFAULTS = {'visible': True, 'z': 0}
+
+    def __init__(self, **kwargs):
+        unknown = kwargs.keys() - self.DEFAULTS.keys()
+        if unknown:
+            raise TypeError(f'Unknown {type(self).__name__} attributes: {", ".join(sorted(unknown))}')
+        self._scene = None
+        self._version = 0
+        self._ass = (-1, None)
+        self.__dict__.update(self.DEFAULTS)
+        self.__dict__.update(kwargs)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            super().__setattr__(name, value)
+            return
+        if name not in self.DEFAULTS:
+            raise AttributeError(f'{type(self).__name__} has no attribute {name}')
+        if self.__dict__[name] != value:
+            self.__dict__[name] = value
+            self._version += 1
+            if self._scene is not None:
+                self._scene._changed()
+
+    def update(self, **kwargs):
+        """Change several attributes at once."""
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def ass(self):
+        """Return this element's ASS events, re-generating them only if an attribute has changed."""
+        # The scene's update thread may call this while attributes are being changed. Tag the cached ASS with the
+        # version it was generated from so that it is never stale.
+        version, ass = self._ass
+        if version != self._version:
+            version = self._version
+            ass = self._render()
+            self._ass = version, ass
+        return ass
+
+    def _render(self):
+        raise NotImplementedError()
+
+class OsdText(OsdElement):
+    """Text at pos. align is an ASS numpad alignment (7 is top left), color and border_color are (r, g, b) tuples or
+    "rrggbb" hex strings."""
+
+    DEFAULTS = {**OsdElement.DEFAULTS, 'text': '', 'pos': (0, 0), 'size': 32, 'align': 7, 'color': 'ffffff',
+            'opacity': 1.0, 'border': 2, 'border_color': '000000', 'font': None}
+
+    def _render(self):
+        x, y = self.pos
+        font = f'\\fn{self.font}' if self.font else ''
+        return (f'{{\\an{self.align}\\pos({x},{y}){font}\\fs{self.size}\\bord{self.border}\\shad0'
+                f'\\1c{_ass_color(self.color)}\\1a{_ass_alpha(self.opacity)}\\3c{_ass_color(self.border_color)}}}'
+                f'{_ass_escape(self.text)}')
+
+class OsdBox(OsdElement):
+    """Filled rectangle given as rect=(x, y, w, h)."""
+
+    DEFAULTS = {**OsdElement.DEFAULTS, 'rect': (0, 0, 0, 0), 'color': '000000', 'opacity': 0.5}
+
+    def _render(self):
+        return _ass_rect(*self.rect, self.color, self.opacity)
+
+class OsdProgressBar(OsdElement):
+    """Progress bar filling rect=(x, y, w, h) from the left according to value between 0.0 and 1.0."""
+
+    DEFAULTS = {**OsdElement.DEFAULTS, 'rect': (0, 0, 0, 0), 'value': 0.0, 'color': 'ffffff', 'opacity': 1.0,
+            'background': '000000', 'background_opacity': 0.5}
+
+    def _render(self):
+        x, y, w, h = self.rect
+        filled = round(w * max(0.0, min(1.0, self.value)))
+        bg = _ass_rect(x, y, w, h, self.background, self.background_opacity)
+        return bg + '\n' + _ass_rect(x, y, filled, h, self.color, self.opacity) if filled else bg
+
+
+class OsdScene:
+    """Scene of OSD elements such as text, boxes and progress bars that is displayed as a single ``osd-overlay``. Use
+    ``MPV.create_osd_scene`` to create one.
+
+    Each element caches its ASS, so when an element changes only that element's ASS is re-generated. Changes are
+    coalesced: the scene is sent to mpv at most max_rate times per second, by default at the video's frame rate. Updates
+    are sent from a background thread using ``command_async``, so changing elements never blocks on mpv.
+
+    scene = player.create_osd_scene()
+    title = scene.add(mpv.OsdText(text='Now playing', pos=(20, 20)))
+    bar = scene.add(mpv.OsdProgressBar(rect=(20, 680, 1240, 12)))
+
+    @player.property_observer('percent-pos')
+    def progress(_name, value):
+        bar.value = (value or 0) / 100
+
+    res is the (width, height) of the scene's coordinate system. z is the overlay's z order relative to other OSD
+    overlays.
+    """
+
+    _ids = itertools.count(0x10000)
+
+    def __init__(self, m, res=(1280, 720), z=0, max_rate=None, overlay_id=None):
+        self.m = m
+        self.res, self.z, self.max_rate = res, z, max_rate
+        self.overlay_id = next(self._ids) if overlay_id is None else overlay_id
+        # Replaced under _cond on every change and never modified in place, so the flush thread can iterate it unlocked
+        self.elements = []
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._closed = False
+        self._thread = None
+        self._last_flush = 0
+        self.changes = self.flushes = self.errors = 0
+        # The frame rate is observed instead of queried on every flush, since querying would block on mpv.
+        self._fps = {'estimated-vf-fps': None, 'container-fps': None}
+        if max_rate is None:
+            for name in self._fps:
+                m.observe_property(name, self._fps_changed)
+        m._osd_scenes.add(self)
+
+    def _fps_changed(self, name, value):
+        self._fps[name] = value
+
+    def add(self, element):
+        """Add an element to this scene and return it."""
+        if element._scene is not None:
+            raise ValueError('Element already belongs to a scene')
+        element._scene = self
+        with self._cond:
+            self.elements = self.elements + [element]
+        self._changed()
+        return element
+
+    def remove(self, element):
+        with self._cond:
+            elements = list(self.elements)
+            elements.remove(element)
+            self.elements = elements
+        element._scene = None
+        self._changed()
+
+    def _changed(self):
+        with self._cond:
+            self.changes += 1
+            self._dirty = True
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._loop, name='MPVOsdSceneThread', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def ass(self):
+        """Return the ASS events for the whole scene."""
+        elements = sorted((el for el in self.elements if el.visible), key=lambda el: el.z)
+        return '\n'.join(el.ass() for el in elements)
+
+    def _interval(self):
+        rate = self.max_rate or self._fps['estimated-vf-fps'] or self._fps['container-fps']
+        return 1 / (rate or 60)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            delay = self._last_flush + self._interval() - time.monotonic()
+            if delay > 0:
+                with self._cond:
+                    # Collect further changes for the remainder of this interval
+                    self._cond.wait_for(lambda: self._closed, delay)
+            try:
+                self.flush()
+            except ShutdownError:
+                return
+
+    def _flush_done(self, error, _result):
+        if error:
+            self.errors += 1
+
+    def flush(self):
+        """Send the scene to mpv immediately. Returns the command_async future."""
+        with self._cond:
+            self._dirty = False
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+        w, h = self.res
+        return self.m.command_async('osd_overlay', id=self.overlay_id, data=self.ass(), res_x=w, res_y=h, z=self.z,
+                format='ass-events', callback=self._flush_done)
+
+    def close(self):
+        """Stop sending updates and remove the overlay."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.m._osd_scenes.discard(self)
+        if self.m.core_shutdown:
+            return
+        try:
+            self.m.unobserve_all_properties(self._fps_changed)
+            self.m.command_async('osd_overlay', id=self.overlay_id, format='none')
+        except ShutdownError:
+            pass # The core shut down while we were closing, which removes the overlay anyway
+
+
+class MPVEventReactor:
+    """Handle the events of any number of MPV instances on a small, fixed pool of threads instead of one event thread
+    per instance. Pass the reactor to the MPV constructor to use it:
+
+    reactor = mpv.MPVEventReactor(threads=2)
+    players = [mpv.MPV(vo='null', event_reactor=reactor) for _ in range(200)]
+
+    Each instance registers a libmpv wakeup callback that queues it for processing. A reactor thread then drains the
+    instance's pending events without blocking and dispatches them as the instance's own event thread would. An
+    instance is only ever processed by one reactor thread at a time, so its callbacks see events in order. To keep one
+    busy instance from starving the others, at most batch_size events are processed at a time before the instance is
+    put back at the end of the queue.
+
+    As with the per-instance event thread, callbacks run on the reactor threads. Callbacks blocking for a long time
+    delay event handling for all instances sharing the reactor.
+    """
+
+    # Per-instance states. An instance is queued at most once. Wakeups while it is being processed only mark it for
+    # re-processing, so no wakeup can get lost without two threads ever processing the same instance.
+    IDLE, SCHEDULED, RUNNING, RERUN = range(4)
+
+    def __init__(self, threads=1, batch_size=64, name='MPVEventReactorThread'):
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._state = {}
+        self._callbacks = {}
+        self._threads = [threading.Thread(target=self._loop, name=f'{name}-{i}', daemon=True) for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def register(self, player):
+        """Start handling events for the given MPV instance. This is called by the MPV constructor."""
+        cb = WakeupCallback(lambda _userdata: self._wakeup(player))
+        with self._lock:
+            self._state[player] = self.IDLE
+            self._callbacks[player] = cb
+        _mpv_set_wakeup_callback(player._event_handle, cb, None)
+        # Handle any events that may have been queued before the callback was set.
+        self._wakeup(player)
+
+    def _wakeup(self, player):
+        # Called from inside libmpv. Do not call into mpv from here.
+        with self._lock:
+            state = self._state.get(player)
+            if state == self.IDLE:
+                self._state[player] = self.SCHEDULED
+                self._queue.put(player)
+            elif state == self.RUNNING:
+                self._state[player] = self.RERUN
+
+    def is_reactor_thread(self):
+        return threading.current_thread() in self._threads
+
+    @property
+    def players(self):
+        """Number of MPV instances currently handled by this reactor."""
+        return len(self._state)
+
+    def _loop(self):
+        while (player := self._queue.get()) is not None:
+            with self._lock:
+                self._state[player] = self.RUNNING
+
+            processed = player._process_events(0, self.batch_size)
+            done = player._event_loop_done.is_set()
+            more = not done and processed == self.batch_size
+
+            with self._lock:
+                if done:
+                    del self._state[player]
+                    del self._callbacks[player]
+                elif more or self._state[player] == self.RERUN:
+                    self._state[player] = self.SCHEDULED
+                    self._queue.put(player)
+                else:
+                    self._state[player] = self.IDLE
+
+    def stop(self):
+        """Stop the reactor threads. Terminate all instances using this reactor first."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+
 class MPV(object):
     """See man mpv(1) for the details of the implemented commands. All mpv properties can be accessed as
     ``my_mpv.some_property`` and all mpv options can be accessed as ``my_mpv['some-option']``.
@@ -862,14 +1961,45 @@ class MPV(object):
     To make your program not barf hard the first time its used on a weird file system **always** access properties
     containing file names or file tags through ``MPV.raw``.  """
 
-    def __init__(self, *extra_mpv_flags, log_handler=None, start_event_thread=True, loglevel=None, **extra_mpv_opts):
+    # Broadcast events that are only delivered on the main event handle, not on separate event clients.
+    _EVENT_CLIENT_DISABLED_EVENTS = (MpvEventID.START_FILE, MpvEventID.END_FILE, MpvEventID.FILE_LOADED,
+            MpvEventID.CLIENT_MESSAGE, MpvEventID.VIDEO_RECONFIG, MpvEventID.AUDIO_RECONFIG, MpvEventID.SEEK,
+            MpvEventID.PLAYBACK_RESTART)
+    EVENT_CLIENT_CHANNELS = ('log', 'property', 'command')
+
+    def __init__(self, *extra_mpv_flags, log_handler=None, start_event_thread=True, loglevel=None, event_reactor=None,
+            event_clients=(), **extra_mpv_opts):
         """Create an MPV instance.
 
         Extra arguments and extra keyword arguments will be passed to mpv as options.
+
+        By default, each instance starts its own event handler thread. When running many instances, pass a shared
+        MPVEventReactor as event_reactor instead to have their events handled by the reactor's small thread pool.
+
+        By default, log messages, property changes and command replies all arrive through the same libmpv client handle
+        as all other events, so e.g. a burst of debug log messages can overflow its event queue. event_clients moves
+        any of the channels "log", "property" and "command" to a libmpv client handle of its own, each with its own
+        event queue and event handler thread::
+
+            player = mpv.MPV(log_handler=print, loglevel='debug', event_clients=('log',))
+
+        Note that this means that handlers for different channels may run concurrently.
         """
 
+        # Check arguments before creating the mpv core, which would otherwise be left running
+        self.handle = None
+        if event_clients and event_reactor is not None:
+            raise ValueError('event_clients cannot be used together with an event_reactor')
+        for channel in event_clients:
+            if channel not in self.EVENT_CLIENT_CHANNELS:
+                raise ValueError(f'Invalid event client channel {channel!r}, must be one of {self.EVENT_CLIENT_CHANNELS}')
+
         self.handle = _mpv_create()
         self._event_thread = None
+        self._event_reactor = None
+        self._event_loop_done = threading.Event()
+        self._wakeup_pipe = None
+        self._property_baseline = None
         self._core_shutdown = False
 
         _mpv_set_option_string(self.handle, b'audio-display', b'no')
@@ -888,31 +2018,61 @@ class MPV(object):
         self.strict = _DecoderPropertyProxy(self, strict_decoder)
         self.lazy   = _DecoderPropertyProxy(self, lazy_decoder)
 
-        self._event_callbacks = []
+        # Callback tables are copy-on-write: Writers replace the dict entry or attribute under the table's lock, so the
+        # event thread can iterate a snapshot without locking and without relying on the GIL.
+        self._event_callbacks = ()
         self._command_reply_callbacks = {}
         self._event_handler_lock = threading.Lock()
-        self._property_handlers = collections.defaultdict(lambda: [])
+        self._callback_lock = threading.Lock()
+        self._property_lock = threading.Lock()
+        self._command_reply_lock = threading.Lock()
+        self._overlay_lock = threading.Lock()
+        self._property_handlers = collections.defaultdict(tuple)
         self._quit_handlers = set()
         self._message_handlers = {}
         self._key_binding_handlers = {}
         self._event_handle = _mpv_create_client(self.handle, b'py_event_handler')
+        self._event_handles = dict.fromkeys(self.EVENT_CLIENT_CHANNELS, self._event_handle)
+        self._event_client_threads = []
+        for channel in event_clients:
+            handle = _mpv_create_weak_client(self.handle, f'py_event_handler_{channel}'.encode('utf-8'))
+            for eid in self._EVENT_CLIENT_DISABLED_EVENTS:
+                _mpv_request_event(handle, eid, 0)
+            self._event_handles[channel] = handle
         self._log_handler = log_handler
         self._stream_protocol_cbs = {}
         self._stream_protocol_frontends = collections.defaultdict(lambda: {})
+        self._stream_open_stats = {}
+        self._stream_io_stats = {}
+        self._stream_openers = {}
+        self._stream_prefetches = {}
+        self._stream_prefetch_lock = threading.Lock()
+        self._stream_open_executor = None
         self.register_stream_protocol('python', self._python_stream_open)
         self._python_streams = {}
         self._python_stream_catchall = None
+        self._mmap_streams = {}
         self._exception_futures = set()
         self.overlay_ids = set()
+        self._free_overlay_ids = list(range(63, -1, -1)) # stack, lowest ID on top
         self.overlays = {}
+        self._osd_scenes = set()
         if loglevel is not None or log_handler is not None:
             self.set_loglevel(loglevel or 'terminal-default')
-        if start_event_thread:
+        if event_reactor is not None:
+            self._event_reactor = event_reactor
+            event_reactor.register(self)
+        elif start_event_thread:
             self._event_thread = threading.Thread(target=self._loop, name='MPVEventHandlerThread')
             self._event_thread.daemon = True
             self._event_thread.start()
         else:
             self._event_thread = None
+        for channel in event_clients:
+            thread = threading.Thread(target=self._client_loop, args=(self._event_handles[channel],),
+                    name=f'MPVEventHandlerThread-{channel}', daemon=True)
+            thread.start()
+            self._event_client_threads.append(thread)
         if (m := re.search(r'(\d+)\.(\d+)\.(\d+)', self.mpv_version)):
             self.mpv_version_tuple = tuple(map(int, m.groups()))
 
@@ -932,59 +2092,149 @@ class MPV(object):
 
     def _loop(self):
         for event in _event_generator(self._event_handle):
+            if self._handle_event(event):
+                return
+
+    def _process_events(self, timeout, max_events):
+        if self._wakeup_pipe is not None:
             try:
-                eid = event.event_id.value
+                while os.read(self._wakeup_pipe[0], 4096):
+                    pass
+            except BlockingIOError:
+                pass
 
-                with self._event_handler_lock:
-                    if eid == MpvEventID.SHUTDOWN:
-                        self._core_shutdown = True
+        processed = 0
+        while not self._event_loop_done.is_set() and (max_events is None or processed < max_events):
+            event = _mpv_wait_event(self._event_handle, timeout if processed == 0 else 0).contents
+            if event.event_id.value == MpvEventID.NONE:
+                break
+            processed += 1
+            self._handle_event(event)
+        if self._wakeup_pipe is not None and max_events is not None and processed >= max_events:
+            # We stopped before the queue ran empty, but emptied the pipe above. Make it readable again so a select loop
+            # comes back for the remaining events.
+            try:
+                os.write(self._wakeup_pipe[1], b'\0')
+            except BlockingIOError:
+                pass # Pipe is full, so a wakeup is pending anyway.
+        return processed
 
-                for callback in self._event_callbacks:
-                    with self._enqueue_exceptions():
-                        callback(event)
+    def process_events(self, timeout=0, max_events=None):
+        """Process pending events on the calling thread, for instances created with ``start_event_thread=False``.
+        This is intended for integrating mpv into an application's own main loop, e.g. calling this once per frame of a
+        game engine or GUI toolkit. It runs the same dispatch as the event thread would, so all callbacks and handlers
+        run inside this call.
 
-                if eid == MpvEventID.PROPERTY_CHANGE:
-                    pc = event.data
-                    name, value, _fmt = pc.name, pc.value, pc.format
-                    for handler in self._property_handlers[name]:
-                        with self._enqueue_exceptions():
-                            handler(name, value)
+        Waits up to timeout seconds for the first event (-1 waits forever), then processes all further events that are
+        already pending, but at most max_events events in total. Returns the number of events processed.
 
-                if eid == MpvEventID.LOG_MESSAGE and self._log_handler is not None:
-                    ev = event.data
-                    with self._enqueue_exceptions():
-                        self._log_handler(ev.level, ev.prefix, ev.text)
+        See ``wakeup_fd`` to wait for events using select and friends.
+        """
+        if self._event_thread is not None or self._event_reactor is not None:
+            raise RuntimeError('process_events can only be used on instances created with start_event_thread=False')
+        return self._process_events(timeout, max_events)
+
+    def wakeup_fd(self):
+        """Return a file descriptor that becomes readable when new events are pending, for use with select, selectors
+        or an event loop's reader callbacks together with ``process_events``::
+
+            player = mpv.MPV(start_event_thread=False)
+            sel = selectors.DefaultSelector()
+            sel.register(player.wakeup_fd(), selectors.EVENT_READ)
+            while True:
+                sel.select()
+                player.process_events()
+
+        ``process_events`` empties the file descriptor, do not read from it yourself. The file descriptor is closed by
+        ``terminate``.
+        """
+        if self._event_thread is not None or self._event_reactor is not None:
+            raise RuntimeError('wakeup_fd can only be used on instances created with start_event_thread=False')
+        if self._wakeup_pipe is None:
+            r, w = os.pipe()
+            os.set_blocking(r, False)
+            os.set_blocking(w, False)
+            def wakeup(_userdata):
+                # Called from inside libmpv. Do not call into mpv from here.
+                try:
+                    os.write(w, b'\0')
+                except BlockingIOError:
+                    pass # Pipe is full, so a wakeup is pending anyway.
+            self._wakeup_pipe = r, w
+            self._wakeup_cb = WakeupCallback(wakeup)
+            _mpv_set_wakeup_callback(self._event_handle, self._wakeup_cb, None)
+        return self._wakeup_pipe[0]
+
+    def _client_loop(self, handle):
+        """Event loop of a separate event client, see the event_clients argument to MPV."""
+        for event in _event_generator(handle):
+            if event.event_id.value == MpvEventID.SHUTDOWN:
+                _mpv_destroy(handle)
+                return
+            self._handle_event(event)
+
+    def _handle_event(self, event):
+        """Dispatch a single event to this instance's callbacks and handlers. Returns True after the core has been
+        shut down and the event handle destroyed, after which no further events must be processed."""
+        try:
+            eid = event.event_id.value
 
-                if eid == MpvEventID.CLIENT_MESSAGE:
-                    # {'event': {'args': ['key-binding', 'foo', 'u-', 'g']}, 'reply_userdata': 0, 'error': 0, 'event_id': 16}
-                    target, *args = event.data.args
-                    target = target.decode("utf-8")
-                    if target in self._message_handlers:
-                        with self._enqueue_exceptions():
-                            self._message_handlers[target](*args)
+            with self._event_handler_lock:
+                if eid == MpvEventID.SHUTDOWN:
+                    self._core_shutdown = True
+
+            for callback in self._event_callbacks:
+                with self._enqueue_exceptions():
+                    callback(event)
 
-                if eid == MpvEventID.COMMAND_REPLY:
-                    key = event.reply_userdata
+            if eid == MpvEventID.PROPERTY_CHANGE:
+                pc = event.data
+                name, value, _fmt = pc.name, pc.value, pc.format
+                for handler in self._property_handlers.get(name, ()):
+                    with self._enqueue_exceptions():
+                        handler(name, value)
+
+            if eid == MpvEventID.LOG_MESSAGE and self._log_handler is not None:
+                ev = event.data
+                with self._enqueue_exceptions():
+                    self._log_handler(ev.level, ev.prefix, ev.text)
+
+            if eid == MpvEventID.CLIENT_MESSAGE:
+                # {'event': {'args': ['key-binding', 'foo', 'u-', 'g']}, 'reply_userdata': 0, 'error': 0, 'event_id': 16}
+                target, *args = event.data.args
+                target = target.decode("utf-8")
+                if (handler := self._message_handlers.get(target)) is not None:
+                    with self._enqueue_exceptions():
+                        handler(*args)
+
+            if eid == MpvEventID.COMMAND_REPLY:
+                key = event.reply_userdata
+                with self._command_reply_lock:
                     callback = self._command_reply_callbacks.pop(key, None)
-                    if callback:
-                        with self._enqueue_exceptions():
-                            callback(ErrorCode.exception_for_ec(event.error), event.data)
+                if callback:
+                    with self._enqueue_exceptions():
+                        callback(ErrorCode.exception_for_ec(event.error), event.data)
 
-                if eid == MpvEventID.QUEUE_OVERFLOW:
-                    # cache list, since error handlers will unregister themselves
-                    for cb in list(self._command_reply_callbacks.values()):
-                        with self._enqueue_exceptions():
-                            cb(EventOverflowError('libmpv event queue has flown over because events have not been processed fast enough'), None)
+            if eid == MpvEventID.QUEUE_OVERFLOW:
+                # cache list, since error handlers will unregister themselves
+                with self._command_reply_lock:
+                    callbacks = list(self._command_reply_callbacks.values())
+                for cb in callbacks:
+                    with self._enqueue_exceptions():
+                        cb(EventOverflowError('libmpv event queue has flown over because events have not been processed fast enough'), None)
 
-                if eid == MpvEventID.SHUTDOWN:
-                    _mpv_destroy(self._event_handle)
-                    for cb in list(self._command_reply_callbacks.values()):
-                        with self._enqueue_exceptions():
-                            cb(ShutdownError('libmpv core has been shutdown'), None)
-                    return
+            if eid == MpvEventID.SHUTDOWN:
+                _mpv_destroy(self._event_handle)
+                with self._command_reply_lock:
+                    callbacks = list(self._command_reply_callbacks.values())
+                for cb in callbacks:
+                    with self._enqueue_exceptions():
+                        cb(ShutdownError('libmpv core has been shutdown'), None)
+                self._event_loop_done.set()
+                return True
 
-            except Exception as e:
-                warn(f'Unhandled {e} inside python-mpv event loop!\n{traceback.format_exc()}', RuntimeWarning)
+        except Exception as e:
+            warn(f'Unhandled {e} inside python-mpv event loop!\n{traceback.format_exc()}', RuntimeWarning)
 
     @property
     def core_shutdown(self):
@@ -998,6 +2248,11 @@ class MPV(object):
         if self._core_shutdown:
             raise ShutdownError('libmpv core has been shutdown')
 
+    def get_time_us(self):
+        """Return mpv's internal monotonic clock in microseconds. This is the clock used by e.g. the render API's
+        next_frame_info target_time."""
+        return _mpv_get_time_us(self.handle)
+
     def wait_until_paused(self, timeout=None, catch_errors=True):
         """Waits until playback of the current title is paused or done. Raises a ShutdownError if the core is shutdown while
         waiting."""
@@ -1161,16 +2416,39 @@ class MPV(object):
         This method will detach the main libmpv handle and wait for mpv to shut down and the event thread to finish.
         """
         self.handle, handle = None, self.handle
-        if threading.current_thread() is self._event_thread:
+        current = threading.current_thread()
+        if current is self._event_thread or current in self._event_client_threads or \
+                (self._event_reactor is not None and self._event_reactor.is_reactor_thread()):
             raise UserWarning('terminate() should not be called from event thread (e.g. from a callback function). If '
                     'you want to terminate mpv from here, please call quit() instead, then sync the main thread '
                     'against the event thread using e.g. wait_for_shutdown(), then terminate() from the main thread. '
                     'This call has been transformed into a call to quit().')
             self.quit()
+        elif self._event_thread is None and self._event_reactor is None:
+            # Nobody else is processing events, so process them here until the event handle has received the shutdown
+            # event, since mpv_terminate_destroy waits for it to be destroyed.
+            destroy_thread = threading.Thread(target=_mpv_terminate_destroy, args=(handle,), daemon=True)
+            destroy_thread.start()
+            while not self._event_loop_done.is_set():
+                self._process_events(0.1, None)
+            destroy_thread.join()
+            for thread in self._event_client_threads:
+                thread.join()
         else:
             _mpv_terminate_destroy(handle)
             if self._event_thread:
                 self._event_thread.join()
+            elif self._event_reactor:
+                self._event_loop_done.wait()
+            for thread in self._event_client_threads:
+                thread.join()
+        if self._wakeup_pipe is not None:
+            for fd in self._wakeup_pipe:
+                os.close(fd)
+            self._wakeup_pipe = None
+        self._drop_stream_prefetches()
+        if self._stream_open_executor is not None:
+            self._stream_open_executor.shutdown(wait=False)
 
     def set_loglevel(self, level):
         """Set MPV's log level. This adjusts which output will be sent to this object's log handlers. If you just want
@@ -1180,7 +2458,7 @@ class MPV(object):
         Valid log levels are "no", "fatal", "error", "warn", "info", "v" "debug" and "trace". For details see your mpv's
         client.h header file.
         """
-        _mpv_request_log_messages(self._event_handle, level.encode('utf-8'))
+        _mpv_request_log_messages(self._event_handles['log'], level.encode('utf-8'))
 
     def string_command(self, name, *args):
         """Execute a raw command."""
@@ -1221,11 +2499,13 @@ class MPV(object):
                     pass
 
         def abort():
-            _mpv_abort_async_command(self._event_handle, id(future))
-            del self._command_reply_callbacks[id(future)]
+            _mpv_abort_async_command(self._event_handles['command'], id(future))
+            with self._command_reply_lock:
+                self._command_reply_callbacks.pop(id(future), None)
         future.cancel = abort
 
-        self._command_reply_callbacks[id(future)] = wrapper
+        with self._command_reply_lock:
+            self._command_reply_callbacks[id(future)] = wrapper
 
         if kwargs:
             if args:
@@ -1236,7 +2516,7 @@ class MPV(object):
             _1, _2, _3, pointer = _make_node_str_list([name, *args])
 
         ppointer = cast(pointer, POINTER(MpvNode))
-        _mpv_command_node_async(self._event_handle, id(future), ppointer)
+        _mpv_command_node_async(self._event_handles['command'], id(future), ppointer)
         return future
 
 
@@ -1311,15 +2591,17 @@ class MPV(object):
         return Image.merge('RGB', (r,g,b))
 
     def allocate_overlay_id(self):
-        free_ids = set(range(64)) - self.overlay_ids
-        if not free_ids:
-            raise IndexError('All overlay IDs are in use')
-        next_id, *_ = sorted(free_ids)
-        self.overlay_ids.add(next_id)
-        return next_id
+        with self._overlay_lock:
+            if not self._free_overlay_ids:
+                raise IndexError('All overlay IDs are in use')
+            next_id = self._free_overlay_ids.pop()
+            self.overlay_ids.add(next_id)
+            return next_id
 
     def free_overlay_id(self, overlay_id):
-        self.overlay_ids.remove(overlay_id)
+        with self._overlay_lock:
+            self.overlay_ids.remove(overlay_id)
+            self._free_overlay_ids.append(overlay_id)
 
     def create_file_overlay(self, filename=None, size=None, stride=None, pos=(0,0)):
         overlay_id = self.allocate_overlay_id()
@@ -1327,12 +2609,26 @@ class MPV(object):
         self.overlays[overlay_id] = overlay
         return overlay
 
+    def create_fd_overlay(self, size, pos=(0,0), stride=None):
+        overlay_id = self.allocate_overlay_id()
+        overlay = FdOverlay(self, overlay_id, size, pos, stride)
+        self.overlays[overlay_id] = overlay
+        return overlay
+
+    def create_osd_scene(self, res=(1280, 720), z=0, max_rate=None):
+        """Create an OsdScene, see there."""
+        return OsdScene(self, res, z, max_rate)
+
     def create_image_overlay(self, img=None, pos=(0,0)):
         overlay_id = self.allocate_overlay_id()
         overlay = ImageOverlay(self, overlay_id, img, pos)
         self.overlays[overlay_id] = overlay
         return overlay
 
+    def create_overlay_compositor(self, size, pos=(0,0), tiles=(4, 2)):
+        """Create an OverlayCompositor of the given (w, h) size at pos, using one overlay ID per tile."""
+        return OverlayCompositor(self, size, pos, tiles)
+
     def remove_overlay(self, overlay_id):
         self.overlay_remove(overlay_id)
         self.free_overlay_id(overlay_id)
@@ -1552,12 +2848,16 @@ class MPV(object):
     def af_command(self, label, command, argument):
         self.command('af_command', label, command, argument)
 
-    def observe_property(self, name, handler):
+    def observe_property(self, name, handler, fmt=MpvFormat.NODE):
         """Register an observer on the named property. An observer is a function that is called with the new property
         value every time the property's value is changed. The basic function signature is ``fun(property_name,
         new_value)`` with new_value being the decoded property value as a python object. This function can be used as a
         function decorator if no handler is given.
 
+        fmt can be used to have mpv deliver the value in a native format such as ``MpvFormat.DOUBLE`` or
+        ``MpvFormat.FLAG`` instead of as a generic node. This saves mpv building and python decoding a node for
+        frequently changing numeric properties like ``time-pos``.
+
         To unregister the observer, call either of ``mpv.unobserve_property(name, handler)``,
         ``mpv.unobserve_all_properties(handler)`` or the handler's ``unobserve_mpv_properties`` attribute::
 
@@ -1570,13 +2870,14 @@ class MPV(object):
         exit_handler is a function taking no arguments that is called when the underlying mpv handle is terminated (e.g.
         from calling MPV.terminate() or issuing a "quit" input command).
         """
-        self._property_handlers[name].append(handler)
-        _mpv_observe_property(self._event_handle, hash(name)&0xffffffffffffffff, name.encode('utf-8'), MpvFormat.NODE)
+        with self._property_lock:
+            self._property_handlers[name] += (handler,)
+            _mpv_observe_property(self._event_handles['property'], hash(name)&0xffffffffffffffff, name.encode('utf-8'), fmt)
 
-    def property_observer(self, name):
+    def property_observer(self, name, fmt=MpvFormat.NODE):
         """Function decorator to register a property observer. See ``MPV.observe_property`` for details."""
         def wrapper(fun):
-            self.observe_property(name, fun)
+            self.observe_property(name, fun, fmt)
             fun.unobserve_mpv_properties = lambda: self.unobserve_property(name, fun)
             return fun
         return wrapper
@@ -1586,14 +2887,20 @@ class MPV(object):
         was originally registered as one handler could be registered for several properties. To unregister a handler
         from *all* observed properties see ``unobserve_all_properties``.
         """
-        self._property_handlers[name].remove(handler)
-        if not self._property_handlers[name]:
-            _mpv_unobserve_property(self._event_handle, hash(name)&0xffffffffffffffff)
+        with self._property_lock:
+            handlers = list(self._property_handlers.get(name, ()))
+            handlers.remove(handler)
+            if handlers:
+                self._property_handlers[name] = tuple(handlers)
+            else:
+                del self._property_handlers[name]
+                _mpv_unobserve_property(self._event_handles['property'], hash(name)&0xffffffffffffffff)
 
     def unobserve_all_properties(self, handler):
         """Unregister a property observer from *all* observed properties."""
-        for name in self._property_handlers:
-            self.unobserve_property(name, handler)
+        for name, handlers in list(self._property_handlers.items()):
+            if handler in handlers:
+                self.unobserve_property(name, handler)
 
     def register_message_handler(self, target, handler=None):
         """Register a mpv script message handler. This can be used to communicate with embedded lua scripts. Pass the
@@ -1613,7 +2920,8 @@ class MPV(object):
         self._register_message_handler_internal(target, handler)
 
     def _register_message_handler_internal(self, target, handler):
-        self._message_handlers[target] = handler
+        with self._callback_lock:
+            self._message_handlers = {**self._message_handlers, target: handler}
 
     def unregister_message_handler(self, target_or_handler):
         """Unregister a mpv script message handler for the given script message target name.
@@ -1621,12 +2929,13 @@ class MPV(object):
         You can also call the ``unregister_mpv_messages`` function attribute set on the handler function when it is
         registered.
         """
-        if isinstance(target_or_handler, str):
-            del self._message_handlers[target_or_handler]
-        else:
-            for key, val in self._message_handlers.items():
-                if val == target_or_handler:
-                    del self._message_handlers[key]
+        with self._callback_lock:
+            if isinstance(target_or_handler, str):
+                if target_or_handler not in self._message_handlers:
+                    raise KeyError(target_or_handler)
+                self._message_handlers = {k: v for k, v in self._message_handlers.items() if k != target_or_handler}
+            else:
+                self._message_handlers = {k: v for k, v in self._message_handlers.items() if v != target_or_handler}
 
     def message_handler(self, target):
         """Decorator to register a mpv script message handler.
@@ -1660,11 +2969,15 @@ class MPV(object):
 
             my_handler.unregister_mpv_events()
         """
-        self._event_callbacks.append(callback)
+        with self._callback_lock:
+            self._event_callbacks += (callback,)
 
     def unregister_event_callback(self, callback):
         """Unregiser an event callback."""
-        self._event_callbacks.remove(callback)
+        with self._callback_lock:
+            callbacks = list(self._event_callbacks)
+            callbacks.remove(callback)
+            self._event_callbacks = tuple(callbacks)
 
     def event_callback(self, *event_types):
         """Function decorator to register a blanket event callback for the given event types. Event types can be given
@@ -1689,7 +3002,7 @@ class MPV(object):
                 def wrapper(event, *args, **kwargs):
                     if event.event_id.value in types:
                         callback(event, *args, **kwargs)
-                self._event_callbacks.append(wrapper)
+                self.register_event_callback(wrapper)
                 wrapper.unregister_mpv_events = partial(self.unregister_event_callback, wrapper)
                 return wrapper
         return register
@@ -1806,7 +3119,8 @@ class MPV(object):
             if not self._key_binding_handlers:
                 self.unregister_message_handler('key-binding')
 
-    def register_stream_protocol(self, proto, open_fn=None):
+    def register_stream_protocol(self, proto, open_fn=None, cache=None, loop=None, read_timeout=None,
+            open_timeout=None, executor=None, collect_stats=False, on_stream_close=None):
         """ Register a custom stream protocol as documented in libmpv/stream_cb.h:
             https://github.com/mpv-player/mpv/blob/master/libmpv/stream_cb.h
 
@@ -1830,6 +3144,10 @@ class MPV(object):
                     return read # non-empty bytes object with input
                     return b'' # empty byte object signals permanent EOF
 
+                def readinto(self, buf): # optional, used instead of read() if present
+                    ...
+                    return n # number of bytes written into the writable memoryview buf, 0 signals EOF
+
                 def seek(self, pos): # optional
                     return new_offset # integer with new byte offset. The new offset may be before the requested offset
                     in case an exact seek is inconvenient.
@@ -1841,16 +3159,81 @@ class MPV(object):
                     Abort a running read() or seek() operation
                     ...
 
+            By default, open_fn runs synchronously inside libmpv's open call. If open_timeout (in seconds) or executor
+            (a concurrent.futures.Executor) is given, open_fn instead runs on executor, or on a thread pool shared by
+            this MPV instance. libmpv then gives up on opens taking longer than open_timeout with a "loading failed"
+            error. Stream objects of opens that were given up on are closed once open_fn returns. Use ``prefetch_stream``
+            to start opening an URI ahead of time, e.g. for the next playlist entry. Per-protocol open latency and
+            failure counts are available through ``stream_open_stats``.
+
+            If collect_stats is True, every call libmpv makes into the stream objects of this protocol is counted and
+            timed per URI. This includes read sizes, bytes served and time spent blocked in read(). See
+            ``stream_stats``. If given, on_stream_close is called with the URI and its statistics dict every time libmpv
+            closes a stream.
+
+            cache is an optional StreamBlockCache. If given, reads from seekable stream objects are served in blocks
+            from that cache, so repeated opens of the same URI (probing, looping, playlist revisits) only fetch each
+            block from open_fn's stream object once. Share one cache instance between protocols or MPV instances to
+            give them a common memory budget. Stream objects without a seek method are never cached.
+
+            loop is an optional asyncio event loop running in another thread. If given, open_fn may be a coroutine
+            function, and the read, seek and close methods of the stream object may be coroutine functions. These run on
+            loop while libmpv's stream thread waits for them. A read or seek that takes longer than read_timeout seconds
+            is cancelled and reported to libmpv as a read error. A cancel from libmpv cancels the running coroutine.
+
         """
 
         def decorator(open_fn):
+            if proto in self._stream_protocol_cbs:
+                raise KeyError('Stream protocol already registered')
+            open_stats = self._stream_open_stats[proto] = StreamOpenStats()
+
+            def open_frontend(uri):
+                frontend = open_fn(uri)
+                if inspect.isawaitable(frontend):
+                    if loop is None:
+                        raise TypeError('An event loop must be given to register_stream_protocol to use an async open_fn')
+                    frontend = asyncio.run_coroutine_threadsafe(_await(frontend), loop).result()
+
+                if loop is not None and AsyncStream.is_async(frontend):
+                    frontend = AsyncStream(frontend, loop, read_timeout)
+
+                if cache is not None and hasattr(frontend, 'seek'):
+                    frontend = CachedStream(frontend, uri, cache)
+                return frontend
+
+            def submit_open(uri):
+                return (executor or self._get_stream_open_executor()).submit(open_frontend, uri)
+            self._stream_openers[proto] = submit_open
+
             @StreamOpenFn
             def open_backend(_userdata, uri, cb_info):
+                start = time.perf_counter()
+                fut = self._pop_stream_prefetch(uri.decode('utf-8'))
+                prefetched = fut is not None
                 try:
-                    frontend = open_fn(uri.decode('utf-8'))
+                    if fut is None and (executor is not None or open_timeout is not None):
+                        fut = submit_open(uri.decode('utf-8'))
+
+                    if fut is None:
+                        frontend = open_frontend(uri.decode('utf-8'))
+                    else:
+                        try:
+                            frontend = fut.result(open_timeout)
+                        except concurrent.futures.TimeoutError:
+                            # On python 3.11+, this is the builtin TimeoutError, which open_fn itself may have raised.
+                            if fut.done():
+                                raise
+                            # Close the stream object once the open we gave up on finishes
+                            fut.add_done_callback(_close_abandoned_stream)
+                            open_stats.record(start, prefetched, timeout=True)
+                            return ErrorCode.LOADING_FAILED
+
                 except ValueError:
+                    open_stats.record(start, prefetched, failed=True)
                     return ErrorCode.LOADING_FAILED
                 except Exception as e:
+                    open_stats.record(start, prefetched, failed=True)
                     for fut in self._exception_futures:
                         try:
                             fut.set_exception(e)
@@ -1858,25 +3241,41 @@ class MPV(object):
                         except InvalidStateError:
                             pass
                     else:
-                        warnings.warn(f'Unhandled exception {e} inside stream open callback for URI {uri}\n{traceback.format_exc()}')
+                        warn(f'Unhandled exception {e} inside stream open callback for URI {uri}\n{traceback.format_exc()}')
                     return ErrorCode.LOADING_FAILED
+                open_stats.record(start, prefetched)
+
+                io_stats = None
+                instrument = lambda _kind, fn: fn
+                if collect_stats:
+                    io_stats = self._get_stream_io_stats(uri.decode('utf-8'))
+                    io_stats.record('open', time.perf_counter() - start)
+                    instrument = io_stats.instrument
 
                 cb_info.contents.cookie = None
 
+                readinto = getattr(frontend, 'readinto', None)
                 def read_backend(_userdata, buf, bufsize):
                     with self._enqueue_exceptions():
+                        if readinto is not None:
+                            return readinto(memoryview((c_ubyte * bufsize).from_address(addressof(buf.contents))).cast('B'))
                         data = frontend.read(bufsize)
-                        for i in range(len(data)):
-                            buf[i] = data[i]
+                        memmove(buf, data, len(data))
                         return len(data)
                     return -1
-                read = cb_info.contents.read = StreamReadFn(read_backend)
+                read = cb_info.contents.read = StreamReadFn(instrument('read', read_backend))
 
                 def close_backend(_userdata):
+                    close_start = time.perf_counter()
                     with self._enqueue_exceptions():
                         del self._stream_protocol_frontends[proto][uri]
                         if hasattr(frontend, 'close'):
                             frontend.close()
+                    if io_stats is not None:
+                        io_stats.record('close', time.perf_counter() - close_start)
+                        if on_stream_close is not None:
+                            with self._enqueue_exceptions():
+                                on_stream_close(uri.decode('utf-8'), io_stats.as_dict())
                 close = cb_info.contents.close = StreamCloseFn(close_backend)
 
                 seek, size, cancel = None, None, None
@@ -1886,28 +3285,26 @@ class MPV(object):
                         with self._enqueue_exceptions():
                             return frontend.seek(offx)
                         return ErrorCode.GENERIC
-                    seek = cb_info.contents.seek = StreamSeekFn(seek_backend)
+                    seek = cb_info.contents.seek = StreamSeekFn(instrument('seek', seek_backend))
 
                 if hasattr(frontend, 'size') and frontend.size is not None:
                     def size_backend(_userdata):
                         with self._enqueue_exceptions():
                             return frontend.size
                         return 0
-                    size = cb_info.contents.size = StreamSizeFn(size_backend)
+                    size = cb_info.contents.size = StreamSizeFn(instrument('size', size_backend))
 
                 if hasattr(frontend, 'cancel'):
                     def cancel_backend(_userdata):
                         with self._enqueue_exceptions():
                             frontend.cancel()
-                    cancel = cb_info.contents.cancel = StreamCancelFn(cancel_backend)
+                    cancel = cb_info.contents.cancel = StreamCancelFn(instrument('cancel', cancel_backend))
 
                 # keep frontend and callbacks in memory until closed
                 frontend._registered_callbacks = [read, close, seek, size, cancel]
                 self._stream_protocol_frontends[proto][uri] = frontend
                 return 0
 
-            if proto in self._stream_protocol_cbs:
-                raise KeyError('Stream protocol already registered')
             # keep backend in memory forever
             self._stream_protocol_cbs[proto] = [open_backend]
             _mpv_stream_cb_add_ro(self.handle, proto.encode('utf-8'), c_void_p(), open_backend)
@@ -1918,6 +3315,72 @@ class MPV(object):
             decorator(open_fn)
         return decorator
 
+    def _get_stream_open_executor(self):
+        with self._event_handler_lock:
+            if self._stream_open_executor is None:
+                self._stream_open_executor = concurrent.futures.ThreadPoolExecutor(
+                        thread_name_prefix='MPVStreamOpenThread')
+            return self._stream_open_executor
+
+    def prefetch_stream(self, uri, expire=60):
+        """Start opening the given URI of a custom stream protocol in the background. The next time libmpv opens this
+        URI, it gets the prefetched stream object instead of calling the protocol's open_fn again. This allows opening
+        e.g. the next playlist entry while the current one is playing. Returns a concurrent.futures.Future that
+        resolves to the stream object.
+
+        Prefetching an URI again before libmpv opened it closes the previously prefetched stream object. Prefetched
+        stream objects that libmpv did not open within ``expire`` seconds are closed and discarded on the next stream
+        open or prefetch, and any left over are closed by terminate(). Pass ``expire=None`` to never expire them.
+        """
+        proto, sep, _rest = uri.partition('://')
+        if not sep or proto not in self._stream_openers:
+            raise ValueError(f'No stream protocol registered for URI {uri}')
+        fut = self._stream_openers[proto](uri)
+        deadline = None if expire is None else time.monotonic() + expire
+        with self._stream_prefetch_lock:
+            old = self._stream_prefetches.pop(uri, None)
+            self._stream_prefetches[uri] = fut, deadline
+        if old is not None:
+            old[0].add_done_callback(_close_abandoned_stream)
+        self._drop_stream_prefetches(expired_only=True)
+        return fut
+
+    def _pop_stream_prefetch(self, uri):
+        self._drop_stream_prefetches(expired_only=True)
+        with self._stream_prefetch_lock:
+            fut, _deadline = self._stream_prefetches.pop(uri, (None, None))
+        return fut
+
+    def _drop_stream_prefetches(self, expired_only=False):
+        now = time.monotonic()
+        with self._stream_prefetch_lock:
+            dropped = [ uri for uri, (_fut, deadline) in self._stream_prefetches.items()
+                    if not expired_only or (deadline is not None and deadline < now) ]
+            dropped = [ self._stream_prefetches.pop(uri)[0] for uri in dropped ]
+        for fut in dropped:
+            fut.add_done_callback(_close_abandoned_stream)
+
+    def _get_stream_io_stats(self, uri):
+        with self._event_handler_lock:
+            if uri not in self._stream_io_stats:
+                self._stream_io_stats[uri] = StreamIOStats()
+            return self._stream_io_stats[uri]
+
+    def stream_stats(self, uri=None):
+        """Return I/O statistics of custom protocol streams registered with ``collect_stats=True`` as a dict, either
+        for the given URI or for all URIs as a dict mapping URIs to statistics. Statistics are accumulated over all
+        times libmpv opened a URI. See ``StreamIOStats.as_dict`` for the format."""
+        if uri is not None:
+            return self._stream_io_stats[uri].as_dict()
+        return {uri: stats.as_dict() for uri, stats in list(self._stream_io_stats.items())}
+
+    def stream_open_stats(self, proto=None):
+        """Return open latency and failure statistics for the given custom stream protocol as a dict, or a dict
+        mapping each protocol to its statistics if proto is None. Latencies are in seconds."""
+        if proto is not None:
+            return self._stream_open_stats[proto].as_dict()
+        return {proto: stats.as_dict() for proto, stats in self._stream_open_stats.items()}
+
     # Convenience functions
     def play(self, filename):
         """Play a path or URL (requires ``ytdl`` option to be set)."""
@@ -1942,16 +3405,21 @@ class MPV(object):
         name, = re.fullmatch('python://(.*)', uri).groups()
 
         if name in self._python_streams:
-            generator_fun, size = self._python_streams[name]
+            generator_fun, size, loop, read_timeout = self._python_streams[name]
         else:
             if self._python_stream_catchall is not None:
                 generator_fun, size = self._python_stream_catchall(name)
+                loop, read_timeout = self._python_stream_catchall.loop, self._python_stream_catchall.read_timeout
             else:
                 raise ValueError('Python stream name not found and no catch-all defined')
 
+        if inspect.isasyncgenfunction(generator_fun):
+            if loop is None:
+                raise TypeError('An event loop must be given to use async generators as python streams')
+            return AsyncGeneratorStream(generator_fun, loop, size, read_timeout)
         return GeneratorStream(generator_fun, size)
 
-    def python_stream(self, name=None, size=None):
+    def python_stream(self, name=None, size=None, loop=None, read_timeout=None):
         """Register a generator for the python stream with the given name.
 
         name is the name, i.e. the part after the "python://" in the URI, that this generator is registered as.
@@ -1969,6 +3437,10 @@ class MPV(object):
 
         The generator may be called multiple times if libmpv seeks or loops.
 
+        The generator may also be an async generator. In that case, pass the asyncio event loop it should run on as
+        loop. loop must be running in another thread. read_timeout is the number of seconds libmpv waits for the next
+        chunk before giving up with a read error.
+
         See also: @mpv.python_stream_catchall
 
         @mpv.python_stream('foobar')
@@ -1986,8 +3458,10 @@ class MPV(object):
 
             if name in self._python_streams:
                 raise KeyError('Python stream name "{}" is already registered'.format(name))
+            if inspect.isasyncgenfunction(cb) and loop is None:
+                raise ValueError('An event loop must be given to use async generators as python streams')
 
-            self._python_streams[name] = (cb, size)
+            self._python_streams[name] = (cb, size, loop, read_timeout)
             def unregister():
                 if name not in self._python_streams or\
                         self._python_streams[name][0] is not cb: # This is just a basic sanity check
@@ -2046,12 +3520,15 @@ class MPV(object):
 
         self.play(reader.stream_uri)
 
-    def python_stream_catchall(self, cb):
+    def python_stream_catchall(self, cb=None, *, loop=None, read_timeout=None):
         """ Register a catch-all python stream to be called when no name matches can be found. Use this decorator on a
         function that takes a name argument and returns a (generator, size) tuple (with size being None if unknown).
 
         An invalid URI can be signalled to libmpv by raising a ValueError inside the callback.
 
+        To return async generators from the catch-all, use this decorator with a loop argument as in
+        ``@mpv.python_stream_catchall(loop=loop, read_timeout=5)``. See ``python_stream`` for details.
+
         See also: @mpv.python_stream(name, size)
 
         @mpv.python_stream_catchall
@@ -2071,9 +3548,13 @@ class MPV(object):
         mpv.wait_for_playback()
         catchall.unregister()
         """
+        if cb is None:
+            return partial(self.python_stream_catchall, loop=loop, read_timeout=read_timeout)
+
         if self._python_stream_catchall is not None:
             raise KeyError('A catch-all python stream is already registered')
 
+        cb.loop, cb.read_timeout = loop, read_timeout
         self._python_stream_catchall = cb
         def unregister():
             if self._python_stream_catchall is not cb:
@@ -2082,6 +3563,31 @@ class MPV(object):
         cb.unregister = unregister
         return cb
 
+    def register_mmap_stream(self, name, path_or_fd, offset=0, length=None):
+        """Make a file or a byte range within a file playable through a memory mapping, and return its mmapfile://
+        URI. See ``MmapStream`` for the arguments. A new mapping is created each time libmpv opens the URI.
+
+        uri = player.register_mmap_stream('intro', 'assets.pak', offset=4096, length=1048576)
+        player.play(uri)
+        """
+        if name in self._mmap_streams:
+            raise KeyError('mmap stream name "{}" is already registered'.format(name))
+        if 'mmapfile' not in self._stream_protocol_cbs:
+            self.register_stream_protocol('mmapfile', self._mmap_stream_open)
+        self._mmap_streams[name] = (path_or_fd, offset, length)
+        return f'mmapfile://{name}'
+
+    def unregister_mmap_stream(self, name):
+        """Unregister an mmap stream registered through ``register_mmap_stream``. Streams libmpv already opened stay
+        valid until libmpv closes them."""
+        del self._mmap_streams[name]
+
+    def _mmap_stream_open(self, uri):
+        name, = re.fullmatch('mmapfile://(.*)', uri).groups()
+        if name not in self._mmap_streams:
+            raise ValueError('mmap stream name not found')
+        return MmapStream(*self._mmap_streams[name])
+
     # Property accessors
     def _get_property(self, name, decoder=strict_decoder, fmt=MpvFormat.NODE):
         self.check_core_alive()
@@ -2089,19 +3595,27 @@ class MPV(object):
         try:
             cval = _mpv_get_property(self.handle, name.encode('utf-8'), fmt, out)
 
-            if fmt is MpvFormat.OSD_STRING:
-                return cast(out, POINTER(c_char_p)).contents.value.decode('utf-8')
+            if fmt is MpvFormat.OSD_STRING or fmt is MpvFormat.STRING:
+                ptr = cast(out, POINTER(c_void_p)).contents.value
+                rv = string_at(ptr).decode('utf-8')
+                _mpv_free(ptr)
+                return rv
             elif fmt is MpvFormat.NODE:
                 rv = cast(out, POINTER(MpvNode)).contents.node_value(decoder=decoder)
                 _mpv_free_node_contents(out)
                 return rv
             else:
-                raise TypeError('_get_property only supports NODE and OSD_STRING formats.')
+                raise TypeError('_get_property only supports NODE, STRING and OSD_STRING formats.')
         except PropertyUnavailableError as ex:
             return None
 
     def _set_property(self, name, value):
         self.check_core_alive()
+        if self._property_baseline is not None and name not in self._property_baseline:
+            try:
+                self._property_baseline[name] = self._get_property(name, lazy_decoder)
+            except Exception:
+                self._property_baseline[name] = None
         ename = name.encode('utf-8')
         if isinstance(value, dict):
             _1, _2, _3, pointer = _make_node_str_map(value)
@@ -2154,6 +3668,1139 @@ class MPV(object):
             return None
 
 
+class MPVPool:
+    """Pool of pre-initialized MPV instances, taking the cost of creating and initializing an instance off the latency
+    path of starting a session.
+
+    pool = mpv.MPVPool(size=4, vo='null', ttl=3600)
+    with pool.player() as player:
+        player.play('video.mkv')
+        player.wait_for_playback()
+
+    A background thread keeps size idle instances ready. If none is ready, ``acquire`` creates a new instance on the
+    spot, unless max_size instances exist already, in which case it waits for one to be released. Extra keyword
+    arguments are passed to the MPV constructor, or pass factory to create instances some other way.
+
+    On ``release``, an instance is reset to a clean state: playback is stopped and the playlist cleared, all
+    properties that were set while the instance was acquired are restored to their previous values, all options are
+    restored to the values they had when the instance was created, and all property observers, event callbacks,
+    message handlers, key bindings, overlays, OSD scenes, pending stream prefetches and python streams are removed.
+    Instances that fail to reset are terminated.
+
+    Instances older than ttl seconds are terminated instead of being returned to the pool. Idle instances in excess of
+    size are terminated after max_idle seconds.
+    """
+
+    def __init__(self, size=2, max_size=None, ttl=None, max_idle=60, factory=None, **mpv_options):
+        self.size, self.max_size, self.ttl, self.max_idle = size, max_size, ttl, max_idle
+        self._factory = factory or partial(MPV, **mpv_options)
+        self._cond = threading.Condition()
+        self._idle = collections.deque() # (player, release time), most recently released first
+        self._created = {}
+        self._option_baselines = {}
+        self._pending = 0
+        self._closed = False
+        self._stats = collections.Counter()
+        self._acquire_time = 0.0
+        self._thread = threading.Thread(target=self._maintain, name='MPVPoolThread', daemon=True)
+        self._thread.start()
+
+    def _count(self):
+        return len(self._created) + self._pending
+
+    def _create(self):
+        # Called with self._cond held. Returns with it held again.
+        self._pending += 1
+        self._cond.release()
+        try:
+            player = self._factory()
+            try:
+                options = self._option_values(player)
+            except:
+                player.terminate()
+                raise
+        finally:
+            self._cond.acquire()
+            self._pending -= 1
+        self._created[player] = time.monotonic()
+        self._option_baselines[player] = options
+        self._stats['created'] += 1
+        return player
+
+    def _terminate(self, player, reason):
+        # Called without self._cond held.
+        with self._cond:
+            del self._created[player]
+            del self._option_baselines[player]
+            self._stats[reason] += 1
+            self._cond.notify_all()
+        player.terminate()
+
+    def _expired(self, player, now):
+        return self.ttl is not None and now - self._created[player] > self.ttl
+
+    def _maintain(self):
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                evict = [entry for i, entry in enumerate(self._idle) if self._expired(entry[0], now) or
+                        (i >= self.size and self.max_idle is not None and now - entry[1] > self.max_idle)]
+                for entry in evict:
+                    self._idle.remove(entry)
+                if evict:
+                    self._cond.release()
+                    try:
+                        for player, _released in evict:
+                            self._terminate(player, 'evicted')
+                    finally:
+                        self._cond.acquire()
+                    continue
+
+                if len(self._idle) < self.size and (self.max_size is None or self._count() < self.max_size):
+                    try:
+                        player = self._create()
+                    except Exception as e:
+                        warn(f'Error creating pooled MPV instance: {e}\n{traceback.format_exc()}', RuntimeWarning)
+                        self._cond.wait(1)
+                        continue
+                    self._idle.append((player, time.monotonic()))
+                    self._cond.notify_all()
+                    continue
+
+                self._cond.wait(1 if self.ttl or self.max_idle else None)
+
+    def acquire(self, timeout=None):
+        """Take an instance from the pool, creating one if none is ready. Raises TimeoutError if max_size instances
+        exist and none is released within timeout."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError('MPVPool has been closed')
+                if self._idle:
+                    player, _released = self._idle.popleft()
+                    self._stats['hits'] += 1
+                    break
+                if self.max_size is None or self._count() < self.max_size:
+                    self._stats['misses'] += 1
+                    player = self._create()
+                    break
+                remaining = None if timeout is None else start + timeout - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f'No pooled MPV instance became available within {timeout}s')
+                self._cond.wait(remaining)
+            self._stats['acquired'] += 1
+            self._acquire_time += time.monotonic() - start
+            self._cond.notify_all() # Wake up the maintenance thread to refill the pool
+        player._property_baseline = {}
+        return player
+
+    def release(self, player):
+        """Reset an instance and return it to the pool."""
+        with self._cond:
+            self._stats['released'] += 1
+        if player.core_shutdown or self._closed or self._expired(player, time.monotonic()):
+            self._terminate(player, 'expired' if not player.core_shutdown else 'dead')
+            return
+        try:
+            self._reset(player)
+        except Exception as e:
+            warn(f'Error resetting pooled MPV instance, terminating it: {e}', RuntimeWarning)
+            self._terminate(player, 'reset_failures')
+            return
+        with self._cond:
+            self._idle.appendleft((player, time.monotonic()))
+            self._cond.notify_all()
+
+    @staticmethod
+    def _option_values(player):
+        values = {}
+        for name in player.options:
+            try:
+                values[name] = player._get_property('options/'+name, fmt=MpvFormat.STRING)
+            except Exception:
+                pass # Some options, e.g. deprecated aliases, cannot be read back
+        return values
+
+    def _reset(self, player):
+        baseline, player._property_baseline = player._property_baseline, None
+        player.stop()
+        player.playlist_clear()
+        for name, handlers in list(player._property_handlers.items()):
+            for handler in list(handlers):
+                player.unobserve_property(name, handler)
+        for binding_name in list(player._key_binding_handlers):
+            player.command('disable-section', binding_name)
+            player.command('define-section', binding_name, '')
+        player._key_binding_handlers.clear()
+        with player._callback_lock:
+            player._message_handlers = {}
+            player._event_callbacks = ()
+        # Remove overlays through their own remove() so e.g. FdOverlays free their memory, and compositors using several
+        # overlay IDs are removed only once.
+        for overlay in dict.fromkeys(list(player.overlays.values())):
+            overlay.remove()
+        for scene in list(player._osd_scenes):
+            scene.close()
+        player._drop_stream_prefetches()
+        for name in list(player._mmap_streams):
+            player.unregister_mmap_stream(name)
+        player._python_streams.clear()
+        player._python_stream_catchall = None
+        for name, value in (baseline or {}).items():
+            if value is not None:
+                player._set_property(name, value)
+        # This catches options changed through e.g. command('set', ...) or change-list, which bypass the baseline above.
+        # Options are compared and restored in their string form, which round-trips for all option types.
+        for name, value in self._option_values(player).items():
+            initial = self._option_baselines[player].get(name)
+            if initial is not None and value != initial:
+                _mpv_set_property_string(player.handle, ('options/'+name).encode('utf-8'), initial.encode('utf-8'))
+
+    @contextmanager
+    def player(self, timeout=None):
+        """Context manager acquiring an instance and releasing it afterwards."""
+        player = self.acquire(timeout)
+        try:
+            yield player
+        finally:
+            self.release(player)
+
+    def stats(self):
+        """Return a dict with pool statistics: the number of idle and in-use instances, the number of instances created
+        and terminated for each reason, the number of acquisitions served from the pool (hits) and by creating a new
+        instance (misses), and the mean time acquire took."""
+        with self._cond:
+            stats = {key: self._stats[key] for key in ('created', 'acquired', 'released', 'hits', 'misses',
+                    'expired', 'evicted', 'dead', 'reset_failures')}
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = len(self._created) - len(self._idle)
+            stats['mean_acquire_time'] = self._acquire_time / stats['acquired'] if stats['acquired'] else None
+            return stats
+
+    def close(self):
+        """Terminate all idle instances and stop the pool. Instances still in use are terminated on release."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, collections.deque()
+            self._cond.notify_all()
+        self._thread.join()
+        for player, _released in idle:
+            self._terminate(player, 'evicted')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _Standby:
+    def __init__(self, player):
+        self.player = player
+        self.index = None
+        self.state = 'idle' # idle -> loading -> started -> loaded -> ready
+        self.ready = threading.Event()
+        self.load_time = self.ready_time = None
+        self.seekable = None
+        # Playlist entry ID of the current load. Events of other entries, e.g. ones still queued from before the slot
+        # was recycled, are ignored. lock is held while loading so the entry ID is known before its events are handled.
+        self.entry_id = None
+        self.current_id = None
+        self.lock = threading.Lock()
+
+
+class HotStandbyPlayer:
+    """Play a playlist using several MPV instances, preloading upcoming items paused in standby instances so switching
+    items does not have to wait for opening, probing and decoding the next file.
+
+    player = mpv.HotStandbyPlayer(['a.mkv', 'b.mkv', 'c.mkv'], lookahead=1, loop=True, vo='gpu', fullscreen=True)
+    player.play()
+    ...
+    player.next()
+
+    lookahead is the number of items following the current one that are kept preloaded, each in its own instance. An
+    instance counts as ready once it has loaded its file and decoded the first frame (i.e. after mpv's
+    playback-restart event). When switching to a preloaded item, its instance is unpaused and the previous instance is
+    paused and recycled to preload the next upcoming item. If the standby instance is not ready yet, the switch waits
+    up to ready_timeout seconds for it. Items that have not been preloaded are loaded cold.
+
+    With auto_advance, the next item is played when the current one reaches its end. on_swap(new, old) is called
+    right after the new instance has been unpaused, e.g. to raise its window. Extra keyword arguments are passed to
+    the MPV constructor, or pass factory to create instances some other way.
+
+    ``stats`` returns how often the standby instance was ready in time.
+    """
+
+    def __init__(self, playlist=(), lookahead=1, loop=False, auto_advance=True, ready_timeout=5, on_swap=None,
+            factory=None, **mpv_options):
+        self.playlist = list(playlist)
+        self.lookahead, self.loop, self.auto_advance = lookahead, loop, auto_advance
+        self.ready_timeout, self.on_swap = ready_timeout, on_swap
+        self._factory = factory or partial(MPV, **mpv_options)
+        self._lock = threading.RLock()
+        self._slots = {} # player -> _Standby
+        self._active = None
+        self._standby = {} # playlist index -> _Standby
+        self._idle = []
+        self.index = None
+        self._stats = collections.Counter()
+        self._preload_times = collections.deque(maxlen=100)
+        self._switch_times = collections.deque(maxlen=100)
+        self._closed = False
+
+    def _new_slot(self):
+        if self._idle:
+            return self._idle.pop()
+        slot = _Standby(self._factory())
+        self._slots[slot.player] = slot
+        slot.player.register_event_callback(partial(self._on_event, slot))
+        slot.player.observe_property('seekable', partial(self._on_seekable, slot))
+        return slot
+
+    def _on_seekable(self, slot, _name, value):
+        slot.seekable = value
+
+    def _on_event(self, slot, event):
+        eid = event.event_id.value
+        with slot.lock:
+            if eid == MpvEventID.START_FILE:
+                slot.current_id = event.data.playlist_entry_id
+            current = slot.entry_id is not None and slot.current_id == slot.entry_id
+            if eid == MpvEventID.END_FILE:
+                current = current and event.data.playlist_entry_id == slot.entry_id
+                slot.current_id = None
+            if not current:
+                return
+            if eid == MpvEventID.START_FILE and slot.state == 'loading':
+                slot.state = 'started'
+            elif eid == MpvEventID.FILE_LOADED and slot.state == 'started':
+                slot.state = 'loaded'
+            elif eid == MpvEventID.PLAYBACK_RESTART and slot.state == 'loaded':
+                slot.state = 'ready'
+                slot.ready_time = time.perf_counter()
+                self._preload_times.append(slot.ready_time - slot.load_time)
+                slot.ready.set()
+        if eid == MpvEventID.END_FILE and event.data.reason == MpvEventEndFile.EOF and slot is self._active:
+            if self.auto_advance and not self._closed:
+                threading.Thread(target=self._advance, args=(slot,), name='MPVHotStandbyAdvance',
+                        daemon=True).start()
+
+    def _advance(self, slot):
+        with self._lock:
+            # Only advance if nothing else has switched items in the meantime
+            if slot is self._active and not self._closed and self._index_after(self.index) is not None:
+                self.next()
+
+    def _load(self, slot, index, pause):
+        with slot.lock:
+            slot.index = index
+            slot.state = 'loading'
+            slot.ready.clear()
+            slot.load_time, slot.ready_time = time.perf_counter(), None
+            slot.player.pause = pause
+            slot.player.loadfile(self.playlist[index])
+            # loadfile replaces the playlist with this one entry before it returns
+            slot.entry_id = slot.player._get_property('playlist/0/id')
+
+    def _release(self, slot):
+        with slot.lock:
+            slot.index, slot.state, slot.entry_id = None, 'idle', None
+            slot.ready.clear()
+        slot.player.pause = True
+        slot.player.stop()
+        self._idle.append(slot)
+
+    def _index_after(self, index, offset=1):
+        if not self.playlist:
+            return None
+        index += offset
+        if self.loop:
+            return index % len(self.playlist)
+        return index if 0 <= index < len(self.playlist) else None
+
+    def _wanted(self, index):
+        wanted = []
+        for offset in range(1, self.lookahead+1):
+            if (i := self._index_after(index, offset)) is not None and i != index and i not in wanted:
+                wanted.append(i)
+        return wanted
+
+    @property
+    def active(self):
+        """The MPV instance currently playing, or None."""
+        return self._active.player if self._active else None
+
+    def play(self, index=0):
+        """Switch to the given playlist index."""
+        if not 0 <= index < len(self.playlist):
+            raise IndexError(f'Playlist index {index} out of range')
+        with self._lock:
+            if self._closed:
+                raise ShutdownError('HotStandbyPlayer has been closed')
+            start = time.perf_counter()
+            wanted = self._wanted(index)
+            for i, slot in list(self._standby.items()):
+                if i != index and i not in wanted:
+                    self._release(self._standby.pop(i))
+
+            old, new = self._active, self._standby.pop(index, None)
+            if new is not None:
+                if new.ready.wait(self.ready_timeout):
+                    self._stats['ready'] += 1
+                else:
+                    self._stats['not_ready'] += 1
+                new.player.pause = False
+            else:
+                self._stats['cold'] += 1
+                new = self._new_slot()
+                self._load(new, index, pause=False)
+            self._active, self.index = new, index
+            self._stats['switches'] += 1
+
+            if self.on_swap is not None:
+                self.on_swap(new.player, old.player if old else None)
+            if old is not None:
+                self._release(old)
+            self._switch_times.append(time.perf_counter() - start)
+
+            for i in wanted:
+                if i not in self._standby:
+                    slot = self._standby[i] = self._new_slot()
+                    self._load(slot, i, pause=True)
+
+    def next(self):
+        """Switch to the next playlist item. Returns False if there is none."""
+        with self._lock:
+            if (index := self._index_after(-1 if self.index is None else self.index)) is None:
+                return False
+            self.play(index)
+            return True
+
+    def prev(self):
+        """Switch to the previous playlist item. Returns False if there is none."""
+        with self._lock:
+            if self.index is None or (index := self._index_after(self.index, -1)) is None:
+                return False
+            self.play(index)
+            return True
+
+    def stats(self):
+        """Return a dict with the number of switches, how many of those found their standby instance ready, not yet
+        ready or had to load cold, the fraction of switches that found their standby ready, and the mean preload and
+        switch times in seconds over the last 100 items."""
+        with self._lock:
+            stats = {key: self._stats[key] for key in ('switches', 'ready', 'not_ready', 'cold')}
+            stats['hit_rate'] = stats['ready'] / stats['switches'] if stats['switches'] else None
+            stats['mean_preload_time'] = sum(self._preload_times) / len(self._preload_times) if self._preload_times else None
+            stats['mean_switch_time'] = sum(self._switch_times) / len(self._switch_times) if self._switch_times else None
+            stats['players'] = len(self._slots)
+            return stats
+
+    def close(self):
+        """Terminate all instances."""
+        with self._lock:
+            self._closed = True
+            slots, self._slots = list(self._slots.values()), {}
+            self._active, self._standby, self._idle = None, {}, []
+        for slot in slots:
+            slot.player.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PlaybackClock:
+    """High-resolution playback position of an MPV instance that can be read without a blocking property fetch.
+
+    clock = mpv.PlaybackClock(player)
+    ...
+    position = clock.now() # e.g. from a UI redraw at 60 Hz
+
+    The clock observes ``time-pos``, ``speed``, ``pause`` and ``core-idle`` in native formats along with seek events,
+    and keeps an anchor of (mpv clock time, media position, rate) that is updated on every change. ``now`` extrapolates
+    from the anchor using ``time.monotonic``, without calling into libmpv. ``position_at`` does the same for a given
+    timestamp of mpv's clock (``MPV.get_time_us``), which is shared by all instances in a process.
+
+    The position does not advance while the core is idle, i.e. while paused, buffering or seeking. A seek freezes the
+    clock until playback restarts. A time-pos update that is more than discontinuity_threshold seconds off the
+    extrapolated position, e.g. at a timestamp jump in the file, replaces the anchor and is counted as a discontinuity.
+    All other updates are compared against the extrapolation to estimate the clock's error, see ``stats``.
+    ``now`` returns None while no file is playing.
+    """
+
+    def __init__(self, player, discontinuity_threshold=0.5, history_len=1000):
+        self.player = player
+        self.discontinuity_threshold = discontinuity_threshold
+        self.speed, self.paused, self.idle, self.seeking = 1.0, False, True, False
+        self.seek_latency = None
+        self._seek_start_us = None
+        self._anchor = None # (monotonic time, mpv time in us, position, rate)
+        self._lock = threading.Lock()
+        self.errors = collections.deque(maxlen=history_len)
+        self._stats = collections.Counter()
+        self._closed = False
+        player.observe_property('time-pos', self._on_time_pos, MpvFormat.DOUBLE)
+        player.observe_property('speed', self._on_speed, MpvFormat.DOUBLE)
+        player.observe_property('pause', self._on_pause, MpvFormat.FLAG)
+        player.observe_property('core-idle', self._on_idle, MpvFormat.FLAG)
+        player.register_event_callback(self._on_event)
+
+    def _rate(self):
+        return 0.0 if self.idle or self.seeking else self.speed
+
+    def _set_anchor(self, pos, now_us=None):
+        if now_us is None:
+            now_us = self.player.get_time_us()
+        self._anchor = None if pos is None else (time.monotonic(), now_us, pos, self._rate())
+
+    def _reanchor(self):
+        if (anchor := self._anchor) is not None:
+            now_us = self.player.get_time_us()
+            self._set_anchor(self._extrapolate(anchor, now_us), now_us)
+
+    @staticmethod
+    def _extrapolate(anchor, now_us):
+        _t, anchor_us, pos, rate = anchor
+        return pos + (now_us - anchor_us) / 1e6 * rate
+
+    def _on_time_pos(self, _name, value):
+        now_us = self.player.get_time_us()
+        with self._lock:
+            anchor = self._anchor
+            if value is not None and anchor is not None and not self.seeking:
+                error = self._extrapolate(anchor, now_us) - value
+                if abs(error) > self.discontinuity_threshold:
+                    self._stats['discontinuities'] += 1
+                else:
+                    self.errors.append(error)
+            self._stats['updates'] += 1
+            self._set_anchor(value, now_us)
+
+    def _on_speed(self, _name, value):
+        with self._lock:
+            self._reanchor()
+            self.speed = value or 1.0
+            self._reanchor()
+
+    def _on_pause(self, _name, value):
+        self.paused = bool(value)
+
+    def _on_idle(self, _name, value):
+        with self._lock:
+            self._reanchor()
+            self.idle = value is None or bool(value)
+            self._reanchor()
+
+    def _on_event(self, event):
+        eid = event.event_id.value
+        if eid == MpvEventID.SEEK:
+            with self._lock:
+                self._reanchor()
+                self.seeking = True
+                self._seek_start_us = self.player.get_time_us()
+                self._stats['seeks'] += 1
+                self._reanchor()
+        elif eid == MpvEventID.PLAYBACK_RESTART:
+            with self._lock:
+                # Playback resumes from where the seek left time-pos
+                now_us = self.player.get_time_us()
+                self.seeking = False
+                if self._seek_start_us is not None:
+                    self.seek_latency = (now_us - self._seek_start_us) / 1e6
+                    self._seek_start_us = None
+                if (anchor := self._anchor) is not None:
+                    self._set_anchor(anchor[2], now_us)
+        elif eid in (MpvEventID.START_FILE, MpvEventID.END_FILE):
+            with self._lock:
+                self._anchor = None
+
+    def now(self):
+        """Current playback position in seconds, or None if unknown."""
+        if (anchor := self._anchor) is None:
+            return None
+        t, _anchor_us, pos, rate = anchor
+        return pos + (time.monotonic() - t) * rate
+
+    def position_at(self, time_us):
+        """Playback position in seconds at the given mpv clock timestamp, or None if unknown."""
+        if (anchor := self._anchor) is None:
+            return None
+        return self._extrapolate(anchor, time_us)
+
+    def stats(self):
+        """Return a dict with the number of time-pos updates, seeks and discontinuities seen, the last measured seek
+        latency, and the mean absolute, RMS and maximum absolute difference in seconds between the extrapolated
+        position and the observed time-pos over the recorded history."""
+        with self._lock:
+            errors = list(self.errors)
+            stats = {key: self._stats[key] for key in ('updates', 'seeks', 'discontinuities')}
+        n = len(errors)
+        stats['seek_latency'] = self.seek_latency
+        stats['mean_abs_error'] = sum(map(abs, errors)) / n if n else None
+        stats['rms_error'] = math.sqrt(sum(e*e for e in errors) / n) if n else None
+        stats['max_abs_error'] = max(map(abs, errors)) if n else None
+        return stats
+
+    def close(self):
+        """Remove the clock's property observers and event callback."""
+        if self._closed:
+            return
+        self._closed = True
+        self.player.unobserve_property('time-pos', self._on_time_pos)
+        self.player.unobserve_property('speed', self._on_speed)
+        self.player.unobserve_property('pause', self._on_pause)
+        self.player.unobserve_property('core-idle', self._on_idle)
+        self.player.unregister_event_callback(self._on_event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SyncGroup:
+    """Keep the playback of several MPV instances in this process aligned to a master instance, e.g. for video walls.
+
+    players = [mpv.MPV(vo='gpu', screen=i) for i in range(4)]
+    for player in players:
+        player.play('wall.mkv')
+    with mpv.SyncGroup(players):
+        players[0].wait_for_playback()
+
+    Each member's playback position is tracked by a PlaybackClock, anchored to mpv's clock (``MPV.get_time_us``), so
+    all members' positions can be extrapolated to the same instant. Every
+    interval seconds, each follower's offset from the master is computed. Offsets within deadband seconds are left
+    alone. Larger offsets are corrected smoothly by adjusting the follower's speed relative to the master's by up to
+    max_speed_adjust, in proportion to the offset times gain. Only offsets beyond seek_threshold seconds cause a hard
+    seek, which aims ahead by the follower's last observed seek latency. Followers are paused and unpaused along with the
+    master.
+
+    ``stats`` returns per-member offset statistics.
+    """
+
+    def __init__(self, players, master=None, interval=0.1, gain=0.5, max_speed_adjust=0.05, deadband=0.005,
+            seek_threshold=0.25, history_len=600):
+        players = list(players)
+        if master is None:
+            master = players[0]
+        elif master not in players:
+            players.insert(0, master)
+        self.master = master
+        self.interval, self.gain, self.max_speed_adjust = interval, gain, max_speed_adjust
+        self.deadband, self.seek_threshold = deadband, seek_threshold
+        self._clocks = dict.fromkeys(players)
+        self._offsets = {player: collections.deque(maxlen=history_len) for player in players}
+        self._seeks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.exception = None
+
+    @property
+    def players(self):
+        return list(self._clocks)
+
+    def start(self):
+        """Start the synchronization thread. Returns self."""
+        if self._thread is not None:
+            raise RuntimeError('SyncGroup is already running')
+        for player in self._clocks:
+            self._clocks[player] = PlaybackClock(player)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='MPVSyncGroupThread', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                self.correct()
+        except ShutdownError:
+            pass
+        except Exception as e:
+            self.exception = e
+
+    def correct(self):
+        """Run one round of drift correction. This is called periodically by the synchronization thread."""
+        master = self._clocks[self.master]
+        now = self.master.get_time_us()
+        if master.seeking or (ref := master.position_at(now)) is None:
+            return
+
+        for player, clock in self._clocks.items():
+            if player is self.master:
+                continue
+            if clock.paused != master.paused:
+                player.pause = master.paused
+            if clock.seeking or (pos := clock.position_at(now)) is None:
+                continue
+
+            offset = pos - ref
+            self._offsets[player].append(offset)
+            if master.paused:
+                continue
+
+            if abs(offset) > self.seek_threshold:
+                self._seeks[player] += 1
+                target = ref + (clock.seek_latency or 0) * master.speed
+                player.command_async('seek', target, 'absolute', 'exact')
+                speed = master.speed
+            elif abs(offset) < self.deadband:
+                speed = master.speed
+            else:
+                adjust = min(self.max_speed_adjust, max(-self.max_speed_adjust, offset * self.gain))
+                speed = master.speed * (1 - adjust)
+            if abs(speed - clock.speed) > 1e-6:
+                player.speed = speed
+
+    def stats(self):
+        """Return a dict mapping each member to a dict containing its last offset from the master and the mean absolute,
+        RMS and maximum absolute offset in seconds over the recorded history, the number of hard seeks and its current
+        speed."""
+        stats = {}
+        for player, clock in self._clocks.items():
+            offsets = list(self._offsets[player])
+            n = len(offsets)
+            stats[player] = {
+                'offset': offsets[-1] if offsets else None,
+                'mean_abs_offset': sum(map(abs, offsets)) / n if n else None,
+                'rms_offset': math.sqrt(sum(o*o for o in offsets) / n) if n else None,
+                'max_abs_offset': max(map(abs, offsets)) if n else None,
+                'seeks': self._seeks[player],
+                'speed': clock.speed if clock else player.speed}
+        return stats
+
+    def stop(self):
+        """Stop the synchronization thread, remove all observers and reset the followers' speed to the master's."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        master_speed = self._clocks[self.master].speed
+        for player, clock in self._clocks.items():
+            self._clocks[player] = None
+            try:
+                clock.close()
+                if player is not self.master:
+                    player.speed = master_speed
+            except ShutdownError:
+                pass
+        if (ex := self.exception) is not None:
+            self.exception = None
+            raise ex
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def _farm_error(error):
+    """Make an exception raised in an MPVFarm worker safe to pickle. Exceptions from libmpv calls carry the ctypes
+    arguments of the failed call, which cannot be pickled, so only keep plain arguments such as the message and error
+    code."""
+    if error is None:
+        return None
+    try:
+        error = type(error)(*[arg for arg in error.args if isinstance(arg, (str, int, float))])
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f'{type(error).__name__}: {error}')
+
+def _farm_worker_main(conn):
+    """Main function of an MPVFarm worker process."""
+    players = {}
+    out = queue.SimpleQueue()
+
+    def send(batch):
+        try:
+            conn.send(batch)
+        except OSError:
+            raise
+        except Exception:
+            # Some message could not be pickled. Send the others, so one bad message does not kill the sender.
+            for msg in batch:
+                try:
+                    conn.send([msg])
+                except OSError:
+                    raise
+                except Exception as e:
+                    if msg[0] == 'result':
+                        conn.send([('result', msg[1], RuntimeError(f'Cannot send result: {e}'), None)])
+                    else:
+                        warn(f'Cannot send mpv farm message {msg[0]}: {e}', RuntimeWarning)
+
+    def sender():
+        # Batch up all messages that have queued up while the last batch was being sent.
+        while (msg := out.get()) is not None:
+            batch = [msg]
+            try:
+                while (msg := out.get_nowait()) is not None:
+                    batch.append(msg)
+            except queue.Empty:
+                pass
+            try:
+                send(batch)
+            except OSError:
+                break
+            if msg is None:
+                break
+    sender_thread = threading.Thread(target=sender, name='MPVFarmSender', daemon=True)
+    sender_thread.start()
+
+    def reply(req_id, error=None, value=None):
+        out.put(('result', req_id, _farm_error(error), value))
+
+    def noop(_name, _value):
+        pass
+
+    def run(pid, req_id, op, args):
+        if op == 'create':
+            options, = args
+            player = players[pid] = MPV(**options)
+            player.register_event_callback(lambda event: out.put(('event', pid, event.as_dict(decoder=lazy_decoder))))
+            return reply(req_id)
+
+        player = players[pid]
+        if op == 'command':
+            cmd_args, kwargs = args
+            player.command_async(*cmd_args, **kwargs, callback=lambda error, value: reply(req_id, error, value))
+        elif op == 'get_property':
+            reply(req_id, value=player._get_property(*args, decoder=lazy_decoder))
+        elif op == 'set_property':
+            reply(req_id, value=player._set_property(*args))
+        elif op == 'observe_property':
+            reply(req_id, value=player.observe_property(*args, noop))
+        elif op == 'unobserve_property':
+            reply(req_id, value=player.unobserve_property(*args, noop))
+        elif op == 'terminate':
+            del players[pid]
+            def terminate():
+                player.terminate()
+                reply(req_id)
+            threading.Thread(target=terminate, daemon=True).start()
+        else:
+            raise ValueError(f'Unknown op {op}')
+
+    try:
+        while True:
+            try:
+                batch = conn.recv()
+            except EOFError:
+                break
+            if batch is None:
+                break
+            for pid, req_id, op, args in batch:
+                try:
+                    run(pid, req_id, op, args)
+                except Exception as e:
+                    reply(req_id, e)
+    finally:
+        for player in players.values():
+            player.terminate()
+        out.put(None)
+        sender_thread.join()
+
+
+class _FarmWorker:
+    def __init__(self, farm, index):
+        self.farm, self.index = farm, index
+        self.players = {}
+        self.alive = True # Cleared under the farm's lock once the worker has died or is being closed
+        self._closing = False
+        self._out = queue.SimpleQueue()
+        conn, child_conn = farm._mp.Pipe()
+        self.process = farm._mp.Process(target=_farm_worker_main, args=(child_conn,), daemon=True,
+                name=f'MPVFarmWorker-{index}')
+        self.process.start()
+        child_conn.close()
+        self._conn = conn
+        self._reader = threading.Thread(target=self._read, name=f'MPVFarmReader-{index}', daemon=True)
+        self._reader.start()
+        self._sender = threading.Thread(target=self._send, name=f'MPVFarmSender-{index}', daemon=True)
+        self._sender.start()
+
+    def send(self, msg):
+        self._out.put(msg)
+
+    def _send(self):
+        while (msg := self._out.get()) is not None:
+            batch = [msg]
+            try:
+                while (msg := self._out.get_nowait()) is not None:
+                    batch.append(msg)
+            except queue.Empty:
+                pass
+            try:
+                self._conn.send(batch)
+            except OSError:
+                return
+            if msg is None:
+                break
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+
+    def _read(self):
+        farm = self.farm
+        try:
+            while True:
+                for msg in self._conn.recv():
+                    if msg[0] == 'result':
+                        _, req_id, error, value = msg
+                        fut = farm._pop_future(req_id)
+                        if fut is not None:
+                            if error is not None:
+                                fut.set_exception(error)
+                            else:
+                                fut.set_result(value)
+                    else:
+                        _, pid, event = msg
+                        if (player := self.players.get(pid)) is not None:
+                            player._handle_event(event)
+        except (EOFError, OSError):
+            pass
+        if not self._closing:
+            farm._worker_died(self)
+
+    def close(self):
+        self._closing = True
+        self._out.put(None)
+        self.process.join(10)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class FarmMPV(RemoteMPVBase):
+    """Proxy for an mpv instance running in a worker process of an MPVFarm. Create using ``MPVFarm.create``. See
+    RemoteMPVBase for the supported API."""
+
+    def __init__(self, farm, worker, pid, timeout=None):
+        super().__init__(timeout)
+        self._farm, self._worker, self._pid = farm, worker, pid
+
+    def _request(self, op, *args):
+        if self._core_shutdown and op != 'terminate':
+            raise ShutdownError('libmpv core has been shutdown')
+        return self._farm._submit(self._worker, self._pid, op, args)
+
+    @property
+    def worker(self):
+        """Index of the worker process this instance is running in."""
+        return self._worker.index
+
+    def terminate(self):
+        """Terminate the remote instance."""
+        if self._worker.players.pop(self._pid, None) is not None and not self._core_shutdown:
+            self._request('terminate').result(self._timeout)
+        self._core_shutdown = True
+
+
+class MPVFarm:
+    """Run mpv instances in a pool of worker processes, so their python-side handler code does not compete for a
+    single GIL and a crashing libmpv instance cannot take down the main process.
+
+    with mpv.MPVFarm(workers=4) as farm:
+        player = farm.create(vo='null')
+        player.observe_property('time-pos', print)
+        player.play('video.mkv')
+        player.wait_for_playback()
+
+    ``create`` returns a FarmMPV proxy placed on the worker running the fewest instances. Commands, property accesses
+    and events are multiplexed over one pipe per worker, and all messages queued up while a batch is being sent go out
+    together in the next batch. Property observers and event callbacks run on the main process' reader thread of the
+    instance's worker.
+
+    When a worker process dies, all instances on it receive a shutdown event, pending requests fail with ShutdownError,
+    and the worker is restarted if restart is True. default_options are passed to every instance created.
+    """
+
+    def __init__(self, workers=None, restart=True, timeout=None, **default_options):
+        import multiprocessing
+        self._mp = multiprocessing.get_context('spawn')
+        self.restart, self.timeout, self.default_options = restart, timeout, default_options
+        self._lock = threading.Lock()
+        self._closed = False
+        self._futures = {}
+        self._ids = itertools.count()
+        self.restarts = 0
+        self._workers = [_FarmWorker(self, i) for i in range(workers or os.cpu_count() or 1)]
+
+    def _submit(self, worker, pid, op, args):
+        fut = Future()
+        req_id = next(self._ids)
+        with self._lock:
+            # Checked under the lock, so every future registered here is failed by _worker_died or close if the worker
+            # goes away before replying.
+            if not worker.alive:
+                raise ShutdownError(f'mpv farm worker {worker.index} is not running')
+            self._futures[req_id] = (fut, worker)
+        worker.send((pid, req_id, op, args))
+        return fut
+
+    def _fail_futures(self, worker=None):
+        # Called with self._lock held
+        failed = [req_id for req_id, (_fut, w) in self._futures.items() if worker is None or w is worker]
+        return [self._futures.pop(req_id)[0] for req_id in failed]
+
+    def _pop_future(self, req_id):
+        with self._lock:
+            fut, _worker = self._futures.pop(req_id, (None, None))
+        return fut
+
+    def _worker_died(self, worker):
+        with self._lock:
+            worker.alive = False
+            futures = self._fail_futures(worker)
+            restart = self.restart and not self._closed and self._workers[worker.index] is worker
+        for fut in futures:
+            fut.set_exception(ShutdownError(f'mpv farm worker {worker.index} died'))
+        players = list(worker.players.values())
+        worker.players.clear()
+        for player in players:
+            player._handle_event({'event': 'shutdown'})
+
+        if restart:
+            # Starting a process takes a while, so do not hold the lock meanwhile.
+            replacement = _FarmWorker(self, worker.index)
+            with self._lock:
+                if not self._closed and self._workers[worker.index] is worker:
+                    self._workers[worker.index] = replacement
+                    self.restarts += 1
+                    replacement = None
+            if replacement is not None:
+                replacement.close()
+
+    def create(self, **options):
+        """Create an mpv instance on the least loaded worker and return a FarmMPV proxy for it."""
+        with self._lock:
+            workers = [w for w in self._workers if w.alive]
+            if not workers:
+                raise ShutdownError('No mpv farm workers are running')
+            worker = min(workers, key=lambda w: len(w.players))
+        pid = next(self._ids)
+        player = FarmMPV(self, worker, pid, self.timeout)
+        worker.players[pid] = player
+        try:
+            self._submit(worker, pid, 'create', ({**self.default_options, **options},)).result(self.timeout)
+        except:
+            del worker.players[pid]
+            raise
+        return player
+
+    def stats(self):
+        """Return a dict with the number of instances on each worker, the workers' process IDs and the number of worker
+        restarts."""
+        with self._lock:
+            return {'players': [len(w.players) for w in self._workers],
+                    'pids': [w.process.pid for w in self._workers],
+                    'restarts': self.restarts}
+
+    def close(self):
+        """Terminate all instances and worker processes. Pending requests fail with ShutdownError."""
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+            for worker in workers:
+                worker.alive = False
+        for worker in workers:
+            worker.close()
+        with self._lock:
+            futures = self._fail_futures()
+        for fut in futures:
+            fut.set_exception(ShutdownError('mpv farm has been closed'))
+        for worker in workers:
+            players = list(worker.players.values())
+            worker.players.clear()
+            for player in players:
+                player._handle_event({'event': 'shutdown'})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SoftwareRenderBuffer:
+    """Target surface for libmpv's software renderer (``MpvRenderContext(player, 'sw')``), for rendering frames straight
+    into pre-allocated memory without a GPU.
+
+    By default, a buffer aligned to 64 bytes (as recommended by libmpv/render.h) is allocated. Alternatively, pass any
+    writable object supporting the buffer protocol such as a bytearray or a numpy array as buffer to render into that.
+    The buffer can be re-used for any number of frames. fmt is one of libmpv's software render formats ("rgb0", "bgr0",
+    "0bgr", "0rgb" or "rgb24"). stride defaults to the row size rounded up to 64 bytes, or if a buffer is given, to the
+    row stride of a multi-dimensional buffer such as a numpy array of shape (h, w, 4) or to the row size otherwise. The
+    stride does not need to be a multiple of the pixel size, so e.g. rgb24 rows can be padded to any alignment.
+
+    buf = mpv.SoftwareRenderBuffer(1280, 720)
+    ctx = mpv.MpvRenderContext(player, 'sw')
+    ctx.render_sw(buf)
+    frame = buf.as_array() # numpy array of shape (720, 1280, 4)
+    """
+
+    BYTES_PER_PIXEL = {'rgb0': 4, 'bgr0': 4, '0bgr': 4, '0rgb': 4, 'rgb24': 3}
+
+    def __init__(self, w, h, fmt='rgb0', stride=None, buffer=None):
+        if fmt not in self.BYTES_PER_PIXEL:
+            raise ValueError(f'Unsupported software render format "{fmt}"')
+        self.w, self.h, self.fmt = w, h, fmt
+        self.bytes_per_pixel = bpp = self.BYTES_PER_PIXEL[fmt]
+        if stride is None and buffer is not None:
+            # Use the row stride of e.g. a numpy array of shape (h, w, bpp), or tightly packed rows for a flat buffer.
+            with memoryview(buffer) as view:
+                stride = view.strides[0] if view.ndim > 1 else w*bpp
+        self.stride = stride or (w*bpp + 63) & ~63
+        if self.stride < w*bpp:
+            raise ValueError(f'Invalid stride {self.stride} for width {w} and format {fmt}')
+        self.nbytes = self.stride * h
+
+        if buffer is None:
+            self._raw = create_string_buffer(self.nbytes + 63)
+            self.buffer = (c_ubyte * self.nbytes).from_buffer(self._raw, -addressof(self._raw) % 64)
+        else:
+            self._raw = buffer
+            self.buffer = (c_ubyte * self.nbytes).from_buffer(buffer)
+        self.address = addressof(self.buffer)
+        self._param_array = None
+
+    @property
+    def size(self):
+        return self.w, self.h
+
+    def render_params(self):
+        """Return the software rendering parameters for this buffer for use with ``MpvRenderContext.render``."""
+        return {'sw_size': (self.w, self.h),
+                'sw_format': self.fmt,
+                'sw_stride': self.stride,
+                'sw_pointer': self.address}
+
+    def render_param_array(self):
+        """Return a cached MpvRenderParamArray with this buffer's render parameters, plus skip_rendering."""
+        if self._param_array is None:
+            self._param_array = MpvRenderParamArray(**self.render_params(), skip_rendering=False)
+        return self._param_array
+
+    def memoryview(self):
+        """Return a writable memoryview of shape (h, stride) on the buffer's bytes."""
+        return memoryview(self.buffer).cast('B', (self.h, self.stride))
+
+    def as_array(self):
+        """Return a numpy array view of shape (h, w, bytes_per_pixel) on the buffer, without copying. Requires numpy."""
+        import numpy as np
+        bpp = self.bytes_per_pixel
+        return np.ndarray((self.h, self.w, bpp), dtype=np.uint8, buffer=self.buffer, strides=(self.stride, bpp, 1))
+
+
 class MpvRenderContext:
     def __init__(self, mpv, api_type, **kwargs):
         self._mpv = mpv
@@ -2162,6 +4809,8 @@ class MpvRenderContext:
         buf = cast(create_string_buffer(sizeof(MpvRenderCtxHandle)), POINTER(MpvRenderCtxHandle))
         _mpv_render_context_create(buf, mpv.handle, kwargs_to_render_param_array(kwargs))
         self._handle = buf.contents
+        self._update_cb = None
+        self._frame_info_param = MpvRenderParam('next_frame_info')
 
     def free(self):
         _mpv_render_context_free(self._handle)
@@ -2172,9 +4821,12 @@ class MpvRenderContext:
 
         elif name == 'update_cb':
             func = value if value else (lambda: None)
+            wrapper = RenderUpdateFn(lambda _userdata: func())
+            # Only drop the old wrapper once libmpv has switched to the new one, since libmpv's threads may call the
+            # update callback at any time.
+            _mpv_render_context_set_update_callback(self._handle, wrapper, None)
             self._update_cb = value
-            self._update_fn_wrapper = RenderUpdateFn(lambda _userdata: func())
-            _mpv_render_context_set_update_callback(self._handle, self._update_fn_wrapper, None)
+            self._update_fn_wrapper = wrapper
 
         else:
             param = MpvRenderParam(name, value)
@@ -2187,20 +4839,663 @@ class MpvRenderContext:
         elif name == 'handle':
             return self._handle
 
+        elif name == 'next_frame_info':
+            return self.get_next_frame_info().as_dict()
+
         param = MpvRenderParam(name)
-        data_type = type(param.data.contents)
-        buf = cast(create_string_buffer(sizeof(data_type)), POINTER(data_type))
-        param.data = buf
         _mpv_render_context_get_info(self._handle, param)
-        return buf.contents.as_dict()
+        return param.value.as_dict()
+
+    def get_next_frame_info(self):
+        """Query next_frame_info without allocating. Returns an MpvRenderFrameInfo struct that is re-used and
+        overwritten by the next call to this method."""
+        _mpv_render_context_get_info(self._handle, self._frame_info_param)
+        return self._frame_info_param.value
 
     def update(self):
         """ Calls mpv_render_context_update and returns the MPV_RENDER_UPDATE_FRAME flag (see render.h) """
         return bool(_mpv_render_context_update(self._handle) & 1)
 
-    def render(self, **kwargs):
-        _mpv_render_context_render(self._handle, kwargs_to_render_param_array(kwargs))
+    def prepare_render(self, **kwargs):
+        """Build a re-usable render parameter array for ``render``. See MpvRenderParamArray."""
+        return MpvRenderParamArray(**kwargs)
+
+    def render(self, params=None, **kwargs):
+        """Render a frame. Render parameters are given either as keyword arguments or as an MpvRenderParamArray from
+        ``prepare_render``. Passing a prepared parameter array is cheaper when rendering at high frame rates."""
+        if params is None:
+            params = kwargs_to_render_param_array(kwargs)
+        elif kwargs:
+            raise ValueError('Render parameters must be given either as keyword arguments or as a prepared parameter array, not both.')
+        else:
+            params = params._array
+        _mpv_render_context_render(self._handle, params)
+
+    def render_sw(self, target, skip_rendering=False, **kwargs):
+        """Render the current frame into the given SoftwareRenderBuffer. This requires the render context to use the
+        software render API, i.e. to be created with api_type 'sw'. Extra keyword arguments are passed on as render
+        parameters. Without extra keyword arguments, the buffer's prepared parameter array is re-used."""
+        if kwargs:
+            self.render(**target.render_params(), skip_rendering=skip_rendering, **kwargs)
+        else:
+            params = target.render_param_array()
+            params['skip_rendering'] = skip_rendering
+            self.render(params)
 
     def report_swap(self):
         _mpv_render_context_report_swap(self._handle)
 
+    def frames(self, filename=None, size=None, fmt='rgb0', skip=1, buffers=3, timeout=10):
+        """Generator decoding video as fast as possible through the software render API, yielding a ``(pts, buffer)``
+        tuple for every decoded frame. buffer is a SoftwareRenderBuffer, use its as_array() method to get a numpy array.
+        This render context must have been created with api_type 'sw', ideally with ``advanced_control=True``.
+
+        If filename is given, it is loaded first. Otherwise, the file currently loaded by the player is used. The
+        generator returns when the file ends. While the generator runs, this context's update_cb is replaced and the
+        player's ``untimed`` option is set so playback is not paced to real time. Both are restored afterwards.
+
+        size is the output (width, height) and defaults to the video's display size. fmt is the software render format
+        (see SoftwareRenderBuffer). Only every skip'th frame is rendered and yielded. The remaining frames are skipped
+        without rendering. Frames are rendered into a ring of buffers buffers that is re-used, so a yielded buffer is
+        only valid until ``buffers-1`` more frames have been yielded. Instead of a number, buffers can also be a list of
+        SoftwareRenderBuffers to use as the ring, which are then used in order starting with the first one. In this
+        case, size and fmt are ignored. pts is the player's time-pos after rendering the frame.
+
+        ctx = mpv.MpvRenderContext(player, 'sw', advanced_control=True)
+        for pts, frame in ctx.frames('video.mkv', size=(640, 360), skip=5):
+            analyze(pts, frame.as_array())
+        """
+        mpv = self._mpv
+        frame_ready = threading.Event()
+        state = {'started': filename is None, 'done': False}
+
+        @mpv.event_callback('start-file', 'end-file', 'shutdown')
+        def file_handler(event):
+            if event.event_id.value == MpvEventID.START_FILE:
+                state['started'] = True
+            elif state['started']:
+                state['done'] = True
+            frame_ready.set()
+
+        old_update_cb, old_untimed = self._update_cb, mpv['untimed']
+        self.update_cb = frame_ready.set
+        mpv['untimed'] = True
+        try:
+            if filename is not None:
+                mpv.loadfile(filename)
+
+            ring, index = (None, 0) if isinstance(buffers, int) else (list(buffers), 0)
+            while True:
+                # Check for a frame first since the next one may already have been queued while we were rendering.
+                frame_ready.clear()
+                if not self.update():
+                    if state['done']:
+                        return
+                    if not frame_ready.wait(timeout):
+                        raise TimeoutError(f'No frame decoded within {timeout}s')
+                    continue
+
+                if ring is None:
+                    w, h = size or (mpv.dwidth, mpv.dheight)
+                    ring = [SoftwareRenderBuffer(w, h, fmt) for _ in range(buffers)]
+
+                flags = self.get_next_frame_info().flags
+                if not flags & MpvRenderFrameInfo.PRESENT or flags & (MpvRenderFrameInfo.REDRAW | MpvRenderFrameInfo.REPEAT):
+                    self.render_sw(ring[0], skip_rendering=True)
+                    continue
+
+                buf = ring[index // skip % len(ring)]
+                if index % skip:
+                    self.render_sw(buf, skip_rendering=True)
+                else:
+                    self.render_sw(buf)
+                    yield mpv.time_pos, buf
+                index += 1
+
+        finally:
+            file_handler.unregister_mpv_events()
+            self.update_cb = old_update_cb
+            if not mpv.core_shutdown:
+                mpv['untimed'] = old_untimed
+
+
+class RenderLoop:
+    """Helper running the usual render loop of a render context on a dedicated thread: wait for mpv's update
+    callback, check ``update()``, render and call ``report_swap()``. The thread sleeps until mpv signals that there
+    is something to render, it does not poll.
+
+    render is called as ``render(ctx)`` on the render thread for every frame and must render it, e.g. using
+    ``ctx.render(params)`` or ``ctx.render_sw(buf)``. Note that OpenGL contexts are usually bound to a thread, so for
+    the OpenGL API render has to make the context current first. If report_swap is False, ``report_swap()`` is not
+    called and is left to the caller.
+
+    If pace is True, the loop uses next_frame_info's target_time to present each frame at the time requested by mpv:
+    after render returns, the loop waits until target_time before calling ``report_swap()``. Frames for which render
+    returns after target_time are counted as missed deadlines. For this to work, the render context should be created
+    with ``advanced_control=True`` and render must pass ``block_for_target_time=False`` so mpv does not wait itself.
+
+    The loop keeps per-frame timing statistics. ``history`` is a deque of ``(render_time, wakeup_latency, lateness)``
+    tuples in seconds for the last history_len frames. wakeup_latency is the time between mpv's update callback and
+    the render thread waking up, lateness is how far past target_time render returned (0 if it was on time or if pace
+    is off). ``stats()`` returns aggregate numbers.
+
+    loop = mpv.RenderLoop(ctx, lambda ctx: ctx.render_sw(buf))
+    loop.start()
+    ...
+    loop.stop()
+
+    An exception raised by render stops the loop and is re-raised by ``stop()``.
+    """
+
+    def __init__(self, ctx, render, report_swap=True, pace=False, history_len=1000, name='MPVRenderThread'):
+        self.ctx = ctx
+        self._render = render
+        self._report_swap = report_swap
+        self._pace = pace
+        self._name = name
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._signalled = None
+        self._thread = None
+        self._old_update_cb = None
+        self.exception = None
+        self.history = collections.deque(maxlen=history_len)
+        self.frames = 0
+        self.missed_deadlines = 0
+        self.render_time_total = self.render_time_max = 0.0
+        self.wakeup_latency_total = self.wakeup_latency_max = 0.0
+
+    def _update_cb(self):
+        # Called from inside libmpv. Do not call into mpv from here.
+        self._signalled = time.perf_counter()
+        self._wakeup.set()
+
+    def start(self):
+        """Replace the render context's update_cb and start the render thread."""
+        if self._thread is not None:
+            raise RuntimeError('RenderLoop has already been started')
+        self._old_update_cb = self.ctx.update_cb
+        self._stopped.clear()
+        self.ctx.update_cb = self._update_cb
+        self._thread = threading.Thread(target=self._loop, name=self._name, daemon=True)
+        self._thread.start()
+        # Render whatever may already be pending from before we set our update_cb
+        self._update_cb()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the render thread, wait for it to exit and restore the previous update_cb. Re-raises any exception
+        raised by the render callable.
+
+        Raises TimeoutError if the render thread does not exit within timeout seconds, e.g. because render is blocked.
+        In that case, the update_cb is left in place and stop can be called again later."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise TimeoutError(f'Render thread did not exit within {timeout}s')
+        self._thread = None
+        self.ctx.update_cb = self._old_update_cb
+        if self.exception is not None:
+            exc, self.exception = self.exception, None
+            raise exc
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _loop(self):
+        ctx, get_time_us = self.ctx, self.ctx._mpv.get_time_us
+        while True:
+            self._wakeup.wait()
+            if self._stopped.is_set():
+                return
+            self._wakeup.clear()
+            wakeup_latency = time.perf_counter() - self._signalled
+
+            if not ctx.update():
+                continue
+
+            target_time = 0
+            if self._pace:
+                info = ctx.get_next_frame_info()
+                if info.flags & MpvRenderFrameInfo.PRESENT:
+                    target_time = info.target_time
+
+            start = time.perf_counter()
+            try:
+                self._render(ctx)
+            except Exception as e:
+                self.exception = e
+                return
+            render_time = time.perf_counter() - start
+
+            lateness = 0.0
+            if target_time > 0:
+                remaining = target_time - get_time_us()
+                if remaining > 0:
+                    if self._stopped.wait(remaining / 1e6):
+                        return
+                else:
+                    lateness = -remaining / 1e6
+                    self.missed_deadlines += 1
+
+            if self._report_swap:
+                ctx.report_swap()
+
+            self.frames += 1
+            self.render_time_total += render_time
+            self.render_time_max = max(self.render_time_max, render_time)
+            self.wakeup_latency_total += wakeup_latency
+            self.wakeup_latency_max = max(self.wakeup_latency_max, wakeup_latency)
+            self.history.append((render_time, wakeup_latency, lateness))
+
+    def stats(self):
+        """Return a dict with aggregate timing statistics in seconds."""
+        frames = self.frames
+        return {
+                'frames': frames,
+                'missed_deadlines': self.missed_deadlines,
+                'mean_render_time': self.render_time_total / frames if frames else None,
+                'max_render_time': self.render_time_max,
+                'mean_wakeup_latency': self.wakeup_latency_total / frames if frames else None,
+                'max_wakeup_latency': self.wakeup_latency_max,
+                }
+
+
+class SharedFrameHeader(Structure):
+    _fields_ = [('magic', c_char*8),
+                ('slots', c_uint32),
+                ('w', c_uint32),
+                ('h', c_uint32),
+                ('stride', c_uint32),
+                ('fmt', c_char*8),
+                ('slot_size', c_uint64),
+                ('data_offset', c_uint64),
+                ('seq', c_uint64),
+                ('closed', c_uint32)]
+
+    MAGIC = b'PYMPVSF1'
+
+class SharedFrameSlot(Structure):
+    _fields_ = [('seq', c_uint64),
+                ('pts', c_double)]
+
+def _shared_frame_layout(shm, header=None):
+    """Return ctypes views on the header and the slot headers of a shared frame ring, and the offset of each slot's
+    pixel data."""
+    header = header or SharedFrameHeader.from_buffer(shm.buf)
+    slots = (SharedFrameSlot * header.slots).from_buffer(shm.buf, sizeof(SharedFrameHeader))
+    offsets = [header.data_offset + i*header.slot_size for i in range(header.slots)]
+    return header, slots, offsets
+
+# Names of the shared frame segments created by SharedFramePublishers in this process. On python < 3.13, a
+# SharedFrameConsumer has to take its segment off the resource tracker, but must leave alone the registration of a
+# segment that this process created itself.
+_own_shared_frame_segments = set()
+
+class SharedFramePublisher:
+    """Publish frames rendered through the software render API into a ring of frame slots in a
+    ``multiprocessing.shared_memory`` segment. Any number of other processes can attach a SharedFrameConsumer to the
+    segment by its name and read the frames without copying.
+
+    Every published frame gets a sequence number starting at 1 and its pts. Frames are written to the slots in turn,
+    so a consumer has to be done with a frame before slots-2 more frames have been published (one slot is kept
+    invalid as the one currently being written). Consumers can check this using ``SharedFrame.valid``.
+
+    publisher = mpv.SharedFramePublisher(640, 360, slots=8)
+    ctx = mpv.MpvRenderContext(player, 'sw', advanced_control=True)
+    spawn_consumers(publisher.name)
+    publisher.run(ctx, 'video.mkv') # decode as fast as possible
+    publisher.close()
+
+    Instead of run, publish can be used to publish the current frame e.g. from a RenderLoop. The segment is unlinked
+    when the publisher is closed. Consumers that are still attached can keep reading the last frames.
+    """
+
+    def __init__(self, w, h, fmt='rgb0', slots=4, name=None, stride=None):
+        from multiprocessing import shared_memory
+        if slots < 2:
+            raise ValueError('A shared frame ring needs at least two slots')
+        if fmt not in SoftwareRenderBuffer.BYTES_PER_PIXEL:
+            raise ValueError(f'Unsupported software render format "{fmt}"')
+        bpp = SoftwareRenderBuffer.BYTES_PER_PIXEL[fmt]
+        stride = stride or (w*bpp + 63) & ~63
+        if stride < w*bpp:
+            raise ValueError(f'Invalid stride {stride} for width {w} and format {fmt}')
+        nbytes = stride * h
+        slot_size = (nbytes + 63) & ~63
+        data_offset = (sizeof(SharedFrameHeader) + slots*sizeof(SharedFrameSlot) + 63) & ~63
+
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=data_offset + slots*slot_size)
+        _own_shared_frame_segments.add(self._shm.name)
+        header = SharedFrameHeader.from_buffer(self._shm.buf)
+        header.slots, header.w, header.h, header.stride = slots, w, h, stride
+        header.fmt, header.slot_size, header.data_offset = fmt.encode(), slot_size, data_offset
+        header.magic = SharedFrameHeader.MAGIC
+        self._header, self._slots, offsets = _shared_frame_layout(self._shm, header)
+        self._buffers = [SoftwareRenderBuffer(w, h, fmt, stride, self._shm.buf[off:off+nbytes]) for off in offsets]
+        self._next = 0
+        self.seq = 0
+
+    @property
+    def name(self):
+        """Name of the shared memory segment to pass to SharedFrameConsumer."""
+        return self._shm.name
+
+    def _commit(self, pts):
+        self.seq += 1
+        slot = self._slots[self._next]
+        slot.pts = float('nan') if pts is None else pts
+        slot.seq = self.seq
+        self._header.seq = self.seq
+        # Invalidate the next slot before it is overwritten by the next frame
+        self._next = (self._next + 1) % len(self._slots)
+        self._slots[self._next].seq = 0
+
+    def publish(self, ctx, pts=None):
+        """Render the current frame of the given software render context into the next slot and publish it. pts
+        defaults to the player's time-pos."""
+        ctx.render_sw(self._buffers[self._next])
+        self._commit(ctx._mpv.time_pos if pts is None else pts)
+
+    def run(self, ctx, filename=None, skip=1, timeout=10):
+        """Decode as fast as possible using ``MpvRenderContext.frames`` and publish every skip'th frame. See
+        ``MpvRenderContext.frames`` for the meaning of the arguments. Returns the number of frames published."""
+        ring = self._buffers[self._next:] + self._buffers[:self._next]
+        count = 0
+        for pts, _buf in ctx.frames(filename, skip=skip, buffers=ring, timeout=timeout):
+            self._commit(pts)
+            count += 1
+        return count
+
+    def close(self):
+        """Mark the ring as closed, which ends consumer iteration, and release and unlink the shared memory segment."""
+        if self._shm is None:
+            return
+        self._header.closed = 1
+        del self._header, self._slots, self._buffers
+        self._shm.close()
+        self._shm.unlink()
+        _own_shared_frame_segments.discard(self._shm.name)
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class SharedFrame:
+    """A frame in a shared frame ring, returned by SharedFrameConsumer. ``data`` is a read-only memoryview of shape
+    (h, stride) on the frame's pixels inside the shared memory segment."""
+
+    def __init__(self, consumer, seq, pts, slot, data):
+        self.seq, self.pts = seq, pts
+        self.w, self.h, self.fmt = consumer.w, consumer.h, consumer.fmt
+        self.stride = consumer.stride
+        self.data = data
+        self._slot = slot
+
+    @property
+    def valid(self):
+        """False if the publisher has started to overwrite this frame's slot. Check this after processing a frame to
+        make sure it was not modified while being processed."""
+        return self._slot.seq == self.seq
+
+    def as_array(self):
+        """Return a read-only numpy array view of shape (h, w, bytes_per_pixel) on the frame. Requires numpy."""
+        import numpy as np
+        bpp = SoftwareRenderBuffer.BYTES_PER_PIXEL[self.fmt]
+        return np.ndarray((self.h, self.w, bpp), dtype=np.uint8, buffer=self.data, strides=(self.stride, bpp, 1))
+
+class SharedFrameConsumer:
+    """Attach to the shared frame ring of a SharedFramePublisher, possibly in another process, by its name.
+
+    with mpv.SharedFrameConsumer(name) as frames:
+        for frame in frames:
+            analyze(frame.pts, frame.as_array())
+
+    Iterating yields the latest frame each time a new one has been published, so a slow consumer skips frames
+    instead of falling behind. Iteration ends when the publisher is closed. There is no cross-process wakeup
+    mechanism, so waiting for a new frame polls the ring's sequence number every poll_interval seconds. All frames
+    must be released before the consumer is closed.
+    """
+
+    def __init__(self, name, poll_interval=0.001):
+        from multiprocessing import shared_memory
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError: # Python < 3.13
+            self._shm = shared_memory.SharedMemory(name=name)
+            if os.name != 'nt' and self._shm.name not in _own_shared_frame_segments:
+                from multiprocessing import resource_tracker
+                # Prevent the resource tracker from unlinking the publisher's segment when this process exits. If this
+                # process created the segment, attaching did not add a registration of its own, and removing the
+                # publisher's would break its unlink and its cleanup after a crash.
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+        self._header, self._slots, offsets = _shared_frame_layout(self._shm)
+        if self._header.magic != SharedFrameHeader.MAGIC:
+            self.close()
+            raise ValueError(f'Shared memory segment {name} does not contain a python-mpv shared frame ring')
+        header = self._header
+        self.w, self.h, self.stride, self.fmt = header.w, header.h, header.stride, header.fmt.decode()
+        nbytes = self.stride * self.h
+        self._views = [self._shm.buf[off:off+nbytes].toreadonly().cast('B', (self.h, self.stride)) for off in offsets]
+        self.poll_interval = poll_interval
+
+    @property
+    def closed(self):
+        """True once the publisher has been closed."""
+        return bool(self._header.closed)
+
+    @property
+    def seq(self):
+        """Sequence number of the latest published frame, 0 if none has been published yet."""
+        return self._header.seq
+
+    def latest(self):
+        """Return the latest published frame as a SharedFrame, or None if no frame has been published yet."""
+        while (seq := self._header.seq):
+            index = (seq-1) % len(self._slots)
+            slot = self._slots[index]
+            pts = slot.pts
+            if slot.seq == seq:
+                return SharedFrame(self, seq, None if pts != pts else pts, slot, self._views[index])
+            # The publisher has lapped us between reading the header and reading the slot. Try again.
+        return None
+
+    def wait(self, after=0, timeout=None):
+        """Wait for a frame with a sequence number greater than after and return the latest one. Returns None if the
+        publisher has been closed, and raises TimeoutError if timeout expires."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._header.seq <= after:
+            if self._header.closed:
+                return None
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f'No new frame published within {timeout}s')
+            time.sleep(self.poll_interval)
+        return self.latest()
+
+    def __iter__(self):
+        seq = 0
+        while (frame := self.wait(seq)) is not None:
+            seq = frame.seq
+            yield frame
+
+    def close(self):
+        if self._shm is None:
+            return
+        for view in getattr(self, '_views', []):
+            view.release()
+        self._header = self._slots = self._views = None
+        self._shm.close()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _ThumbnailWorker:
+    """Headless player with a software render context used by ThumbnailGenerator. Runs tasks from the generator's
+    queue on its own thread."""
+
+    def __init__(self, tasks, options, timeout):
+        self.m = MPV(**options)
+        self.ctx = MpvRenderContext(self.m, 'sw')
+        self.frame_ready = threading.Event()
+        self.ctx.update_cb = self.frame_ready.set
+        self.timeout = timeout
+        self.filename = None
+        self.thumbnails = 0
+        self._tasks = tasks
+        self._thread = threading.Thread(target=self._loop, name='MPVThumbnailThread', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while (task := self._tasks.get()) is not None:
+            fn, future = task
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(self))
+                except Exception as e:
+                    future.set_exception(e)
+        self._tasks.put(None) # Let the other workers know, too.
+
+    def _wait_frame(self):
+        while not self.ctx.update():
+            if not self.frame_ready.wait(self.timeout):
+                raise TimeoutError(f'No frame decoded within {self.timeout}s')
+            self.frame_ready.clear()
+
+    def load(self, filename):
+        if filename != self.filename:
+            self.filename = None
+            with self.m.prepare_and_wait_for_event('playback-restart', timeout=self.timeout):
+                self.m.loadfile(filename)
+            self.filename = filename
+        return self.m.duration
+
+    def render(self, filename, ts, buf):
+        self.load(filename)
+        self.ctx.update() # Drop any frame that is still pending from before
+        self.frame_ready.clear()
+        with self.m.prepare_and_wait_for_event('playback-restart', timeout=self.timeout):
+            self.m.seek(ts, 'absolute', 'keyframes')
+        self._wait_frame()
+        self.ctx.render_sw(buf)
+        self.thumbnails += 1
+        return self.m.time_pos
+
+    def terminate(self):
+        self._thread.join()
+        self.ctx.free()
+        self.m.terminate()
+
+class ThumbnailGenerator:
+    """Generate thumbnails and thumbnail sheets of video files using a pool of headless players that render through
+    the software render API, so no display or GPU is needed. Requires numpy.
+
+    Thumbnails are spread across the workers. Each worker loads the file once and then seeks to the requested
+    timestamps using fast keyframe seeks, so a thumbnail's actual position is the keyframe at or before the requested
+    timestamp. Frames are rendered directly at thumbnail size, and the decoder is set to skip the loop filter and use
+    fast, non-spec-compliant decoding.
+
+    with mpv.ThumbnailGenerator(workers=4, size=(160, 90)) as gen:
+        thumbs = gen.thumbnails('video.mkv', every=10) # [(pts, array), ...]
+        sheet = gen.sheet('video.mkv', every=10, columns=10)
+        print(gen.stats())
+
+    Extra keyword arguments are passed to the workers' MPV instances as options.
+    """
+
+    DEFAULT_OPTIONS = {'vo': 'libmpv', 'audio': False, 'sub': False, 'pause': True, 'keep_open': 'always',
+            'hr_seek': 'no', 'vd_lavc_skiploopfilter': 'all', 'vd_lavc_fast': True, 'sws_scaler': 'fast-bilinear',
+            'ytdl': False}
+
+    def __init__(self, workers=4, size=(160, 90), fmt='rgb0', timeout=10, **options):
+        self.size, self.fmt = size, fmt
+        self._tasks = queue.Queue()
+        options = {**self.DEFAULT_OPTIONS, **options}
+        self._workers = [_ThumbnailWorker(self._tasks, options, timeout) for _ in range(workers)]
+        self.seconds = 0.0
+
+    def _submit(self, fn):
+        future = Future()
+        self._tasks.put((fn, future))
+        return future
+
+    def duration(self, filename):
+        """Return the duration of the given file in seconds."""
+        return self._submit(lambda worker: worker.load(filename)).result()
+
+    def thumbnails(self, filename, timestamps=None, every=None):
+        """Generate a thumbnail for each of the given timestamps in seconds, or one every every seconds. Returns a list
+        of (pts, array) tuples, where pts is the actual position of the thumbnail and array is a numpy array of shape
+        (h, w, 4) (or (h, w, 3) for fmt 'rgb24')."""
+        if timestamps is None:
+            if every is None:
+                raise ValueError('Either timestamps or every must be given')
+            duration = self.duration(filename)
+            timestamps = [i*every for i in range(math.ceil(duration / every))]
+
+        start = time.perf_counter()
+        w, h = self.size
+        bufs = [SoftwareRenderBuffer(w, h, self.fmt) for _ in timestamps]
+        futures = [self._submit(partial(_ThumbnailWorker.render, filename=filename, ts=ts, buf=buf))
+                for ts, buf in zip(timestamps, bufs)]
+        try:
+            result = [(fut.result(), buf.as_array()) for fut, buf in zip(futures, bufs)]
+        finally:
+            for fut in futures:
+                fut.cancel()
+            self.seconds += time.perf_counter() - start
+        return result
+
+    def sheet(self, filename, timestamps=None, every=None, columns=10):
+        """Generate thumbnails like ``thumbnails`` and tile them into a single numpy array, row by row from the top
+        left, with the given number of columns."""
+        import numpy as np
+        thumbs = self.thumbnails(filename, timestamps, every)
+        w, h = self.size
+        rows = math.ceil(len(thumbs) / columns)
+        bpp = SoftwareRenderBuffer.BYTES_PER_PIXEL[self.fmt]
+        sheet = np.zeros((rows*h, columns*w, bpp), dtype=np.uint8)
+        for i, (_pts, thumb) in enumerate(thumbs):
+            row, col = divmod(i, columns)
+            sheet[row*h:(row+1)*h, col*w:(col+1)*w] = thumb
+        return sheet
+
+    def stats(self):
+        """Return a dict with the total number of thumbnails generated, per worker and in total, the time spent
+        generating them and the resulting throughput in thumbnails per second."""
+        per_worker = [worker.thumbnails for worker in self._workers]
+        total = sum(per_worker)
+        return {'thumbnails': total,
+                'per_worker': per_worker,
+                'seconds': self.seconds,
+                'thumbnails_per_second': total / self.seconds if self.seconds else None}
+
+    def close(self):
+        """Terminate all worker players."""
+        self._tasks.put(None)
+        for worker in self._workers:
+            worker.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
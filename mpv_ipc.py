@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+# vim: ts=4 sw=4 et
+#
+# Python MPV library module: mpv JSON IPC client
+# Copyright (C) 2017-2024 Sebastian Götte <code@jaseg.net>
+#
+# python-mpv inherits the underlying libmpv's license, which can be either GPLv2 or later (default) or LGPLv2.1 or
+# later. For details, see the mpv copyright page here: https://github.com/mpv-player/mpv/blob/master/Copyright
+#
+# You may copy, modify, and redistribute this file under the terms of the GNU General Public License version 2 (or, at
+# your option, any later version), or the GNU Lesser General Public License as published by the Free Software
+# Foundation; either version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License and the GNU
+# Lesser General Public License for more details.
+#
+# You can find copies of the GPLv2 and LGPLv2.1 licenses in the project repository's LICENSE.GPL and LICENSE.LGPL files.
+
+"""Client for mpv's JSON IPC interface. This module does not need libmpv, so it can be used to control a standalone
+mpv process from a python process that cannot or should not load libmpv. mpv.py re-exports its public names."""
+
+import collections
+import itertools
+import json
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+from functools import partial, wraps
+from warnings import warn
+
+
+class ShutdownError(SystemError):
+    pass
+
+class PropertyUnavailableError(AttributeError):
+    pass
+
+
+_py_to_mpv = lambda name: name.replace('_', '-')
+
+def _encode_options(options):
+    return ','.join('{}={}'.format(_py_to_mpv(str(key)), str(val)) for key, val in options.items())
+
+
+# mpv's error strings as returned by mpv_error_string and used in IPC replies, mapped to the same exceptions
+# mpv.ErrorCode raises for the corresponding error codes.
+IPC_ERRORS = {
+    'event queue full':                             (-1,  MemoryError,              'mpv event queue full'),
+    'memory allocation failed':                     (-2,  MemoryError,              'mpv cannot allocate memory'),
+    'core not uninitialized':                       (-3,  ValueError,               'Uninitialized mpv handle used'),
+    'invalid parameter':                            (-4,  ValueError,               'Invalid value for mpv parameter'),
+    'option not found':                             (-5,  AttributeError,           'mpv option does not exist'),
+    'unsupported format for accessing option':      (-6,  TypeError,                'Tried to set mpv option using wrong format'),
+    'error setting option':                         (-7,  ValueError,               'Invalid value for mpv option'),
+    'property not found':                           (-8,  AttributeError,           'mpv property does not exist'),
+    'unsupported format for accessing property':    (-9,  TypeError,                'Tried to get/set mpv property using wrong format, or passed invalid value'),
+    'property unavailable':                         (-10, PropertyUnavailableError, 'mpv property is not available'),
+    'error accessing property':                     (-11, RuntimeError,             'Generic error getting or setting mpv property'),
+    'error running command':                        (-12, SystemError,              'Error running mpv command'),
+    'loading failed':                               (-13, ValueError,               'loading failed'),
+    'audio output initialization failed':           (-14, RuntimeError,             'Initializing the audio output failed'),
+    'video output initialization failed':           (-15, RuntimeError,             'Initializing the video output failed'),
+    'no audio or video data played':                (-16, RuntimeError,             'There was no audio or video data to play. This also happens if the '
+                                                                                    'file was recognized, but did not contain any audio or video streams, or '
+                                                                                    'no streams were selected.'),
+    'unrecognized file format':                     (-17, RuntimeError,             'When trying to load the file, the file format could not be determined, '
+                                                                                    'or the file was too broken to open it'),
+    'not supported':                                (-18, ValueError,               'Generic error for signaling that certain system requirements are not fulfilled'),
+    'operation not implemented':                    (-19, NotImplementedError,      'The API function which was called is a stub only'),
+    'something happened':                           (-20, RuntimeError,             'Unspecified error'),
+}
+
+
+class RemoteMPVBase:
+    """Common base of proxies for mpv instances that live outside of this process (see MPVFarm and IPCMPV). It mirrors
+    the main parts of MPV's API: properties and options, ``command``, ``command_async``, property observers, event
+    callbacks, script message handlers and the ``wait_for_*`` family of methods.
+
+    Unlike with MPV, event callbacks receive events as dicts in the format of mpv's JSON IPC protocol, e.g.
+    ``{'event': 'end-file', 'reason': 'eof', ...}``. Blocking calls time out after timeout seconds.
+
+    Subclasses implement ``_request(op, *args)``, returning a Future, for the ops "command" (args, kwargs),
+    "get_property" (name), "set_property" (name, value), "observe_property" (name) and "unobserve_property" (name), and
+    pass incoming events to ``_handle_event``.
+    """
+
+    def __init__(self, timeout=None):
+        self._timeout = timeout
+        self._core_shutdown = False
+        # The reader thread iterates these without locking, so they are only ever replaced, never modified in place.
+        self._property_handlers = collections.defaultdict(tuple)
+        self._event_callbacks = ()
+        self._message_handlers = {}
+        self._callback_lock = threading.Lock()
+
+    def _request(self, op, *args):
+        raise NotImplementedError()
+
+    def _handle_event(self, event):
+        name = event.get('event')
+        if name == 'shutdown':
+            self._core_shutdown = True
+        for callback in self._event_callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                warn(f'Unhandled exception in event callback: {e}\n{traceback.format_exc()}', RuntimeWarning)
+        if name == 'property-change':
+            for handler in self._property_handlers.get(event['name'], ()):
+                try:
+                    handler(event['name'], event.get('data'))
+                except Exception as e:
+                    warn(f'Unhandled exception in property observer: {e}\n{traceback.format_exc()}', RuntimeWarning)
+        elif name == 'client-message':
+            target, *args = event['args']
+            if (handler := self._message_handlers.get(target)) is not None:
+                try:
+                    handler(*args)
+                except Exception as e:
+                    warn(f'Unhandled exception in message handler: {e}\n{traceback.format_exc()}', RuntimeWarning)
+
+    @property
+    def core_shutdown(self):
+        return self._core_shutdown
+
+    def check_core_alive(self):
+        if self._core_shutdown:
+            raise ShutdownError('libmpv core has been shutdown')
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self._request('get_property', _py_to_mpv(name)).result(self._timeout)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            super().__setattr__(name, value)
+        else:
+            self._request('set_property', _py_to_mpv(name), value).result(self._timeout)
+
+    def __getitem__(self, name):
+        """Get an option value."""
+        return self._request('get_property', 'options/'+name).result(self._timeout)
+
+    def __setitem__(self, name, value):
+        """Set an option value."""
+        self._request('set_property', 'options/'+name, value).result(self._timeout)
+
+    def command_async(self, name, *args, **kwargs):
+        """Run a command and return a Future evaluating to its result."""
+        if kwargs and args:
+            raise ValueError('Can only call mpv commands either using positional or using named arguments, not a mix of both.')
+        return self._request('command', (name, *args), kwargs)
+
+    def command(self, name, *args, **kwargs):
+        return self.command_async(name, *args, **kwargs).result(self._timeout)
+
+    def observe_property(self, name, handler):
+        """Register an observer on the named property, see ``MPV.observe_property``."""
+        with self._callback_lock:
+            first = not self._property_handlers.get(name)
+            self._property_handlers[name] += (handler,)
+        if first:
+            self._request('observe_property', name).result(self._timeout)
+
+    def property_observer(self, name):
+        def wrapper(fun):
+            self.observe_property(name, fun)
+            fun.unobserve_mpv_properties = lambda: self.unobserve_property(name, fun)
+            return fun
+        return wrapper
+
+    def unobserve_property(self, name, handler):
+        with self._callback_lock:
+            handlers = list(self._property_handlers.get(name, ()))
+            handlers.remove(handler)
+            if handlers:
+                self._property_handlers[name] = tuple(handlers)
+            else:
+                del self._property_handlers[name]
+            last = not handlers
+        if last and not self._core_shutdown:
+            self._request('unobserve_property', name).result(self._timeout)
+
+    def register_message_handler(self, target, handler):
+        """Register a script message handler, see ``MPV.register_message_handler``."""
+        with self._callback_lock:
+            self._message_handlers = {**self._message_handlers, target: handler}
+
+    def unregister_message_handler(self, target_or_handler):
+        with self._callback_lock:
+            if isinstance(target_or_handler, str):
+                if target_or_handler not in self._message_handlers:
+                    raise KeyError(target_or_handler)
+                self._message_handlers = {k: v for k, v in self._message_handlers.items() if k != target_or_handler}
+            else:
+                self._message_handlers = {k: v for k, v in self._message_handlers.items() if v != target_or_handler}
+
+    def message_handler(self, target):
+        def register(handler):
+            self.register_message_handler(target, handler)
+            handler.unregister_mpv_messages = lambda: self.unregister_message_handler(handler)
+            return handler
+        return register
+
+    def register_event_callback(self, callback):
+        with self._callback_lock:
+            self._event_callbacks += (callback,)
+
+    def unregister_event_callback(self, callback):
+        with self._callback_lock:
+            callbacks = list(self._event_callbacks)
+            callbacks.remove(callback)
+            self._event_callbacks = tuple(callbacks)
+
+    def event_callback(self, *event_types):
+        """Function decorator to register an event callback for the given event types, see ``MPV.event_callback``."""
+        def register(callback):
+            types = {t.replace('_', '-') for t in event_types}
+            @wraps(callback)
+            def wrapper(event, *args, **kwargs):
+                if not types or event.get('event') in types:
+                    callback(event, *args, **kwargs)
+            self.register_event_callback(wrapper)
+            wrapper.unregister_mpv_events = partial(self.unregister_event_callback, wrapper)
+            return wrapper
+        return register
+
+    def _shutdown_future(self, result):
+        def shutdown_handler(event):
+            if event.get('event') == 'shutdown':
+                try:
+                    result.set_exception(ShutdownError('libmpv core has been shutdown'))
+                except InvalidStateError:
+                    pass
+        self.register_event_callback(shutdown_handler)
+        return shutdown_handler
+
+    @contextmanager
+    def prepare_and_wait_for_event(self, *event_types, cond=lambda evt: True, timeout=None):
+        """Context manager that waits for the indicated event(s), see ``MPV.prepare_and_wait_for_event``."""
+        result = Future()
+        types = {t.replace('_', '-') for t in event_types if t is not None}
+        def target_handler(event):
+            if event.get('event') in types:
+                try:
+                    if (rv := cond(event)):
+                        result.set_result(rv)
+                except InvalidStateError:
+                    pass
+                except Exception as e:
+                    try:
+                        result.set_exception(e)
+                    except InvalidStateError:
+                        pass
+        self.register_event_callback(target_handler)
+        shutdown_handler = self._shutdown_future(result)
+        try:
+            yield result
+            self.check_core_alive()
+            result.result(timeout)
+        finally:
+            self.unregister_event_callback(target_handler)
+            self.unregister_event_callback(shutdown_handler)
+
+    def wait_for_event(self, *event_types, cond=lambda evt: True, timeout=None):
+        with self.prepare_and_wait_for_event(*event_types, cond=cond, timeout=timeout) as result:
+            pass
+        return result.result()
+
+    @contextmanager
+    def prepare_and_wait_for_property(self, name, cond=lambda val: val, level_sensitive=True, timeout=None):
+        """Context manager that waits until cond is true on the named property, see
+        ``MPV.prepare_and_wait_for_property``."""
+        result = Future()
+        def handler(_name, value):
+            try:
+                if (rv := cond(value)):
+                    result.set_result(rv)
+            except InvalidStateError:
+                pass
+            except Exception as e:
+                try:
+                    result.set_exception(e)
+                except InvalidStateError:
+                    pass
+        shutdown_handler = self._shutdown_future(result)
+        self.observe_property(name, handler)
+        try:
+            yield result
+            if level_sensitive:
+                handler(name, self._request('get_property', name).result(self._timeout))
+            self.check_core_alive()
+            result.result(timeout)
+        finally:
+            self.unregister_event_callback(shutdown_handler)
+            self.unobserve_property(name, handler)
+
+    def wait_for_property(self, name, cond=lambda val: val, level_sensitive=True, timeout=None):
+        with self.prepare_and_wait_for_property(name, cond, level_sensitive, timeout=timeout) as result:
+            pass
+        return result.result()
+
+    def wait_until_paused(self, timeout=None):
+        self.wait_for_property('core-idle', timeout=timeout)
+
+    def wait_until_playing(self, timeout=None):
+        self.wait_for_property('core-idle', lambda idle: not idle, timeout=timeout)
+
+    def wait_for_playback(self, timeout=None):
+        self.wait_for_event('end_file', timeout=timeout)
+
+    def wait_for_shutdown(self, timeout=None):
+        try:
+            self.wait_for_event(None, timeout=timeout)
+        except ShutdownError:
+            return
+
+    def loadfile(self, filename, mode='replace', index=None, **options):
+        """Mapped mpv loadfile command, see ``MPV.loadfile``."""
+        kwargs = {} if index is None else {'index': index}
+        self.command('loadfile', url=filename, flags=mode, options=_encode_options(options), **kwargs)
+
+    def play(self, filename):
+        self.loadfile(filename)
+
+    def seek(self, amount, reference="relative", precision="keyframes"):
+        self.command('seek', amount, reference, precision)
+
+    def stop(self, keep_playlist=False):
+        self.command('stop', 'keep-playlist' if keep_playlist else None)
+
+    def playlist_clear(self):
+        self.command('playlist-clear')
+
+    def quit(self, code=None):
+        self.command('quit', code)
+
+
+class IPCMPV(RemoteMPVBase):
+    """Drive a standalone mpv process through its JSON IPC interface (``--input-ipc-server``) using the same API as
+    MPV, see RemoteMPVBase. This keeps libmpv's decoders and video outputs out of the python process.
+
+    By default, this starts a new ``mpv --idle`` process listening on a socket in a temporary directory. Positional
+    arguments and keyword arguments are passed to it as command line flags and options, like MPV does with its
+    arguments::
+
+        player = mpv.IPCMPV('fullscreen', vo='gpu', mpv_binary='/usr/local/bin/mpv')
+
+    Pass ``ipc_socket`` to connect to an already running mpv instead. In that case, ``terminate`` only disconnects.
+
+    Requests are pipelined: every request carries a request ID, so any number of requests may be in flight at the same
+    time, and everything queued up while the socket is busy is sent in one write. Commands are run with mpv's
+    ``async`` flag so that a slow command does not hold up requests queued behind it. Property observers, event
+    callbacks and message handlers run on the IPC reader thread. Errors are mapped back to the same exceptions MPV
+    raises.
+    """
+
+    def __init__(self, *extra_mpv_flags, ipc_socket=None, mpv_binary='mpv', timeout=None, start_timeout=10,
+            **extra_mpv_opts):
+        super().__init__(timeout)
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._ids = itertools.count(1)
+        self._observe_ids = {}
+        self._out = queue.SimpleQueue()
+        self._process = self._tempdir = None
+
+        if ipc_socket is None:
+            self._tempdir = tempfile.mkdtemp(prefix='python-mpv-')
+            ipc_socket = os.path.join(self._tempdir, 'ipc.sock')
+            args = [mpv_binary, '--idle=yes', '--no-terminal', f'--input-ipc-server={ipc_socket}']
+            args += [f'--{_py_to_mpv(flag)}' for flag in extra_mpv_flags]
+            for k, v in extra_mpv_opts.items():
+                if isinstance(v, bool):
+                    v = 'yes' if v else 'no'
+                args.append(f'--{_py_to_mpv(k)}={v}')
+            self._process = subprocess.Popen(args, stdin=subprocess.DEVNULL)
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = time.monotonic() + start_timeout
+        while True:
+            try:
+                self._sock.connect(ipc_socket)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self._process is None or self._process.poll() is not None or time.monotonic() > deadline:
+                    self._sock.close()
+                    self._cleanup()
+                    raise ShutdownError(f'Could not connect to mpv IPC socket at {ipc_socket}')
+                time.sleep(0.01)
+
+        self._reader = threading.Thread(target=self._read, name='MPVIPCReader', daemon=True)
+        self._reader.start()
+        self._writer = threading.Thread(target=self._write, name='MPVIPCWriter', daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def _exception_for_error(error):
+        if (entry := IPC_ERRORS.get(error)) is None:
+            return RuntimeError(f'mpv IPC error: {error}')
+        ec, exception_type, message = entry
+        return exception_type(message, ec)
+
+    def _request(self, op, *args):
+        if self._core_shutdown:
+            raise ShutdownError('libmpv core has been shutdown')
+
+        if op == 'command':
+            (name, *cmd_args), kwargs = args
+            command = {'name': name, **kwargs} if kwargs else [name, *(arg for arg in cmd_args if arg is not None)]
+        elif op in ('get_property', 'set_property'):
+            command = [op, *args]
+        elif op == 'observe_property':
+            name, = args
+            oid = self._observe_ids[name] = next(self._ids)
+            command = [op, oid, name]
+        elif op == 'unobserve_property':
+            name, = args
+            command = [op, self._observe_ids.pop(name)]
+        else:
+            raise ValueError(f'Unknown op {op}')
+
+        fut = Future()
+        req_id = next(self._ids)
+        with self._lock:
+            self._futures[req_id] = (fut, op)
+        msg = {'command': command, 'request_id': req_id}
+        if op == 'command':
+            msg['async'] = True
+        self._out.put(json.dumps(msg).encode('utf-8') + b'\n')
+        return fut
+
+    def _write(self):
+        while (msg := self._out.get()) is not None:
+            batch = [msg]
+            try:
+                while (msg := self._out.get_nowait()) is not None:
+                    batch.append(msg)
+            except queue.Empty:
+                pass
+            try:
+                self._sock.sendall(b''.join(batch))
+            except OSError:
+                return
+            if msg is None:
+                return
+
+    def _read(self):
+        buf = b''
+        try:
+            while (data := self._sock.recv(1<<16)):
+                *lines, buf = (buf + data).split(b'\n')
+                for line in lines:
+                    if line:
+                        self._handle_message(json.loads(line))
+        except OSError:
+            pass
+        self._disconnected()
+
+    def _handle_message(self, msg):
+        if 'event' in msg:
+            return self._handle_event(msg)
+        if 'request_id' not in msg:
+            return
+        with self._lock:
+            fut, op = self._futures.pop(msg['request_id'], (None, None))
+        if fut is None:
+            return
+        error = msg.get('error', 'success')
+        if error == 'success':
+            fut.set_result(msg.get('data'))
+        else:
+            ex = self._exception_for_error(error)
+            if op == 'get_property' and isinstance(ex, PropertyUnavailableError):
+                fut.set_result(None)
+            else:
+                fut.set_exception(ex)
+
+    def _disconnected(self):
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        if not self._core_shutdown:
+            self._handle_event({'event': 'shutdown'})
+        for fut, _op in futures.values():
+            fut.set_exception(ShutdownError('libmpv core has been shutdown'))
+        self._out.put(None)
+
+    def _cleanup(self):
+        if self._process is not None:
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+            self._tempdir = None
+
+    @property
+    def process(self):
+        """The mpv subprocess.Popen object, or None if this instance connected to an existing socket."""
+        return self._process
+
+    def terminate(self):
+        """Quit mpv if this instance started it and close the IPC connection."""
+        if self._process is not None and not self._core_shutdown:
+            try:
+                self.quit()
+            except ShutdownError:
+                pass
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if self._reader is not threading.current_thread():
+            self._reader.join()
+        self._sock.close()
+        self._cleanup()
@@ -17,17 +17,28 @@
 #
 
 import unittest
+import asyncio
 from unittest import mock
 import threading
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 import os.path
 import os
+import sys
 import time
+import signal
+import selectors
+import tempfile
+import io
+import shutil
+import subprocess
+import tracemalloc
 from concurrent.futures import Future, InvalidStateError
+from ctypes import addressof
 
 os.environ["PATH"] = os.path.dirname(__file__) + os.pathsep + os.environ["PATH"]
 
 import mpv
+import mpv_ipc
 
 
 if os.name == 'nt':
@@ -688,6 +699,307 @@ class TestStreams(unittest.TestCase):
         m.terminate()
         disp.stop()
 
+    def test_cached_stream(self):
+        handler = mock.Mock()
+        cache = mpv.StreamBlockCache(block_size=16384)
+        bytes_read = 0
+
+        class CountingStream:
+            def __init__(self):
+                self.f = open(TESTVID, 'rb')
+                self.size = os.path.getsize(TESTVID)
+
+            def read(self, size):
+                nonlocal bytes_read
+                data = self.f.read(size)
+                bytes_read += len(data)
+                return data
+
+            def seek(self, offset):
+                return self.f.seek(offset)
+
+            def close(self):
+                self.f.close()
+
+        disp = Display()
+        disp.start()
+        m = mpv.MPV(vo=testvo)
+        def cb(evt):
+            handler(evt.as_dict(decoder=mpv.lazy_decoder))
+        m.register_event_callback(cb)
+
+        m.register_stream_protocol('cached', lambda uri: CountingStream(), cache=cache)
+
+        m.play('cached://foo')
+        m.wait_for_playback()
+        handler.assert_any_call({'event': 'end-file', 'reason': 'eof', 'playlist_entry_id': 1})
+        first_read = bytes_read
+        self.assertGreater(first_read, 0)
+        self.assertGreater(cache.stats()['misses'], 0)
+
+        m.play('cached://foo')
+        m.wait_for_playback()
+        handler.assert_any_call({'event': 'end-file', 'reason': 'eof', 'playlist_entry_id': 2})
+        self.assertEqual(bytes_read, first_read)
+        self.assertGreater(cache.stats()['hits'], 0)
+
+        m.terminate()
+        disp.stop()
+
+    def test_mmap_stream(self):
+        handler = mock.Mock()
+
+        disp = Display()
+        disp.start()
+        m = mpv.MPV(vo=testvo)
+        def cb(evt):
+            handler(evt.as_dict(decoder=mpv.lazy_decoder))
+        m.register_event_callback(cb)
+
+        with open(TESTVID, 'rb') as f:
+            data = f.read()
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'\0' * 12345 + data + b'\0' * 1000)
+
+            uri = m.register_mmap_stream('embedded', path, offset=12345, length=len(data))
+            m.play(uri)
+            m.wait_for_playback()
+            handler.assert_any_call({'event': 'end-file', 'reason': 'eof', 'playlist_entry_id': 1})
+            m.unregister_mmap_stream('embedded')
+
+            m.play(uri)
+            m.wait_for_playback()
+            handler.assert_any_call({'event': 'end-file', 'reason': 'error', 'playlist_entry_id': 2, 'file_error': 'loading failed'})
+
+        finally:
+            m.terminate()
+            disp.stop()
+            os.unlink(path)
+
+    def test_async_python_stream(self):
+        handler = mock.Mock()
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        loop_thread.start()
+
+        disp = Display()
+        disp.start()
+        m = mpv.MPV(vo=testvo)
+        def cb(evt):
+            handler(evt.as_dict(decoder=mpv.lazy_decoder))
+        m.register_event_callback(cb)
+
+        @m.python_stream('foo', loop=loop)
+        async def foo_gen():
+            with open(TESTVID, 'rb') as f:
+                while (chunk := f.read(16384)):
+                    await asyncio.sleep(0)
+                    yield chunk
+
+        m.play('python://foo')
+        m.wait_for_playback()
+        handler.assert_any_call({'event': 'end-file', 'reason': 'eof', 'playlist_entry_id': 1})
+
+        m.terminate()
+        disp.stop()
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+
+    def test_async_stream_read_timeout(self):
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        loop_thread.start()
+
+        disp = Display()
+        disp.start()
+        m = mpv.MPV(vo=testvo, video=False)
+
+        class SlowStream:
+            async def read(self, size):
+                await asyncio.sleep(10)
+                return b''
+
+        @m.register_stream_protocol('slow', loop=loop, read_timeout=0.2)
+        async def open_fn(uri):
+            return SlowStream()
+
+        try:
+            start = time.monotonic()
+            # The wait's own timeout is much longer and has a different message, so it cannot satisfy this assertion.
+            with self.assertRaisesRegex(TimeoutError, 'timed out after 0.2s'):
+                m.play('slow://foo')
+                m.wait_for_playback(timeout=30)
+            self.assertLess(time.monotonic() - start, 5)
+        finally:
+            m.terminate()
+            disp.stop()
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+
+    def test_async_stream_coroutine_timeout_error(self):
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        loop_thread.start()
+
+        class FailingStream:
+            async def read(self, size):
+                raise TimeoutError('upstream timeout')
+
+        try:
+            # A TimeoutError raised by the coroutine itself is passed on, not reported as read_timeout expiring
+            with self.assertRaisesRegex(TimeoutError, 'upstream timeout'):
+                mpv.AsyncStream(FailingStream(), loop, timeout=5).read(16)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+
+    def test_stream_open_timeout(self):
+        handler = mock.Mock()
+        closed = threading.Event()
+
+        class FileStream:
+            def __init__(self):
+                self.f = open(TESTVID, 'rb')
+
+            def read(self, size):
+                return self.f.read(size)
+
+            def close(self):
+                self.f.close()
+                closed.set()
+
+        disp = Display()
+        disp.start()
+        m = mpv.MPV(vo=testvo)
+        def cb(evt):
+            handler(evt.as_dict(decoder=mpv.lazy_decoder))
+        m.register_event_callback(cb)
+
+        @m.register_stream_protocol('slowopen', open_timeout=0.5)
+        def open_fn(uri):
+            if uri == 'slowopen://slow':
+                time.sleep(2)
+            return FileStream()
+
+        m.play('slowopen://slow')
+        m.wait_for_playback()
+        handler.assert_any_call({'event': 'end-file', 'reason': 'error', 'playlist_entry_id': 1, 'file_error': 'loading failed'})
+        self.assertTrue(closed.wait(5))
+
+        m.prefetch_stream('slowopen://fast').result()
+        m.play('slowopen://fast')
+        m.wait_for_playback()
+        handler.assert_any_call({'event': 'end-file', 'reason': 'eof', 'playlist_entry_id': 2})
+
+        stats = m.stream_open_stats('slowopen')
+        self.assertEqual(stats['opens'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['failures'], 1)
+        self.assertEqual(stats['prefetch_hits'], 1)
+
+        m.terminate()
+        disp.stop()
+
+    def test_stream_open_raises_timeout_error(self):
+        m = mpv.MPV(vo='null', ao='null')
+        try:
+            @m.register_stream_protocol('timeouterror')
+            def open_fn(uri):
+                raise TimeoutError('network timeout')
+
+            # The exception is passed on like any other open_fn exception, not treated as an open timeout
+            with self.assertRaisesRegex(TimeoutError, 'network timeout'):
+                with m.prepare_and_wait_for_event('end_file', timeout=5):
+                    m.play('timeouterror://foo')
+            stats = m.stream_open_stats('timeouterror')
+            self.assertEqual(stats['failures'], 1)
+            self.assertEqual(stats['timeouts'], 0)
+        finally:
+            m.terminate()
+
+    def test_stream_prefetch_cleanup(self):
+        m = mpv.MPV(vo='null', ao='null')
+        streams = {}
+
+        @m.register_stream_protocol('prefetchcleanup')
+        def open_fn(uri):
+            stream = streams[uri] = mock.Mock(spec=['read', 'close'])
+            return stream
+
+        try:
+            m.prefetch_stream('prefetchcleanup://expired', expire=0).result()
+            m.prefetch_stream('prefetchcleanup://pending').result()
+            streams['prefetchcleanup://expired'].close.assert_called_once()
+            streams['prefetchcleanup://pending'].close.assert_not_called()
+        finally:
+            m.terminate()
+        streams['prefetchcleanup://pending'].close.assert_called_once()
+
+    def test_stream_stats(self):
+        on_close = mock.Mock()
+
+        disp = Display()
+        disp.start()
+        m = mpv.MPV(vo=testvo)
+
+        @m.register_stream_protocol('counted', collect_stats=True, on_stream_close=on_close)
+        def open_fn(uri):
+            return open(TESTVID, 'rb')
+
+        m.play('counted://foo')
+        m.wait_for_playback()
+        m.terminate()
+        disp.stop()
+
+        stats = m.stream_stats('counted://foo')
+        self.assertEqual(stats['bytes_read'], os.path.getsize(TESTVID))
+        self.assertGreater(stats['calls']['read'], 0)
+        self.assertEqual(sum(stats['read_size_histogram'].values()), stats['calls']['read'])
+        self.assertEqual(stats['calls']['open'], stats['calls']['close'])
+        on_close.assert_called_with('counted://foo', mock.ANY)
+
+    def test_stream_block_cache_eviction(self):
+        cache = mpv.StreamBlockCache(block_size=4, max_bytes=8)
+        cache.put(b'a', 0, b'0123')
+        cache.put(b'a', 1, b'4567')
+        self.assertEqual(cache.get(b'a', 0), b'0123')
+        cache.put(b'b', 0, b'89ab')
+        self.assertIsNone(cache.get(b'a', 1))
+        self.assertEqual(cache.get(b'a', 0), b'0123')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+    def test_stream_block_cache_stats(self):
+        cache = mpv.StreamBlockCache(block_size=16, max_bytes=1024)
+        data = bytes(range(60))
+        for _ in range(2):
+            stream = mpv.CachedStream(io.BytesIO(data), b'foo', cache)
+            self.assertEqual(b''.join(iter(lambda: stream.read(4), b'')), data)
+        # One miss per block on the first pass and one hit per block on the second, regardless of the read size
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['hits'], 4)
+
+    def test_cached_stream_edge_cases(self):
+        cache = mpv.StreamBlockCache(block_size=16, max_bytes=1024)
+        stream = mpv.CachedStream(io.BytesIO(bytes(64)), b'foo', cache)
+        self.assertEqual(len(b''.join(iter(lambda: stream.read(16), b''))), 64)
+        # The empty read past the end of the stream is not cached
+        self.assertEqual(cache.stats()['blocks'], 4)
+
+        class FailingSeekStream:
+            def seek(self, offset):
+                return mpv.ErrorCode.GENERIC
+            def read(self, size):
+                raise AssertionError('read after a failed seek')
+
+        stream = mpv.CachedStream(FailingSeekStream(), b'bar', cache)
+        stream.seek(32)
+        with self.assertRaises(ValueError):
+            stream.read(16)
+
 
 class TestLifecycle(unittest.TestCase):
     def test_create_destroy(self):
@@ -875,6 +1187,59 @@ class TestLifecycle(unittest.TestCase):
             self.fail('"Test log entry not found in log handler calls: '+','.join(repr(call) for call in handler.mock_calls))
         self.disp.stop()
 
+    def test_process_events(self):
+        m = mpv.MPV(vo='null', ao='null', start_event_thread=False)
+        handler = mock.Mock()
+        m.register_event_callback(handler)
+        sel = selectors.DefaultSelector()
+        sel.register(m.wakeup_fd(), selectors.EVENT_READ)
+        ended = []
+        m.event_callback('end-file')(lambda event: ended.append(event))
+        m.play(TESTVID)
+        while not ended:
+            self.assertTrue(sel.select(timeout=5))
+            self.assertLessEqual(m.process_events(max_events=2), 2)
+        self.assertTrue(handler.called)
+        m.terminate()
+        self.assertTrue(m.core_shutdown)
+
+        threaded = mpv.MPV()
+        with self.assertRaises(RuntimeError):
+            threaded.process_events()
+        threaded.terminate()
+
+    def test_event_clients(self):
+        log_handler = mock.Mock()
+        m = mpv.MPV(vo='null', ao='null', log_handler=log_handler, loglevel='trace',
+                event_clients=('log', 'property', 'command'))
+        self.assertEqual(len({m._event_handle, *m._event_handles.values()}), 4)
+        event_threads = set()
+        m.register_event_callback(lambda event: event_threads.add(threading.current_thread().name))
+        handler_threads = set()
+        m.observe_property('volume', lambda _name, _val: handler_threads.add(threading.current_thread().name))
+        with m.prepare_and_wait_for_property('volume', lambda val: val == 42, level_sensitive=False, timeout=5):
+            m.volume = 42
+        self.assertEqual(m.command_async('expand-text', '${volume}').result(5), '42.000000')
+        m.play(TESTVID)
+        m.wait_for_playback(timeout=10)
+        m.terminate()
+        log_handler.assert_called()
+        self.assertEqual(handler_threads, {'MPVEventHandlerThread-property'})
+        # Broadcast events are only delivered on the main event handle
+        self.assertIn('MPVEventHandlerThread', event_threads)
+        self.assertFalse(any(t.is_alive() for t in m._event_client_threads))
+        # Invalid arguments must be rejected before an mpv core is created, which would be left running
+        reactor = mpv.MPVEventReactor()
+        try:
+            with mock.patch('mpv._mpv_create') as create:
+                with self.assertRaises(ValueError):
+                    mpv.MPV(event_clients=('foo',))
+                with self.assertRaises(ValueError):
+                    mpv.MPV(event_clients=('log',), event_reactor=reactor)
+                create.assert_not_called()
+        finally:
+            reactor.stop()
+
 
 class CommandTests(MpvTestCase):
 
@@ -990,3 +1355,812 @@ class RegressionTests(MpvTestCase):
         m.slang = 'ru'
         m.terminate() # needed for synchronization of event thread
         handler.assert_has_calls([mock.call('slang', ['jp']), mock.call('slang', ['ru'])])
+
+
+def hammer_player(player, iterations):
+    """Run a mix of command, observe and callback (un)registration calls on player."""
+    handler = lambda *args: None
+    for i in range(iterations):
+        player.observe_property('volume', handler)
+        player.register_event_callback(handler)
+        overlay_id = player.allocate_overlay_id()
+        player.command_async('expand-text', '${volume}').result()
+        player.free_overlay_id(overlay_id)
+        player.unregister_event_callback(handler)
+        player.unobserve_property('volume', handler)
+
+
+class ConcurrencyTests(unittest.TestCase):
+    def test_concurrent_registration(self):
+        m = mpv.MPV(vo='null', ao='null')
+        try:
+            threads = [threading.Thread(target=hammer_player, args=(m, 200)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertNotIn('volume', m._property_handlers)
+            self.assertEqual(m._event_callbacks, ())
+            self.assertEqual(m._command_reply_callbacks, {})
+            self.assertEqual(m.overlay_ids, set())
+        finally:
+            m.terminate()
+
+
+class OverlayTests(MpvTestCase):
+    def test_image_overlay_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy not installed')
+
+        self.m.play(TESTVID)
+        self.m.wait_until_playing(timeout=5)
+        img = np.zeros((64, 128, 4), dtype=np.uint8)
+        img[..., 0], img[..., 3] = 255, 128
+        overlay = self.m.create_image_overlay(img, pos=(10, 10))
+        addresses = []
+        for i in range(4):
+            img[..., 1] = i*50
+            overlay.update(img)
+            addresses.append(addressof(overlay._bufs[overlay._back ^ 1]))
+        self.assertNotEqual(addresses[0], addresses[1])
+        self.assertEqual(addresses[0], addresses[2])
+        front = bytes(overlay._bufs[overlay._back ^ 1])
+        self.assertEqual(front[:4], bytes([0, 75, 128, 128])) # premultiplied BGRA
+        overlay.remove()
+        self.assertNotIn(overlay.overlay_id, self.m.overlay_ids)
+
+    def test_osd_scene(self):
+        self.m.play(TESTVID)
+        self.m.wait_until_playing(timeout=5)
+        scene = self.m.create_osd_scene(max_rate=10)
+        title = scene.add(mpv.OsdText(text='{python-mpv}', pos=(20, 20)))
+        bar = scene.add(mpv.OsdProgressBar(rect=(20, 680, 1000, 10)))
+        self.assertIn('\\{python-mpv\\}', title.ass())
+
+        start = time.monotonic()
+        for i in range(101):
+            bar.value = i/100
+            time.sleep(0.005)
+        time.sleep(0.2)
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(scene.changes, 100)
+        self.assertLessEqual(scene.flushes, elapsed*10 + 2)
+        self.assertIn('l 1000 0 1000 10', scene.ass())
+
+        scene.flush().result(timeout=5)
+        self.assertEqual(scene.errors, 0)
+        scene.close()
+
+    def test_osd_scene_frame_rate(self):
+        m = mpv.MPV(vo='null', ao='null')
+        try:
+            scene = m.create_osd_scene()
+            with m.prepare_and_wait_for_property('container-fps', lambda fps: fps == 25, timeout=5):
+                m.play('av://lavfi:testsrc=duration=10:rate=25')
+            m.wait_until_playing(timeout=5)
+            time.sleep(0.1) # Let the event thread deliver the frame rate to the scene's observer as well
+            self.assertAlmostEqual(scene._interval(), 1/25, delta=0.001)
+            scene.add(mpv.OsdText(text='foo'))
+
+            m.quit()
+            m.wait_for_shutdown(timeout=5)
+            scene.close() # Must not fail on a core that has already shut down
+            self.assertFalse(m._osd_scenes)
+        finally:
+            m.terminate()
+
+    def test_overlay_id_allocation(self):
+        ids = [self.m.allocate_overlay_id() for _ in range(64)]
+        self.assertEqual(sorted(ids), list(range(64)))
+        with self.assertRaises(IndexError):
+            self.m.allocate_overlay_id()
+        self.m.free_overlay_id(17)
+        self.assertEqual(self.m.allocate_overlay_id(), 17)
+
+    def test_overlay_compositor(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy not installed')
+
+        self.m.play(TESTVID)
+        self.m.wait_until_playing(timeout=5)
+        comp = self.m.create_overlay_compositor((320, 240), tiles=(2, 2))
+        self.assertEqual(len(comp.overlay_ids), 4)
+
+        red = np.zeros((8, 8, 4), dtype=np.uint8)
+        red[..., 0] = red[..., 3] = 255
+        layers = [comp.add_layer(red, pos=(i*7 % 312, i*3 % 232)) for i in range(200)]
+        self.assertEqual(comp.flush(), 4)
+        self.assertEqual(comp.flush(), 0)
+
+        layers[0].update(pos=(2, 2))
+        self.assertEqual(comp.flush(), 1)
+
+        green = np.zeros((8, 8, 4), dtype=np.uint8)
+        green[..., 1], green[..., 3] = 255, 128
+        comp.add_layer(green, pos=(2, 2), z=1)
+        comp.flush()
+        self.assertEqual(list(comp._canvas[4, 4]), [0, 128, 127, 255]) # premultiplied BGRA
+
+        comp.remove()
+        self.assertFalse(self.m.overlay_ids)
+
+    def test_file_overlay(self):
+        self.m.play(TESTVID)
+        self.m.wait_until_playing(timeout=5)
+        with tempfile.NamedTemporaryFile(suffix='.bgra') as f:
+            f.write(b'\xff\x00\x00\xff' * 32*16)
+            f.flush()
+            overlay = self.m.create_file_overlay(f.name, size=(32, 16), pos=(10, 10))
+            overlay.update(pos=(20, 20))
+            overlay.remove()
+
+    def test_fd_overlay(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy not installed')
+
+        self.m.play(TESTVID)
+        self.m.wait_until_playing(timeout=5)
+        overlay = self.m.create_fd_overlay((64, 32), pos=(10, 10))
+        img = np.zeros((32, 64, 4), dtype=np.uint8)
+        img[..., 2], img[..., 3] = 255, 255
+        overlay.write(img)
+        self.assertEqual(os.pread(overlay.fd, 4, 0), b'\xff\x00\x00\xff') # BGRA
+        arr = overlay.as_array()
+        arr[:16] = 0
+        del arr
+        overlay.update(pos=(20, 20))
+        self.assertEqual(os.pread(overlay.fd, 4, 0), b'\x00\x00\x00\x00')
+        overlay.remove()
+        self.assertNotIn(overlay.overlay_id, self.m.overlay_ids)
+
+
+def consume_shared_frames(name, ready, results):
+    with mpv.SharedFrameConsumer(name) as consumer:
+        ready.set()
+        for frame in consumer:
+            results.put((frame.seq, frame.pts, any(frame.data.tobytes())))
+        frame = None # Release the last frame before the consumer is closed
+    results.put(None)
+
+
+class SoftwareRenderTests(unittest.TestCase):
+    def setUp(self):
+        self.m = mpv.MPV(vo='libmpv', audio=False, loglevel='debug', log_handler=timed_print())
+        self.ctx = mpv.MpvRenderContext(self.m, 'sw')
+        self.frame_ready = threading.Event()
+        self.ctx.update_cb = self.frame_ready.set
+
+    def tearDown(self):
+        self.ctx.free()
+        self.m.terminate()
+
+    def wait_for_frame(self, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self.frame_ready.wait(0.1)
+            self.frame_ready.clear()
+            if self.ctx.update():
+                return
+        self.fail('No frame rendered')
+
+    def test_render_sw(self):
+        buf = mpv.SoftwareRenderBuffer(320, 240, 'bgr0')
+        self.m.play(TESTVID)
+        self.wait_for_frame()
+        self.ctx.render_sw(buf)
+        self.assertEqual(buf.address % 64, 0)
+        self.assertTrue(any(buf.memoryview().tobytes()))
+
+    def test_render_sw_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy not installed')
+
+        array = np.zeros((240, 320, 4), dtype=np.uint8)
+        buf = mpv.SoftwareRenderBuffer(320, 240, 'rgb0', buffer=array)
+        self.m.play(TESTVID)
+        self.wait_for_frame()
+        self.ctx.render_sw(buf)
+        self.assertTrue(array[..., :3].any())
+        self.assertTrue(np.shares_memory(buf.as_array(), array))
+
+    def test_render_buffer_stride(self):
+        # Caller-provided buffers default to tightly packed rows, or to the row stride of multi-dimensional buffers
+        self.assertEqual(mpv.SoftwareRenderBuffer(100, 10, 'rgb0', buffer=bytearray(4000)).stride, 400)
+        rows = memoryview(bytearray(3000)).cast('B', (10, 300))
+        self.assertEqual(mpv.SoftwareRenderBuffer(100, 10, 'rgb24', buffer=rows).stride, 300)
+        self.assertEqual(mpv.SoftwareRenderBuffer(100, 10, 'rgb0').stride, 448)
+        # Strides need not be a multiple of the pixel size
+        self.assertEqual(mpv.SoftwareRenderBuffer(20, 4, 'rgb24', stride=64).stride, 64)
+        with self.assertRaises(ValueError):
+            mpv.SoftwareRenderBuffer(20, 4, 'rgb24', stride=59)
+
+        try:
+            import numpy as np
+        except ImportError:
+            return
+        array = np.zeros((10, 100, 4), dtype=np.uint8)
+        buf = mpv.SoftwareRenderBuffer(100, 10, 'rgb0', buffer=array)
+        self.assertEqual(buf.stride, 400)
+        self.assertTrue(np.shares_memory(buf.as_array(), array))
+
+    def test_frames(self):
+        pts = [ pts for pts, buf in self.ctx.frames('av://lavfi:testsrc=duration=2:size=160x120:rate=25', size=(80, 60)) ]
+        self.assertGreaterEqual(len(pts), 45)
+        self.assertEqual(pts, sorted(pts))
+
+        bufs = [ buf for pts, buf in self.ctx.frames('av://lavfi:testsrc=duration=2:size=160x120:rate=25', skip=5, buffers=2) ]
+        self.assertGreaterEqual(len(bufs), 9)
+        self.assertLessEqual(len(bufs), 10)
+        self.assertEqual(len(set(map(id, bufs))), 2)
+        self.assertEqual(bufs[0].size, (160, 120))
+
+    def test_prepared_render_params(self):
+        buf = mpv.SoftwareRenderBuffer(320, 240, 'bgr0')
+        self.m.play(TESTVID)
+        self.wait_for_frame()
+        def render_frames(n):
+            for _ in range(n):
+                self.ctx.render_sw(buf)
+                self.ctx.render_sw(buf, skip_rendering=True)
+                self.ctx.get_next_frame_info()
+        render_frames(10) # warm up buffer's parameter array cache
+
+        # Keep the event thread quiet so its allocations do not show up in the measurement
+        self.m.pause = True
+        self.m.set_loglevel('no')
+        # Memory kept per frame would show up as growth proportional to the number of frames, and copies of the frame
+        # or other large temporaries in the peak.
+        tracemalloc.start()
+        try:
+            render_frames(10)
+            before, _peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            render_frames(1000)
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(after - before, 1024)
+        self.assertLess(peak - before, 4096)
+
+        params = self.ctx.prepare_render(**buf.render_params())
+        params['sw_size'] = (160, 120)
+        self.assertEqual(params['sw_size'].w, 160)
+        self.ctx.render(params)
+        with self.assertRaises(ValueError):
+            self.ctx.render(params, skip_rendering=True)
+
+    def test_render_loop(self):
+        buf = mpv.SoftwareRenderBuffer(160, 120, 'bgr0')
+        params = self.ctx.prepare_render(**buf.render_params(), block_for_target_time=False)
+        threads = set()
+        def render(ctx):
+            threads.add(threading.current_thread())
+            ctx.render(params)
+
+        with mpv.RenderLoop(self.ctx, render, pace=True) as loop:
+            self.assertTrue(loop.running)
+            self.m.play('av://lavfi:testsrc=duration=1:size=160x120:rate=25')
+            self.m.wait_for_playback()
+
+        self.assertFalse(loop.running)
+        self.assertEqual(self.ctx.update_cb, self.frame_ready.set)
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.current_thread(), threads)
+        stats = loop.stats()
+        self.assertGreaterEqual(stats['frames'], 20)
+        self.assertLessEqual(stats['missed_deadlines'], stats['frames'])
+        self.assertEqual(len(loop.history), stats['frames'])
+        self.assertTrue(any(buf.memoryview().tobytes()))
+
+    def test_render_loop_exception(self):
+        def render(ctx):
+            raise ValueError('test')
+
+        loop = mpv.RenderLoop(self.ctx, render).start()
+        self.m.play(TESTVID)
+        self.m.wait_until_playing(timeout=5)
+        time.sleep(0.5)
+        with self.assertRaises(ValueError):
+            loop.stop()
+
+    def test_render_loop_stop_timeout(self):
+        rendering, unblock = threading.Event(), threading.Event()
+        def render(ctx):
+            rendering.set()
+            unblock.wait()
+
+        loop = mpv.RenderLoop(self.ctx, render).start()
+        self.m.play(TESTVID)
+        self.assertTrue(rendering.wait(5))
+        with self.assertRaises(TimeoutError):
+            loop.stop(timeout=0.2)
+        self.assertTrue(loop.running)
+        self.assertEqual(self.ctx.update_cb, loop._update_cb)
+
+        unblock.set()
+        loop.stop(timeout=5)
+        self.assertFalse(loop.running)
+        self.assertEqual(self.ctx.update_cb, self.frame_ready.set)
+
+    def test_shared_frames(self):
+        import multiprocessing
+        mp = multiprocessing.get_context('spawn')
+        ready, results = mp.Event(), mp.Queue()
+        with mpv.SharedFramePublisher(160, 120, 'bgr0', slots=8) as publisher:
+            proc = mp.Process(target=consume_shared_frames, args=(publisher.name, ready, results))
+            proc.start()
+            self.assertTrue(ready.wait(30))
+            num = publisher.run(self.ctx, 'av://lavfi:testsrc=duration=2:size=160x120:rate=25')
+            self.assertGreaterEqual(num, 45)
+            self.assertEqual(publisher.seq, num)
+
+        frames = list(iter(results.get, None))
+        proc.join(10)
+        self.assertEqual(proc.exitcode, 0)
+        self.assertGreater(len(frames), 0)
+        seqs = [seq for seq, _pts, _nonblack in frames]
+        self.assertEqual(seqs, sorted(set(seqs)))
+        self.assertLessEqual(seqs[-1], num)
+        self.assertTrue(all(nonblack for _seq, _pts, nonblack in frames))
+        self.assertTrue(all(pts is not None for _seq, pts, _nonblack in frames))
+
+    def test_shared_frames_same_process(self):
+        # A consumer in the publisher's own process must leave the publisher's resource tracker registration alone.
+        # Otherwise, the resource tracker complains about the unknown segment when the publisher unlinks it.
+        script = ('import mpv\n'
+                  'with mpv.SharedFramePublisher(16, 16) as publisher:\n'
+                  '    mpv.SharedFrameConsumer(publisher.name).close()\n')
+        proc = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                cwd=os.path.dirname(os.path.abspath(mpv.__file__)))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertNotIn('KeyError', proc.stderr)
+
+
+class EventReactorTests(unittest.TestCase):
+    def setUp(self):
+        self.reactor = mpv.MPVEventReactor(threads=2)
+
+    def tearDown(self):
+        self.reactor.stop()
+
+    def test_reactor(self):
+        threads_before = threading.active_count()
+        players = [mpv.MPV(vo='null', ao='null', event_reactor=self.reactor) for _ in range(20)]
+        self.assertEqual(threading.active_count(), threads_before)
+        self.assertEqual(self.reactor.players, 20)
+
+        handlers = [mock.Mock() for _ in players]
+        for player, handler in zip(players, handlers):
+            player.observe_property('pause', handler)
+        # Register all waits before starting playback, since the short clips of early players end while later ones are
+        # still being started.
+        with ExitStack() as stack:
+            for player in players:
+                stack.enter_context(player.prepare_and_wait_for_event('end_file', timeout=10))
+                player.play('av://lavfi:testsrc=duration=0.5:rate=25')
+        for player in players:
+            self.assertEqual(player.command_async('expand-text', '${pause}').result(timeout=5), 'no')
+
+        for player, handler in zip(players, handlers):
+            handler.assert_any_call('pause', False)
+            player.terminate()
+        self.assertEqual(self.reactor.players, 0)
+
+    def test_reactor_callback_thread(self):
+        player = mpv.MPV(vo='null', event_reactor=self.reactor)
+        threads = []
+        @player.event_callback('start-file')
+        def handler(event):
+            threads.append(threading.current_thread())
+
+        with player.prepare_and_wait_for_event('start-file', timeout=5):
+            player.play(TESTVID)
+        self.assertIn(threads[0], self.reactor._threads)
+        player.terminate()
+
+
+class PoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = mpv.MPVPool(size=2, max_size=3, vo='null', ao='null')
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_pool_reset(self):
+        handler = mock.Mock()
+        with self.pool.player() as player:
+            first = player
+            self.assertFalse(player.mute)
+            player.mute = True
+            player['loop-file'] = 'inf'
+            player.observe_property('volume', handler)
+            player.register_event_callback(handler)
+            player.register_message_handler('foo', handler)
+            player.play(TESTVID)
+            player.wait_until_playing(timeout=5)
+
+        # LIFO: the instance released last is handed out first
+        with self.pool.player() as player:
+            self.assertIs(player, first)
+            self.assertFalse(player.mute)
+            self.assertEqual(player['loop-file'], False)
+            self.assertEqual(player.playlist, [])
+            self.assertFalse(player._property_handlers['volume'])
+            self.assertFalse(player._event_callbacks)
+            self.assertFalse(player._message_handlers)
+
+        stats = self.pool.stats()
+        self.assertEqual(stats['acquired'], 2)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['reset_failures'], 0)
+
+    def test_pool_reset_paths(self):
+        streams = {}
+        with self.pool.player() as player:
+            first = player
+            player.command('set', 'loop-file', 'inf')
+            player.command('change-list', 'vf', 'add', 'hflip')
+            player.loadfile(TESTVID, sub_delay=5)
+            player.wait_until_playing(timeout=5)
+
+            overlay = player.create_fd_overlay((16, 16))
+            overlay.update()
+            scene = player.create_osd_scene(max_rate=10)
+            scene.add(mpv.OsdText(text='foo', pos=(10, 10)))
+
+            @player.register_stream_protocol('poolprefetch')
+            def open_fn(uri):
+                stream = streams[uri] = mock.Mock(spec=['read', 'close'])
+                return stream
+            player.prefetch_stream('poolprefetch://foo').result()
+
+        with self.pool.player() as player:
+            self.assertIs(player, first)
+            self.assertEqual(player['loop-file'], False)
+            self.assertEqual(player['vf'], [])
+            self.assertEqual(player['sub-delay'], 0)
+            self.assertTrue(overlay._map.closed)
+            self.assertFalse(player.overlays)
+            self.assertFalse(player.overlay_ids)
+            self.assertTrue(scene._closed)
+            self.assertFalse(scene._thread.is_alive())
+            self.assertFalse(player._osd_scenes)
+            streams['poolprefetch://foo'].close.assert_called_once()
+            self.assertFalse(player._stream_prefetches)
+
+        self.assertEqual(self.pool.stats()['reset_failures'], 0)
+
+    def test_pool_limits(self):
+        players = [self.pool.acquire(timeout=5) for _ in range(3)]
+        with self.assertRaises(TimeoutError):
+            self.pool.acquire(timeout=0.1)
+        players[0].quit()
+        players[0].wait_for_shutdown(timeout=5)
+        for player in players:
+            self.pool.release(player)
+        stats = self.pool.stats()
+        self.assertEqual(stats['dead'], 1)
+        self.assertEqual(stats['idle'], 2)
+
+    def test_pool_ttl(self):
+        pool = mpv.MPVPool(size=1, ttl=0.5, vo='null')
+        try:
+            player = pool.acquire(timeout=5)
+            time.sleep(1)
+            pool.release(player)
+            self.assertGreaterEqual(pool.stats()['expired'], 1)
+        finally:
+            pool.close()
+
+
+class FarmTests(unittest.TestCase):
+    def setUp(self):
+        self.farm = mpv.MPVFarm(workers=2, timeout=10, vo='null', ao='null')
+
+    def tearDown(self):
+        self.farm.close()
+
+    def test_farm_api(self):
+        players = [self.farm.create() for _ in range(4)]
+        self.assertEqual(self.farm.stats()['players'], [2, 2])
+        player = players[0]
+
+        player.mute = True
+        self.assertTrue(player.mute)
+        player['loop-file'] = 'inf'
+        self.assertEqual(player['loop-file'], 'inf')
+
+        handler = mock.Mock()
+        player.observe_property('volume', handler)
+        with player.prepare_and_wait_for_property('volume', lambda v: v == 42, level_sensitive=False, timeout=5):
+            player.volume = 42
+        handler.assert_called_with('volume', 42)
+        player.unobserve_property('volume', handler)
+
+        with self.assertRaises(ValueError):
+            player.command('this-command-does-not-exist')
+
+        player['loop-file'] = 'no'
+        player.play(TESTVID)
+        player.wait_until_playing(timeout=5)
+        player.seek(5, 'absolute', 'exact')
+        player.wait_for_playback(timeout=10)
+
+        for player in players:
+            player.terminate()
+        self.assertEqual(self.farm.stats()['players'], [0, 0])
+
+    def test_farm_worker_crash(self):
+        player, other = self.farm.create(), self.farm.create()
+        self.assertNotEqual(player.worker, other.worker)
+        stats = self.farm.stats()
+        os.kill(stats['pids'][player.worker], signal.SIGKILL)
+        player.wait_for_shutdown(timeout=5)
+        self.assertTrue(player.core_shutdown)
+        with self.assertRaises(mpv.ShutdownError):
+            player.volume
+
+        self.assertFalse(other.mute)
+        for _ in range(50):
+            if self.farm.stats()['restarts']:
+                break
+            time.sleep(0.1)
+        self.assertEqual(self.farm.stats()['restarts'], 1)
+        self.assertFalse(self.farm.create().mute)
+
+    def test_farm_error_result(self):
+        player = self.farm.create()
+        # libmpv errors carry the ctypes arguments of the failed call, which must not break sending the reply
+        with self.assertRaises(AttributeError):
+            player._request('get_property', 'this-property-does-not-exist').result(5)
+        self.assertFalse(hasattr(player, 'this_property_does_not_exist'))
+        with self.assertRaises(AttributeError):
+            player.this_property_does_not_exist = 1
+        self.assertFalse(player.mute)
+        self.assertEqual(self.farm.stats()['restarts'], 0)
+
+    def test_farm_close(self):
+        player = self.farm.create()
+        self.farm.close()
+        self.assertTrue(player.core_shutdown)
+        with self.assertRaises(mpv.ShutdownError):
+            player.command_async('stop')
+        with self.assertRaises(mpv.ShutdownError):
+            self.farm.create()
+
+
+class IPCImportTests(unittest.TestCase):
+    def test_import_without_libmpv(self):
+        # mpv_ipc must be importable without loading libmpv through ctypes
+        subprocess.run([sys.executable, '-c', 'import sys; sys.modules["ctypes"] = None; import mpv_ipc'],
+                cwd=os.path.dirname(os.path.abspath(mpv.__file__)), check=True)
+        self.assertIs(mpv.IPCMPV, mpv_ipc.IPCMPV)
+        self.assertIs(mpv.ShutdownError, mpv_ipc.ShutdownError)
+
+
+@unittest.skipUnless(shutil.which('mpv'), 'IPC tests need the mpv binary')
+class IPCTests(unittest.TestCase):
+    def setUp(self):
+        self.m = mpv.IPCMPV(vo='null', ao='null', loop_file='inf', timeout=10)
+
+    def tearDown(self):
+        self.m.terminate()
+
+    def test_ipc_api(self):
+        self.assertEqual(self.m['loop-file'], 'inf')
+        self.assertFalse(self.m.mute)
+        self.m.mute = True
+        self.assertTrue(self.m.mute)
+        self.assertIsNone(self.m.time_pos)
+        with self.assertRaises(AttributeError):
+            self.m.this_property_does_not_exist
+        with self.assertRaises(ValueError):
+            self.m.command('this-command-does-not-exist')
+
+        handler = mock.Mock()
+        self.m.observe_property('volume', handler)
+        with self.m.prepare_and_wait_for_property('volume', lambda v: v == 42, level_sensitive=False, timeout=5):
+            self.m.volume = 42
+        handler.assert_called_with('volume', 42)
+        self.m.unobserve_property('volume', handler)
+
+        msg_handler = mock.Mock()
+        self.m.register_message_handler('foo', msg_handler)
+        with self.m.prepare_and_wait_for_event('client_message', timeout=5):
+            self.m.command('script-message', 'foo', 'bar')
+        msg_handler.assert_called_once_with('bar')
+
+        self.m.play(TESTVID)
+        self.m.wait_until_playing(timeout=5)
+        futures = [self.m.command_async('expand-text', '${volume}') for _ in range(100)]
+        self.assertEqual([fut.result(5) for fut in futures], ['42.000000'] * 100)
+
+    def test_ipc_shutdown(self):
+        self.m.quit()
+        self.m.wait_for_shutdown(timeout=5)
+        self.assertEqual(self.m.process.wait(5), 0)
+        with self.assertRaises(mpv.ShutdownError):
+            self.m.volume
+
+
+class HotStandbyTests(unittest.TestCase):
+    def test_hot_standby(self):
+        with mpv.HotStandbyPlayer([TESTVID]*3, lookahead=1, auto_advance=False, vo='null', ao='null') as player:
+            player.play(0)
+            first = player.active
+            player.active.wait_until_playing(timeout=5)
+            standby = player._standby[1]
+            self.assertTrue(standby.ready.wait(5))
+            self.assertTrue(standby.player.pause)
+            self.assertTrue(standby.seekable)
+
+            self.assertTrue(player.next())
+            self.assertIs(player.active, standby.player)
+            self.assertFalse(player.active.pause)
+            # The previous instance is recycled to preload the following item
+            self.assertIs(player._standby[2].player, first)
+
+            player.auto_advance = True
+            player.active.wait_for_playback(timeout=10)
+            for _ in range(50):
+                if player.index == 2:
+                    break
+                time.sleep(0.1)
+            self.assertIs(player.active, first)
+            self.assertEqual(player.index, 2)
+            self.assertFalse(player.next())
+
+            stats = player.stats()
+            self.assertEqual(stats['switches'], 3)
+            self.assertEqual(stats['cold'], 1)
+            self.assertEqual(stats['players'], 2)
+
+
+class PlaybackClockTests(MpvTestCase):
+    def test_playback_clock(self):
+        with mpv.PlaybackClock(self.m) as clock:
+            self.assertIsNone(clock.now())
+            self.m.play('av://lavfi:testsrc=duration=30:rate=30')
+            self.m.wait_until_playing(timeout=5)
+            time.sleep(0.5)
+            self.assertAlmostEqual(clock.now(), self.m.time_pos, delta=0.1)
+            before = clock.now()
+            time.sleep(0.2)
+            self.assertGreater(clock.now(), before)
+
+            self.m.pause = True
+            self.m.wait_until_paused(timeout=5)
+            paused = clock.now()
+            time.sleep(0.2)
+            self.assertEqual(clock.now(), paused)
+
+            with self.m.prepare_and_wait_for_event('playback_restart', timeout=5):
+                self.m.seek(10, 'absolute', 'exact')
+            self.assertAlmostEqual(clock.now(), 10, delta=0.1)
+
+            stats = clock.stats()
+            self.assertEqual(stats['seeks'], 1)
+            self.assertIsNotNone(stats['seek_latency'])
+            self.assertGreater(stats['updates'], 0)
+            self.assertLess(stats['max_abs_error'], 0.1)
+
+
+class SyncGroupTests(unittest.TestCase):
+    def test_sync_group(self):
+        players = [mpv.MPV(vo='null', ao='null') for _ in range(3)]
+        try:
+            for player in players:
+                player.play('av://lavfi:testsrc=duration=30:rate=30')
+            for player in players:
+                player.wait_until_playing(timeout=5)
+            players[1].seek(0.1, 'relative', 'exact')
+            players[2].seek(2, 'relative', 'exact')
+
+            with mpv.SyncGroup(players, interval=0.05) as group:
+                time.sleep(3)
+                stats = group.stats()
+            self.assertEqual(stats[players[0]]['seeks'], 0)
+            self.assertEqual(stats[players[1]]['seeks'], 0)
+            self.assertGreaterEqual(stats[players[2]]['seeks'], 1)
+            for player in players[1:]:
+                self.assertLess(abs(stats[player]['offset']), 0.05)
+                self.assertGreater(stats[player]['max_abs_offset'], 0.05)
+                self.assertEqual(player.speed, players[0].speed)
+        finally:
+            for player in players:
+                player.terminate()
+
+
+class ThumbnailTests(unittest.TestCase):
+    TESTSRC = 'av://lavfi:testsrc=duration=20:size=320x240:rate=25'
+
+    def setUp(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy not installed')
+        self.gen = mpv.ThumbnailGenerator(workers=2, size=(80, 60))
+
+    def tearDown(self):
+        self.gen.close()
+
+    def test_thumbnails(self):
+        thumbs = self.gen.thumbnails(self.TESTSRC, every=4)
+        self.assertEqual(len(thumbs), 5)
+        for (pts, thumb), ts in zip(thumbs, [0, 4, 8, 12, 16]):
+            self.assertAlmostEqual(pts, ts, delta=0.1)
+            self.assertEqual(thumb.shape, (60, 80, 4))
+            self.assertTrue(thumb[..., :3].any())
+        # testsrc shows a running frame counter, so every thumbnail must differ
+        self.assertEqual(len({thumb.tobytes() for _pts, thumb in thumbs}), 5)
+
+        stats = self.gen.stats()
+        self.assertEqual(stats['thumbnails'], 5)
+        self.assertEqual(len(stats['per_worker']), 2)
+        self.assertGreater(stats['thumbnails_per_second'], 0)
+
+    def test_sheet(self):
+        sheet = self.gen.sheet(self.TESTSRC, timestamps=[1, 3, 5, 7, 9], columns=2)
+        self.assertEqual(sheet.shape, (3*60, 2*80, 4))
+        self.assertTrue(sheet[120:, :80].any())
+        self.assertFalse(sheet[120:, 80:].any())
+
+
+@unittest.skipUnless(os.environ.get('PY_MPV_BENCHMARK'), 'Set PY_MPV_BENCHMARK=1 to run benchmarks')
+class Benchmarks(unittest.TestCase):
+    def test_frames_throughput(self):
+        m = mpv.MPV(vo='libmpv', audio=False)
+        ctx = mpv.MpvRenderContext(m, 'sw', advanced_control=True)
+        try:
+            for w, h in [(320, 180), (640, 360), (1280, 720), (1920, 1080)]:
+                start = time.perf_counter()
+                num = sum(1 for _ in ctx.frames(f'av://lavfi:testsrc=duration=10:size={w}x{h}:rate=60'))
+                fps = num / (time.perf_counter() - start)
+                print(f'frames(): {w}x{h}: {num} frames at {fps:.1f} frames/s')
+        finally:
+            ctx.free()
+            m.terminate()
+
+    @unittest.skipUnless(shutil.which('mpv'), 'IPC benchmark needs the mpv binary')
+    def test_ipc_vs_ctypes(self):
+        n = 2000
+        for name, player in [('ctypes', mpv.MPV(vo='null', ao='null')), ('ipc', mpv.IPCMPV(vo='null', ao='null'))]:
+            try:
+                player.volume
+                start = time.perf_counter()
+                for _ in range(n):
+                    player.volume
+                latency = (time.perf_counter() - start) / n
+                start = time.perf_counter()
+                futures = [player.command_async('expand-text', '${volume}') for _ in range(n)]
+                for fut in futures:
+                    fut.result()
+                throughput = n / (time.perf_counter() - start)
+                print(f'{name}: property read {latency*1e6:.1f}us, pipelined commands {throughput:.0f}/s')
+            finally:
+                player.terminate()
+
+    def test_concurrency_scaling(self):
+        gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+        iterations = 2000
+        m = mpv.MPV(vo='null', ao='null')
+        try:
+            for num_threads in (1, 2, 4, 8):
+                threads = [threading.Thread(target=hammer_player, args=(m, iterations)) for _ in range(num_threads)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                rate = num_threads * iterations / (time.perf_counter() - start)
+                print(f'{num_threads} threads (GIL {"enabled" if gil else "disabled"}): {rate:.0f} iterations/s')
+        finally:
+            m.terminate()